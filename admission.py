@@ -0,0 +1,156 @@
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionDenied(Exception):
+    """
+    A job was refused before it started.
+
+    status is the HTTP status to answer with: 429 when the client is over
+    its own quota, 503 when disk space is held by other running jobs (try
+    again shortly) and 507 when the output would not fit at all.
+    """
+
+    def __init__(self, message: str, status: int, retry_after: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def headers(self):
+        return {'Retry-After': str(self.retry_after)} if self.retry_after else {}
+
+
+class AdmissionController:
+    """
+    Decides whether a job may start, based on free disk space and
+    per-client quotas.
+
+    Every admitted job holds a lease recording the bytes it is expected to
+    write. Leases and per-client usage live in a SQLite database, so all
+    worker processes see the same reservations. A lease is released when
+    its job ends; leases of crashed jobs expire after lease_ttl seconds.
+    Limits of 0 are disabled.
+    """
+
+    def __init__(self, path: str, root: str, min_free_bytes: int = 0, max_jobs_per_client: int = 0,
+                 max_bytes_per_client: int = 0, window: int = 3600, lease_ttl: int = 7200, retry_after: int = 30):
+        self.path = path
+        self.root = root
+        self.min_free_bytes = min_free_bytes
+        self.max_jobs_per_client = max_jobs_per_client
+        self.max_bytes_per_client = max_bytes_per_client
+        self.window = window
+        self.lease_ttl = lease_ttl
+        self.retry_after = retry_after
+        self._local = threading.local()
+        os.makedirs(root, exist_ok=True)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS leases ('
+            ' id TEXT PRIMARY KEY,'
+            ' client TEXT NOT NULL,'
+            ' bytes INTEGER NOT NULL,'
+            ' expires_at REAL NOT NULL)'
+        )
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS usage ('
+            ' client TEXT NOT NULL,'
+            ' bytes INTEGER NOT NULL,'
+            ' created_at REAL NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS usage_client ON usage (client, created_at)')
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def admit(self, client: str, projected_bytes: int, on_disk: bool = True) -> str:
+        """
+        Reserve projected_bytes of disk for a new job by client and return
+        the lease id, or raise AdmissionDenied. Jobs that stream without
+        touching the disk pass on_disk=False: they count against the
+        client's quotas but reserve no space.
+        """
+        projected_bytes = max(0, int(projected_bytes))
+        disk_bytes = projected_bytes if on_disk else 0
+        free = shutil.disk_usage(self.root).free
+        conn = self._connect()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM leases WHERE expires_at <= ?', (now,))
+            conn.execute('DELETE FROM usage WHERE created_at <= ?', (now - self.window,))
+
+            if self.max_jobs_per_client:
+                active = conn.execute('SELECT COUNT(*) FROM leases WHERE client = ?', (client,)).fetchone()[0]
+                if active >= self.max_jobs_per_client:
+                    raise AdmissionDenied(
+                        f"You already have {active} conversions running. Please wait for one to finish.",
+                        429, self.retry_after
+                    )
+
+            if self.max_bytes_per_client:
+                used, oldest = conn.execute(
+                    'SELECT COALESCE(SUM(bytes), 0), MIN(created_at) FROM usage WHERE client = ?', (client,)
+                ).fetchone()
+                if used + projected_bytes > self.max_bytes_per_client:
+                    retry_after = int(oldest + self.window - now) + 1 if oldest else self.window
+                    raise AdmissionDenied(
+                        "You have reached the conversion limit for now. Please try again later.",
+                        429, max(1, retry_after)
+                    )
+
+            if disk_bytes:
+                # Conservative: bytes running jobs have already written count
+                # both in free space and in their reservation
+                reserved = conn.execute('SELECT COALESCE(SUM(bytes), 0) FROM leases').fetchone()[0]
+                if free - disk_bytes < self.min_free_bytes:
+                    raise AdmissionDenied("The server is out of storage space. Please try again later.", 507)
+                if free - reserved - disk_bytes < self.min_free_bytes:
+                    # Fits once running jobs finish and their space is accounted for
+                    raise AdmissionDenied(
+                        "The server is busy right now. Please try again in a moment.", 503, self.retry_after
+                    )
+
+            lease_id = uuid.uuid4().hex
+            conn.execute('INSERT INTO leases (id, client, bytes, expires_at) VALUES (?, ?, ?, ?)',
+                         (lease_id, client, disk_bytes, now + self.lease_ttl))
+            conn.execute('INSERT INTO usage (client, bytes, created_at) VALUES (?, ?, ?)',
+                         (client, projected_bytes, now))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        logger.debug(f"Admitted job for {client}: lease {lease_id}, {projected_bytes} bytes projected")
+        return lease_id
+
+    def release(self, lease_id: str):
+        """End a lease; its bytes stay counted against the client's window"""
+        self._connect().execute('DELETE FROM leases WHERE id = ?', (lease_id,))
+
+    @contextmanager
+    def lease(self, client: str, projected_bytes: int, on_disk: bool = True) -> Iterator[str]:
+        """admit() for the duration of a with block"""
+        lease_id = self.admit(client, projected_bytes, on_disk)
+        try:
+            yield lease_id
+        finally:
+            self.release(lease_id)
@@ -1,24 +1,104 @@
 from flask import Flask, render_template, request, redirect, url_for, send_file, send_from_directory, \
-    after_this_request, flash
-from convertors.tiktok_mp3 import convert_tiktok_to_mp3
-from convertors.youtube_mp3 import convert_youtube_to_mp3
+    after_this_request, flash, Response, stream_with_context
+from convertors.tiktok_mp3 import resolve_tiktok_music, forget_tiktok_music, stream_tiktok_mp3, tiktok_filename
+from convertors.youtube_mp3 import convert_youtube_to_mp3, AUDIO_FORMATS
 from convertors.youtube_mp4 import convert_youtube_to_mp4
-from convertors.mp3_to_wav import convert_to_wav
-from convertors.webp_to_png import convert_webp_to_png
+from convertors.mp3_to_wav import convert_batch_to_wav
+from convertors.audio import CONTAINERS, SAMPLE_RATES, STREAMABLE_EXTENSIONS, stream_transcode, \
+    target_from_options, transcode_audio
+from convertors.webp_to_png import convert_webp_to_png, convert_webp_stream_to_png, convert_webp_bytes_to_png, \
+    PNG_PRESETS
+from convertors.zip_stream import stream_zip, unique_name
+from convertors.ytdl import get_video_info, parse_video_id, summarize_info
+from convertors.instrumentation import observe_phase, record_bytes, set_recorder
+from convertors.registry import CONVERTERS, accepts, preload
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+import multiprocessing
+from jobs import JobScheduler, SchedulerBusy
+from admission import AdmissionController, AdmissionDenied
+from metrics import MetricsRegistry
+from status_store import create_status_store
+from result_cache import ResultCache, cache_key
+from expiry import ExpiryScheduler, sweep_directory
+from log_queue import configure_logging
 import os
 import re
 import logging
-import shutil
+import hashlib
+import math
+import io
+import json
+import tempfile
+import threading
 import time
+import uuid
+from urllib.parse import quote
 from werkzeug.utils import secure_filename
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 1024 * 1024 * 1024  # 1GB max upload
 app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0  # Don't cache files
+app.config['CONVERSION_WORKERS'] = int(os.environ.get('CONVERSION_WORKERS', 2))  # Concurrent conversions per process
+app.config['CONVERSION_QUEUE_SIZE'] = int(os.environ.get('CONVERSION_QUEUE_SIZE', 16))  # Pending jobs before 503
+app.config['CONVERSION_RETRY_AFTER'] = int(os.environ.get('CONVERSION_RETRY_AFTER', 30))  # Seconds, sent as Retry-After
+app.config['STATUS_STORE'] = os.environ.get('STATUS_STORE')  # 'memory' or 'sqlite:///path.db' (default: temp dir)
+app.config['STATUS_TTL'] = int(os.environ.get('STATUS_TTL', 3600))  # Seconds a status entry lives after its last update
+app.config['SSE_MIN_INTERVAL'] = float(os.environ.get('SSE_MIN_INTERVAL', 0.5))  # Max one progress event per interval
+app.config['SSE_HEARTBEAT'] = int(os.environ.get('SSE_HEARTBEAT', 15))  # Seconds between keep-alive comments
+app.config['SSE_MAX_DURATION'] = int(os.environ.get('SSE_MAX_DURATION', 270))  # Close stream before gunicorn timeout; client reconnects
+# Per process: requests that hold a worker thread while waiting for progress. Keep it below gunicorn's
+# --threads so downloads and status polls always find a free thread. Further event streams get a 503
+# and long-polls answer without waiting.
+app.config['MAX_HELD_REQUESTS'] = int(os.environ.get('MAX_HELD_REQUESTS', 8))
+app.config['STATUS_BATCH_MAX'] = int(os.environ.get('STATUS_BATCH_MAX', 100))  # Job IDs per batched status request
+app.config['STATUS_MAX_WAIT'] = int(os.environ.get('STATUS_MAX_WAIT', 25))  # Longest long-poll in seconds, below the worker timeout
+app.config['RESULT_CACHE_MAX_BYTES'] = int(os.environ.get('RESULT_CACHE_MAX_BYTES', 5 * 1024 ** 3))  # Disk budget for cached outputs
+app.config['RESULT_CACHE_POLICY'] = os.environ.get('RESULT_CACHE_POLICY', 'lru')  # 'lru' or 'lfu'
+app.config['RESULT_CACHE_INDEX'] = os.environ.get(
+    'RESULT_CACHE_INDEX', os.path.join(app.instance_path, 'result-cache.db'))  # Kept outside static/
+app.config['RESULT_CACHE_MAX_IDLE'] = int(os.environ.get('RESULT_CACHE_MAX_IDLE', 7 * 24 * 3600))  # Drop unused cache entries
+app.config['DOWNLOAD_TTL'] = int(os.environ.get('DOWNLOAD_TTL', 1800))  # Uncached outputs live this long after last access
+app.config['UPLOAD_TTL'] = int(os.environ.get('UPLOAD_TTL', 600))  # Safety net for uploads left behind by failed conversions
+app.config['REAPER_INTERVAL'] = int(os.environ.get('REAPER_INTERVAL', 300))  # Seconds between status/cache sweeps
+app.config['STARTUP_SWEEP_LIMIT'] = int(os.environ.get('STARTUP_SWEEP_LIMIT', 1000))  # Max files examined per directory at startup
+app.config['WAV_STREAMING'] = os.environ.get('WAV_STREAMING', '1') == '1'  # Pipe MP3 uploads through ffmpeg without disk copies
+app.config['PNG_PRESET'] = os.environ.get('PNG_PRESET', 'balanced')  # Default PNG encoder preset: fast, balanced or small
+app.config['WEBP_INMEMORY_MAX_BYTES'] = int(os.environ.get('WEBP_INMEMORY_MAX_BYTES', 32 * 1024 * 1024))  # Larger uploads use disk
+app.config['IMAGE_POOL_WORKERS'] = int(os.environ.get('IMAGE_POOL_WORKERS', os.cpu_count() or 1))  # Processes for batch images
+app.config['WAV_BATCH_WORKERS'] = int(os.environ.get('WAV_BATCH_WORKERS', os.cpu_count() or 1))  # Concurrent ffmpeg processes
+app.config['MAX_VIDEO_DURATION'] = int(os.environ.get('MAX_VIDEO_DURATION', 0))  # Seconds; longer videos are refused (0 = no limit)
+# Let a fronting proxy send output files: '' (serve from Python), 'x-accel' (nginx) or 'x-sendfile' (Apache/lighttpd).
+# For nginx, map SENDFILE_PREFIX to the static folder:  location /_protected/ { internal; alias /app/static/; }
+app.config['SENDFILE_MODE'] = os.environ.get('SENDFILE_MODE', '')
+app.config['SENDFILE_PREFIX'] = os.environ.get('SENDFILE_PREFIX', '/_protected/')
+app.config['ADMISSION_DB'] = os.environ.get(
+    'ADMISSION_DB', os.path.join(app.instance_path, 'admission.db'))  # Disk leases and client usage, shared by workers
+app.config['MIN_FREE_BYTES'] = int(os.environ.get('MIN_FREE_BYTES', 2 * 1024 ** 3))  # Refuse jobs that would leave less free
+app.config['CLIENT_MAX_JOBS'] = int(os.environ.get('CLIENT_MAX_JOBS', 4))  # Concurrent jobs per client (0 = no limit)
+app.config['CLIENT_MAX_BYTES'] = int(os.environ.get('CLIENT_MAX_BYTES', 20 * 1024 ** 3))  # Projected bytes per client per window
+app.config['CLIENT_QUOTA_WINDOW'] = int(os.environ.get('CLIENT_QUOTA_WINDOW', 3600))  # Seconds
+app.config['TRUST_FORWARDED_FOR'] = os.environ.get('TRUST_FORWARDED_FOR', '0') == '1'  # Identify clients by X-Forwarded-For
+app.config['METRICS_DB'] = os.environ.get(
+    'METRICS_DB', os.path.join(app.instance_path, 'metrics.db'))  # Counters summed over all worker processes
+app.config['METRICS_FLUSH_INTERVAL'] = int(os.environ.get('METRICS_FLUSH_INTERVAL', 5))  # Seconds between metric writes
+# Set with gunicorn's preload_app (see gunicorn.conf.py): import converter dependencies in the
+# master and leave starting threads to each worker after fork
+app.config['PRELOAD_APP'] = os.environ.get('PRELOAD_APP', '0') == '1'
+app.config['LOG_LEVEL'] = os.environ.get('LOG_LEVEL', 'INFO')  # DEBUG adds sampled converter progress
+app.config['LOG_QUEUE_SIZE'] = int(os.environ.get('LOG_QUEUE_SIZE', 10000))  # Records waiting to be written before drops
+
+# Log records are written by a background thread; converter threads never wait on log I/O
+log_handler = configure_logging(app.config['LOG_LEVEL'], max_queue=app.config['LOG_QUEUE_SIZE'],
+                                autostart=not app.config['PRELOAD_APP'])
+
+# Bounded pool for background conversions
+scheduler = JobScheduler(
+    workers=app.config['CONVERSION_WORKERS'],
+    max_queue=app.config['CONVERSION_QUEUE_SIZE'],
+    retry_after=app.config['CONVERSION_RETRY_AFTER']
+)
 
 @app.route('/')
 def home():
@@ -35,128 +115,441 @@ def sanitize_filename(filename):
     # Return sanitized name with original extension
     return f"{safe_name}{ext}"
 
-import threading
+# Track conversion status in a store shared by all worker processes
+conversion_status = create_status_store(app.config['STATUS_STORE'], ttl=app.config['STATUS_TTL'])
+
+# Finished YouTube conversions, reused across requests and restarts
+result_cache = ResultCache(
+    root=os.path.join(app.static_folder, 'downloads'),
+    index_path=app.config['RESULT_CACHE_INDEX'],
+    max_bytes=app.config['RESULT_CACHE_MAX_BYTES'],
+    policy=app.config['RESULT_CACHE_POLICY']
+)
 
-# Track conversion status using a dictionary
-conversion_status = {}
+# Open event streams and long-polls in this process, capped so they can't occupy every worker thread
+held_requests = threading.BoundedSemaphore(app.config['MAX_HELD_REQUESTS'])
+
+# Single reaper thread for expiring files, status entries and idle cache entries
+reaper = ExpiryScheduler(autostart=not app.config['PRELOAD_APP'])
+
+def startup_sweep():
+    """Clear files orphaned by a previous run from downloads and uploads"""
+    sweep_directory(
+        os.path.join(app.static_folder, 'downloads'),
+        app.config['DOWNLOAD_TTL'],
+        limit=app.config['STARTUP_SWEEP_LIMIT'],
+        keep=result_cache.filenames()
+    )
+    sweep_directory(
+        os.path.join(app.static_folder, 'uploads'),
+        app.config['UPLOAD_TTL'],
+        limit=app.config['STARTUP_SWEEP_LIMIT']
+    )
 
-def background_youtube_conversion(url, video_id):
-    """Process YouTube conversion in a background thread"""
-    status_key = f"yt_{video_id}"
+reaper.at_startup(startup_sweep)
+
+# Admission control: free disk space and per-client quotas, checked before a job starts
+admission = AdmissionController(
+    path=app.config['ADMISSION_DB'],
+    root=app.static_folder,
+    min_free_bytes=app.config['MIN_FREE_BYTES'],
+    max_jobs_per_client=app.config['CLIENT_MAX_JOBS'],
+    max_bytes_per_client=app.config['CLIENT_MAX_BYTES'],
+    window=app.config['CLIENT_QUOTA_WINDOW'],
+    retry_after=app.config['CONVERSION_RETRY_AFTER']
+)
+
+# Projected output size relative to the upload, for admission checks
+WAV_SIZE_RATIO = 12  # 16-bit 44.1 kHz PCM vs a typical 128 kbps MP3; also the bound for other audio targets
+PNG_SIZE_RATIO = 10  # Lossless PNG vs a lossy WebP
+# Used when a YouTube probe fails or has no size information
+YOUTUBE_DEFAULT_BYTES = {'mp3': 50 * 1024 ** 2, 'm4a': 50 * 1024 ** 2, 'mp4': 1024 ** 3}
+TIKTOK_DEFAULT_BYTES = 20 * 1024 ** 2
+
+def client_id():
+    """Identify the client for quotas: its address, or the first X-Forwarded-For hop behind a trusted proxy"""
+    if app.config['TRUST_FORWARDED_FOR'] and request.access_route:
+        return request.access_route[0]
+    return request.remote_addr or 'unknown'
+
+def upload_projected_bytes(ratio):
+    """Upload size plus the expected output size, from the request's Content-Length"""
+    size = request.content_length or 0
+    return size + size * ratio
+
+def admit_request(projected_bytes, on_disk=True):
+    """
+    Admit the current request's job or raise AdmissionDenied. The lease is
+    held until the response, streamed or not, has been sent. Call this
+    before touching request.files so a refused upload is never read.
+    """
+    lease_id = admission.admit(client_id(), projected_bytes, on_disk)
+    
+    @after_this_request
+    def release_lease(response):
+        response.call_on_close(lambda: admission.release(lease_id))
+        return response
     
+    return lease_id
+
+def run_leased(lease_id, fn, *args):
+    """Run a background job and release its admission lease when it ends"""
     try:
-        # Set initial status
-        conversion_status[status_key] = {
-            'status': 'processing',
-            'message': 'Download in progress...',
-            'progress': 0,
-            'filename': None,
-            'url': url
-        }
-        
-        # Convert the YouTube video to MP3
-        path, name = convert_youtube_to_mp3(url, app.static_folder)
-        logger.debug(f"Conversion completed - Path: {path}, Name: {name}")
-        
-        # Create a safe download name
-        safe_name = secure_filename(name) if name else f"youtube_audio_{video_id}.mp3"
-        if not safe_name or safe_name == '.mp3':
-            safe_name = f"youtube_audio_{video_id}.mp3"
-        
-        # Verify file exists in downloads directory with expected naming pattern
-        expected_path = os.path.join(app.static_folder, 'downloads', f"youtube_{video_id}.mp3")
-        if not os.path.exists(expected_path) and os.path.exists(path):
-            logger.info(f"Copying file to expected location: {expected_path}")
-            shutil.copy2(path, expected_path)
-        
-        # Update status to complete
-        conversion_status[status_key] = {
-            'status': 'complete',
-            'message': 'Conversion complete! Your file is ready for download.',
-            'progress': 100,
-            'filename': safe_name,
-            'url': url
-        }
+        return fn(*args)
+    finally:
+        admission.release(lease_id)
+
+# Prometheus metrics; every worker process buffers its own updates and
+# flushes them into one database, so /metrics reports totals for the server
+metrics = MetricsRegistry(app.config['METRICS_DB'])
+metrics.counter('webconverters_jobs_total', 'Conversions by converter and outcome')
+metrics.histogram('webconverters_phase_seconds', 'Time spent in each phase of a conversion')
+metrics.counter('webconverters_bytes_total', 'Bytes read from sources (in) and written as output (out)')
+metrics.counter('webconverters_status_polls_total', 'Status requests by endpoint')
+metrics.gauge('webconverters_queue_depth', 'Background jobs waiting for a worker')
+metrics.gauge('webconverters_active_workers', 'Background jobs currently running')
+
+set_recorder(
+    lambda converter, phase, seconds: metrics.observe(
+        'webconverters_phase_seconds', seconds, converter=converter, phase=phase),
+    lambda converter, direction, count: metrics.inc(
+        'webconverters_bytes_total', count, converter=converter, direction=direction)
+)
+
+def record_job(converter, outcome):
+    """Count a finished job: success, error, cache_hit, rejected or aborted"""
+    metrics.inc('webconverters_jobs_total', converter=converter, outcome=outcome)
+
+def record_poll(endpoint):
+    metrics.inc('webconverters_status_polls_total', endpoint=endpoint)
+
+def counted(converter, chunks):
+    """Relay a streamed response body and record the job's outcome once it ends"""
+    try:
+        yield from chunks
+    except GeneratorExit:
+        # Client went away before the body was sent
+        record_job(converter, 'aborted')
+        raise
+    except Exception:
+        record_job(converter, 'error')
+        raise
+    record_job(converter, 'success')
+
+def flush_metrics():
+    """Publish this process's scheduler gauges and buffered updates"""
+    metrics.set('webconverters_queue_depth', scheduler.queue_depth)
+    metrics.set('webconverters_active_workers', scheduler.active)
+    metrics.flush()
+
+reaper.every(app.config['METRICS_FLUSH_INTERVAL'], flush_metrics)
+reaper.every(app.config['REAPER_INTERVAL'], conversion_status.purge_expired)
+reaper.every(app.config['REAPER_INTERVAL'], lambda: result_cache.expire_idle(app.config['RESULT_CACHE_MAX_IDLE']))
+
+if app.config['PRELOAD_APP']:
+    # Workers forked from the master share these pages instead of importing them on first use
+    preload()
+
+def youtube_cache_key(video_id, container, codec, quality):
+    """Result cache key for a YouTube conversion"""
+    return cache_key('youtube', video_id, container, codec, quality)
+
+def audio_cache_key(video_id, audio_format):
+    """Result cache key for a YouTube audio conversion; the codec is part of the key"""
+    output = AUDIO_FORMATS[audio_format]
+    return youtube_cache_key(video_id, audio_format, output['codec'], output['quality'])
+
+def audio_status_key(video_id, audio_format):
+    """Status store key for a YouTube audio job (MP3 jobs keep the original yt_<id> key)"""
+    return f"yt_{video_id}" if audio_format == 'mp3' else f"yt_{audio_format}_{video_id}"
+
+def audio_download_url(video_id, audio_format):
+    """Download link for a finished YouTube audio job"""
+    # Built by hand so background jobs can use it outside a request context
+    url = f"/youtube/mp3/download/{video_id}"
+    return url if audio_format == 'mp3' else f"{url}?format={audio_format}"
+
+def extract_youtube_video_id(url):
+    """Pull the video ID out of a watch, short-link, shorts or embed URL, or return None"""
+    return parse_video_id(url)
+
+def probe_youtube(url, video_id):
+    """Metadata summary for a video; extract_info results are cached and reused by the download job"""
+    summary = summarize_info(get_video_info(url, cache_key=video_id))
+    max_duration = app.config['MAX_VIDEO_DURATION']
+    summary['max_duration'] = max_duration or None
+    summary['allowed'] = not (max_duration and (summary['is_live'] or (summary['duration'] or 0) > max_duration))
+    return summary
+
+def youtube_projected_bytes(url, video_id, output):
+    """Expected disk use of a YouTube job, from the (cached) probe when available"""
+    try:
+        estimate = probe_youtube(url, video_id)['estimated_bytes'].get('mp4' if output == 'mp4' else 'mp3')
     except Exception as e:
-        logger.exception(f"Error in background YouTube conversion: {e}")
-        # Update status to error
-        conversion_status[status_key] = {
-            'status': 'error',
-            'message': f"Error: {str(e)}",
-            'progress': 0,
-            'url': url
+        logger.debug(f"No size estimate for video ID {video_id}: {e}")
+        estimate = None
+    # The downloaded source and the converted output exist side by side for a while
+    return 2 * (estimate or YOUTUBE_DEFAULT_BYTES[output])
+
+def video_length_error(url, video_id):
+    """Return an error message if the video exceeds MAX_VIDEO_DURATION, else None"""
+    if not app.config['MAX_VIDEO_DURATION']:
+        return None
+    try:
+        summary = probe_youtube(url, video_id)
+    except Exception as e:
+        logger.warning(f"Probe failed for video ID {video_id}: {e}")
+        return "Could not read video information. Please check the URL."
+    if summary['allowed']:
+        return None
+    if summary['is_live']:
+        return "Live streams cannot be converted."
+    return f"This video is too long. The maximum length is {app.config['MAX_VIDEO_DURATION'] // 60} minutes."
+
+def job_result(job_id):
+    """Return (cache key, download URL) of the file a YouTube job produces, or None"""
+    if job_id.startswith('yt_mp4_'):
+        video_id = job_id[len('yt_mp4_'):]
+        return youtube_cache_key(video_id, 'mp4', 'h264', 'best'), f"/youtube/mp4/download/{video_id}"
+    if job_id.startswith('yt_'):
+        video_id, audio_format = job_id[len('yt_'):], 'mp3'
+        prefix, _, rest = video_id.partition('_')
+        if prefix in AUDIO_FORMATS and rest:
+            video_id, audio_format = rest, prefix
+        return audio_cache_key(video_id, audio_format), audio_download_url(video_id, audio_format)
+    return None
+
+def job_event_payload(job_id, current_status, cached=None):
+    """
+    Build the progress event sent to SSE clients for a job. cached is
+    whether the job's result is in the cache; it's only consulted when
+    there's no status entry and is looked up here if not given.
+    """
+    if current_status is None:
+        # No status entry - the result may still be cached from an earlier job
+        result = job_result(job_id)
+        if result is not None and cached is None:
+            cached = bool(result_cache.indexed([result[0]]))
+        if result is not None and cached:
+            return {
+                "status": "complete",
+                "progress": 100,
+                "message": "Your file is ready for download!",
+                "complete": True,
+                "error": False,
+                "download_url": result[1]
+            }
+        return {
+            "status": "unknown",
+            "progress": 0,
+            "message": "No information available",
+            "complete": False,
+            "error": False,
+            "download_url": None
         }
+    
+    error = current_status.get('error', False)
+    complete = current_status.get('complete', False)
+    return {
+        "status": "error" if error else ("complete" if complete else "processing"),
+        "progress": current_status.get('progress', 0),
+        "message": current_status.get('message', 'Processing...'),
+        "complete": complete,
+        "error": error,
+        "download_url": current_status.get('download_url'),
+        "files": current_status.get('files')
+    }
+
+def job_statuses(current):
+    """
+    Turn a status store get_many() result into status API answers. Result
+    files are looked up in the cache index in one query, which also gives
+    file_size without a stat call.
+    """
+    results = {job_id: job_result(job_id) for job_id in current}
+    sizes = result_cache.indexed(result[0] for result in results.values() if result is not None)
+    statuses = {}
+    for job_id, (version, value) in current.items():
+        result = results[job_id]
+        size = sizes.get(result[0]) if result is not None else None
+        payload = job_event_payload(job_id, value, cached=size is not None)
+        payload["version"] = version
+        payload["file_ready"] = payload["complete"] and not payload["error"]
+        payload["file_size"] = size if payload["file_ready"] else None
+        statuses[job_id] = payload
+    return statuses
+
+@app.route('/api/jobs/status')
+def jobs_status_api():
+    """
+    Status of several jobs in one request, answered from the status store
+    and cache index without touching the filesystem.
+
+    ids is a comma-separated list of job IDs (or a repeated parameter).
+    With wait=<seconds> the request long-polls: it returns as soon as any
+    listed job changes, or when the wait runs out. versions, aligned with
+    ids, are the versions the client last saw; without them the wait is
+    for changes after the request arrives. The response lists the jobs
+    whose version differs from the baseline under "changed".
+
+    Jobs run in whichever gunicorn worker accepted them, so the index is
+    the shared status store rather than a per-process dict: one indexed
+    query per request, and waits check versions every POLL_INTERVAL.
+    With STATUS_STORE=memory (a single process) waits wake on the change itself.
+    """
+    from flask import jsonify
+    
+    record_poll('jobs_status')
+    job_ids = list(dict.fromkeys(
+        job_id.strip() for value in request.args.getlist('ids') for job_id in value.split(',') if job_id.strip()
+    ))
+    if not job_ids:
+        return jsonify({"error": "No job IDs given"}), 400
+    if len(job_ids) > app.config['STATUS_BATCH_MAX']:
+        return jsonify({"error": f"At most {app.config['STATUS_BATCH_MAX']} job IDs per request"}), 400
+    try:
+        wait = float(request.args.get('wait', 0))
+        versions = [int(version) for version in request.args.get('versions', '').split(',') if version.strip()]
+    except ValueError:
+        return jsonify({"error": "wait and versions must be numbers"}), 400
+    if not math.isfinite(wait):
+        return jsonify({"error": "wait must be a finite number of seconds"}), 400
+    wait = min(max(wait, 0), app.config['STATUS_MAX_WAIT'])
+    if versions and len(versions) != len(job_ids):
+        return jsonify({"error": "versions must list one version per job ID"}), 400
+    
+    current = conversion_status.get_many(job_ids)
+    if versions:
+        baseline = dict(zip(job_ids, versions))
+    else:
+        baseline = {job_id: version for job_id, (version, value) in current.items()}
+    # A long-poll holds a worker thread like an event stream does; when every
+    # slot is taken it answers at once and the client polls again later
+    if wait and all(current[job_id][0] == baseline[job_id] for job_id in job_ids) \
+            and held_requests.acquire(blocking=False):
+        try:
+            current = conversion_status.wait_for_any(baseline, wait)
+        finally:
+            held_requests.release()
+    
+    return jsonify({
+        "jobs": job_statuses(current),
+        "changed": [job_id for job_id in job_ids if current[job_id][0] != baseline[job_id]]
+    })
 
 @app.route('/api/youtube/status/<video_id>')
 def youtube_mp3_status_api(video_id):
-    """API endpoint to get the current status of a YouTube MP3 conversion"""
+    """Status of a YouTube MP3 conversion; kept for clients that poll one job at a time"""
     from flask import jsonify
     
-    status_key = f"yt_{video_id}"
-    response = {
-        "status": "unknown",
-        "progress": 0,
-        "message": "No information available",
-        "complete": False,
-        "file_ready": False,
-        "download_url": None,
-        "error": False
-    }
+    record_poll('youtube_status')
+    job_id = f"yt_{video_id}"
+    return jsonify(job_statuses(conversion_status.get_many([job_id]))[job_id])
+
+@app.route('/api/jobs/<job_id>/events')
+def job_events(job_id):
+    """
+    Server-Sent Events stream of progress updates for a job. Each open
+    stream holds a worker thread; once MAX_HELD_REQUESTS are open in this
+    process the request gets a 503 and the page polls the status API instead.
+    """
+    record_poll('job_events')
+    if not held_requests.acquire(blocking=False):
+        return "Too many open progress streams", 503, {'Retry-After': str(app.config['SSE_HEARTBEAT'])}
+    min_interval = app.config['SSE_MIN_INTERVAL']
+    heartbeat = app.config['SSE_HEARTBEAT']
+    max_duration = app.config['SSE_MAX_DURATION']
     
-    # Check if file exists
-    expected_path = os.path.join(app.static_folder, 'downloads', f"youtube_{video_id}.mp3")
-    
-    if os.path.exists(expected_path):
-        # File already exists, ready for download
-        file_size = os.path.getsize(expected_path)
-        response.update({
-            "status": "complete",
-            "progress": 100,
-            "message": "Your file is ready for download!",
-            "complete": True,
-            "file_ready": True,
-            "download_url": f"/static/downloads/youtube_{video_id}.mp3",
-            "file_size": file_size
-        })
-        logger.debug(f"API status check: MP3 file exists for {video_id}, size: {file_size} bytes")
-    elif status_key in conversion_status:
-        # Get status from conversion status dictionary
-        current_status = conversion_status[status_key]
+    def generate():
+        started = time.time()
+        version, current_status = conversion_status.get_versioned(job_id)
+        last_sent = time.time()
         
-        # Check if there was an error
-        if current_status.get('error', False):
-            response.update({
-                "status": "error",
-                "message": current_status.get('message', 'An error occurred during conversion'),
-                "error": True,
-                "complete": True
-            })
-            logger.debug(f"API status check: Error state for MP3 {video_id}: {response['message']}")
-        else:
-            response.update({
-                "status": "processing" if not current_status.get('complete', False) else "complete",
-                "progress": current_status.get('progress', 0),
-                "message": current_status.get('message', 'Processing...'),
-                "complete": current_status.get('complete', False),
-                "file_ready": current_status.get('complete', False) and os.path.exists(expected_path)
-            })
+        while True:
+            payload = job_event_payload(job_id, current_status)
+            yield f"event: progress\ndata: {json.dumps(payload)}\n\n"
+            if payload['complete'] or payload['error']:
+                yield "event: end\ndata: {}\n\n"
+                return
+            last_sent = time.time()
             
-            # If complete, add download URL but verify file exists
-            if current_status.get('complete', False):
-                if os.path.exists(expected_path):
-                    response["download_url"] = f"/static/downloads/youtube_{video_id}.mp3"
-                    response["file_ready"] = True
-                else:
-                    # This is a problem - marked complete but file doesn't exist
-                    response["message"] = "Error: File not found. Please try again."
-                    response["error"] = True
-                    logger.warning(f"API status check: MP3 file missing for completed conversion {video_id}")
+            # Wait for the next change, sending keep-alive comments meanwhile
+            while True:
+                if time.time() - started >= max_duration:
+                    # Let the browser reconnect so no worker thread is held forever
+                    return
+                new_version, new_status = conversion_status.wait_for_change(job_id, version, heartbeat)
+                if new_version != version:
+                    break
+                yield ": keep-alive\n\n"
             
-            logger.debug(f"API status check: Status for MP3 {video_id}: {response['status']}, progress: {response['progress']}%")
-    else:
-        logger.warning(f"API status check: No status found for MP3 {video_id}")
+            # Coalesce: updates arriving within min_interval collapse into one event
+            wait = min_interval - (time.time() - last_sent)
+            if wait > 0:
+                time.sleep(wait)
+                new_version, new_status = conversion_status.get_versioned(job_id)
+            version, current_status = new_version, new_status
     
-    return jsonify(response)
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    # Runs when the server closes the response, whether or not the stream was ever read
+    response.call_on_close(held_requests.release)
+    return response
+
+@app.route('/api/cache/stats')
+def cache_stats_api():
+    """API endpoint reporting result cache usage and hit/miss counters"""
+    from flask import jsonify
+    
+    return jsonify(result_cache.stats())
+
+@app.route('/api/converters')
+def converters_api():
+    """API endpoint listing the available converters with their routes, inputs and output types"""
+    from flask import jsonify
+    
+    return jsonify([
+        {'name': c.name, 'title': c.title, 'route': c.route, 'inputs': list(c.inputs), 'output_mime': c.output_mime}
+        for c in CONVERTERS.values()
+    ])
+
+@app.route('/api/youtube/probe')
+def youtube_probe_api():
+    """API endpoint returning title, duration, formats and estimated output sizes without downloading"""
+    from flask import jsonify
+    
+    url = request.args.get('url', '')
+    video_id = extract_youtube_video_id(url)
+    if not video_id:
+        return jsonify({"error": "Could not extract video ID from URL"}), 400
+    
+    try:
+        summary = probe_youtube(url, video_id)
+    except Exception as e:
+        logger.warning(f"Probe failed for video ID {video_id}: {e}")
+        return jsonify({"error": "Could not read video information"}), 502
+    
+    response = jsonify(summary)
+    response.headers['Cache-Control'] = 'private, max-age=300'
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics for all worker processes, plus result cache statistics"""
+    stats = result_cache.stats()
+    cache_metrics = [
+        ('webconverters_cache_hits_total', 'counter', 'Result cache hits', {}, stats['hits']),
+        ('webconverters_cache_misses_total', 'counter', 'Result cache misses', {}, stats['misses']),
+        ('webconverters_cache_evictions_total', 'counter', 'Result cache evictions', {}, stats['evictions']),
+        ('webconverters_cache_entries', 'gauge', 'Files in the result cache', {}, stats['entries']),
+        ('webconverters_cache_bytes', 'gauge', 'Disk used by the result cache', {}, stats['bytes']),
+        ('webconverters_cache_hit_ratio', 'gauge', 'Result cache hits / (hits + misses)', {}, stats['hit_ratio']),
+    ]
+    flush_metrics()
+    return Response(metrics.render(cache_metrics), mimetype='text/plain; version=0.0.4')
 
 @app.route('/youtube/mp3', methods=['GET', 'POST'])
 def youtube_mp3():
@@ -166,6 +559,9 @@ def youtube_mp3():
     progress = 0
     processing = False
     video_id = request.args.get('vid')
+    audio_format = request.values.get('format') or 'mp3'
+    if audio_format not in AUDIO_FORMATS:
+        audio_format = 'mp3'
     
     if request.method == 'POST':
         # Handle form submission - start new conversion
@@ -174,44 +570,84 @@ def youtube_mp3():
             error = "Please enter a valid YouTube URL"
         else:
             # Extract video ID from URL
-            if "v=" in url:
-                video_id = url.split("v=")[1].split("&")[0]
-            elif "youtu.be/" in url:
-                video_id = url.split("youtu.be/")[1].split("?")[0]
-            else:
+            video_id = extract_youtube_video_id(url)
+            if not video_id:
                 error = "Could not extract video ID from URL. Please use a standard YouTube URL."
+            else:
+                # Cached results are served without contacting YouTube, reserving disk or queueing a job
+                cached = result_cache.get(audio_cache_key(video_id, audio_format))
+                if cached is not None:
+                    youtube_mp3_cache_hit(video_id, audio_format, cached)
+                    return redirect(url_for('youtube_mp3', vid=video_id,
+                                            format=None if audio_format == 'mp3' else audio_format))
+                
+                # Refuse over-long videos before queueing; the probe result is reused by the job
+                length_error = video_length_error(url, video_id)
+                if length_error:
+                    record_job('youtube_mp3', 'rejected')
+                    return render_template('youtube_mp3.html', error=length_error, url=url), 400
                 
             if video_id and not error:
-                logger.info(f"Starting YouTube to MP3 conversion for video ID: {video_id}")
+                logger.info(f"Starting YouTube to {audio_format.upper()} conversion for video ID: {video_id}")
+                
+                # Claim the status entry first so a job already running in another
+                # worker process is joined rather than duplicated
+                status_key = audio_status_key(video_id, audio_format)
+                claimed = conversion_status.claim(status_key, {
+                    'progress': 0,
+                    'message': 'Waiting in queue...',
+                    'complete': False
+                })
                 
-                # Start a new conversion task in a background thread
-                thread = threading.Thread(
-                    target=background_youtube_conversion,
-                    args=(url, video_id)
-                )
-                thread.daemon = True
-                thread.start()
-                logger.debug(f"Background conversion thread started for video ID: {video_id}")
+                if not claimed:
+                    logger.debug(f"Conversion already in progress for video ID: {video_id}")
+                else:
+                    # Check disk space and the client's quotas before queueing
+                    try:
+                        lease_id = admission.admit(client_id(), youtube_projected_bytes(url, video_id, audio_format))
+                    except AdmissionDenied as e:
+                        conversion_status.delete(status_key)
+                        record_job('youtube_mp3', 'rejected')
+                        logger.warning(f"Admission denied for video ID {video_id} ({e.status}): {e}")
+                        return render_template('youtube_mp3.html', error=str(e), url=url), e.status, e.headers
+                    
+                    # Queue the conversion; concurrent requests for the same video share one job
+                    try:
+                        job, created = scheduler.submit(
+                            ('youtube_mp3', video_id, audio_format),
+                            run_leased, lease_id, process_youtube_mp3, url, video_id, app.static_folder, audio_format
+                        )
+                    except SchedulerBusy as e:
+                        admission.release(lease_id)
+                        conversion_status.delete(status_key)
+                        record_job('youtube_mp3', 'rejected')
+                        logger.warning(f"Conversion queue full, rejecting video ID: {video_id}")
+                        body = render_template(
+                            'youtube_mp3.html',
+                            error="The converter is busy right now. Please try again in a moment.",
+                            url=url
+                        )
+                        return body, 503, {'Retry-After': str(e.retry_after)}
+                    if not created:
+                        # Joined a job that already holds its own lease
+                        admission.release(lease_id)
+                    logger.debug(f"Queued conversion job {job.id} for video ID: {video_id} (new: {created})")
                 
                 # Redirect to status page
-                return redirect(url_for('youtube_mp3', vid=video_id))
+                return redirect(url_for('youtube_mp3', vid=video_id,
+                                        format=None if audio_format == 'mp3' else audio_format))
     
     # Handle GET requests - status check or initial page load
     if video_id:
         # This is a status check
-        status_key = f"yt_{video_id}"
-        
-        # Check if this is a completed download
-        filename = f"youtube_{video_id}.mp3"
-        file_path = os.path.join(app.static_folder, 'downloads', filename)
+        current_status = conversion_status.get(audio_status_key(video_id, audio_format))
         
-        if os.path.exists(file_path):
+        if result_cache.get(audio_cache_key(video_id, audio_format), count=False) is not None:
             # File exists - show download button
-            status_message = "Your MP3 is ready for download!"
+            status_message = f"Your {audio_format.upper()} is ready for download!"
             processing = False
-        elif status_key in conversion_status:
+        elif current_status is not None:
             # Conversion in progress
-            current_status = conversion_status[status_key]
             progress = current_status.get('progress', 0)
             status_message = current_status.get('message', 'Processing...')
             processing = not current_status.get('complete', False)
@@ -227,62 +663,43 @@ def youtube_mp3():
         progress=progress,
         processing=processing,
         video_id=video_id,
+        audio_format=audio_format,
+        job_id=audio_status_key(video_id, audio_format) if video_id else None,
+        download_url=audio_download_url(video_id, audio_format) if video_id else None,
         url=request.form.get('url', '')
     )
 
 @app.route('/youtube/mp3/download/<download_id>')
 def download_youtube_mp3(download_id):
-    """Direct download endpoint for YouTube MP3 files"""
+    """Direct download endpoint for YouTube audio files (?format=m4a for the remuxed M4A)"""
     try:
-        # Construct the expected filename
-        filename = f"youtube_{download_id}.mp3"
+        audio_format = request.args.get('format') or 'mp3'
+        if audio_format not in AUDIO_FORMATS:
+            return "Unknown format", 404
         
-        # Path to the file
-        downloads_dir = os.path.join(app.static_folder, 'downloads')
-        file_path = os.path.join(downloads_dir, filename)
-        
-        # Check if file exists
-        if not os.path.exists(file_path):
-            logger.error(f"File not found: {file_path}")
+        # Look the file up in the result cache (this also refreshes its LRU position)
+        entry = result_cache.get(audio_cache_key(download_id, audio_format), count=False)
+        if entry is None:
+            logger.error(f"File not found in cache for video ID: {download_id}")
             return "File not found. It may have expired.", 404
         
-        # Log file info for debugging
-        file_size = os.path.getsize(file_path)
-        logger.debug(f"Serving file: {file_path}, Size: {file_size} bytes")
+        file_path = entry['path']
+        logger.debug(f"Serving file: {file_path}, Size: {entry['size']} bytes")
         
         # Get status key
-        status_key = f"yt_{download_id}"
-        display_filename = f"youtube_audio_{download_id}.mp3"
+        status_key = audio_status_key(download_id, audio_format)
+        display_filename = entry['download_name'] or f"youtube_audio_{download_id}.{audio_format}"
         
         # Try to get a better filename from conversion status
-        if status_key in conversion_status and conversion_status[status_key].get('filename'):
-            display_filename = conversion_status[status_key]['filename']
-        
-        # Schedule cleanup after a delay
-        def delayed_cleanup():
-            time.sleep(1800)  # 30 minutes
-            try:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                    logger.debug(f"Removed MP3 file after delay: {file_path}")
-                # Also remove from status tracking
-                if status_key in conversion_status:
-                    del conversion_status[status_key]
-            except Exception as e:
-                logger.error(f"Error removing file: {e}")
-        
-        cleanup_thread = threading.Thread(target=delayed_cleanup)
-        cleanup_thread.daemon = True
-        cleanup_thread.start()
+        current_status = conversion_status.get(status_key)
+        if current_status and current_status.get('filename'):
+            display_filename = current_status['filename']
         
         # Two options:
-        # 1. Send the file directly (more reliable for some browsers)
-        return send_file(
-            file_path,
-            mimetype='audio/mpeg',
-            as_attachment=True,
-            download_name=display_filename
-        )
+        # 1. Send the file directly (more reliable for some browsers); supports
+        #    resuming via Range and is offloaded to the proxy when configured
+        return serve_download(file_path, AUDIO_FORMATS[audio_format]['mimetype'], display_filename,
+                              cache_etag(entry), converter='youtube_mp3')
         
         # 2. Redirect to static file (fallback - commented out)
         # static_url = f"/static/downloads/{filename}"
@@ -292,27 +709,32 @@ def download_youtube_mp3(download_id):
         logger.exception(f"Error in download_youtube_mp3: {e}")
         return "An error occurred during download", 500
 
-def process_youtube_mp3(url, video_id, static_folder):
-    """Background thread function to process YouTube MP3 conversions"""
-    status_key = f"yt_{video_id}"
+def youtube_mp3_cache_hit(video_id, audio_format, cached):
+    """Mark a YouTube audio conversion complete from an existing cache entry"""
+    logger.info(f"Cache hit for video {video_id} ({audio_format}), skipping download")
+    record_job('youtube_mp3', 'cache_hit')
+    conversion_status[audio_status_key(video_id, audio_format)] = {
+        'progress': 100,
+        'message': f"Your {audio_format.upper()} is ready for download!",
+        'complete': True,
+        'filename': cached['download_name'] or f"youtube_audio_{video_id}.{audio_format}",
+        'download_url': audio_download_url(video_id, audio_format)
+    }
+
+def process_youtube_mp3(url, video_id, static_folder, audio_format='mp3'):
+    """Background thread function to process YouTube MP3 (or M4A) conversions"""
+    status_key = audio_status_key(video_id, audio_format)
+    ready_message = f"Your {audio_format.upper()} is ready for download!"
     try:
         # Make sure downloads directory exists
         downloads_dir = os.path.join(static_folder, 'downloads')
         os.makedirs(downloads_dir, exist_ok=True)
         
-        # First check if the file already exists (avoid redownloading)
-        expected_file_path = os.path.join(downloads_dir, f"youtube_{video_id}.mp3")
-        if os.path.exists(expected_file_path):
-            logger.info(f"File already exists for video {video_id}, skipping download")
-            
-            # Update status to show completion
-            conversion_status[status_key] = {
-                'progress': 100,
-                'message': 'Your MP3 is ready for download!',
-                'complete': True,
-                'filename': f"youtube_audio_{video_id}.mp3",
-                'download_url': f"/youtube/mp3/download/{video_id}"
-            }
+        # First check the result cache (avoid redownloading)
+        key = audio_cache_key(video_id, audio_format)
+        cached = result_cache.get(key)
+        if cached is not None:
+            youtube_mp3_cache_hit(video_id, audio_format, cached)
             return
             
         # Update status to show we're starting
@@ -324,38 +746,38 @@ def process_youtube_mp3(url, video_id, static_folder):
         
         # Define a progress callback function
         def progress_callback(percent, message, is_complete=False):
-            # Update the global status dictionary
+            # Update the shared status; the job only counts as complete once
+            # the file has been stored in the cache below
             conversion_status[status_key] = {
-                'progress': percent,
+                'progress': min(percent, 99),
                 'message': message,
-                'complete': is_complete
+                'complete': False
             }
-            logger.debug(f"Progress update for {video_id}: {percent}% - {message} (Complete: {is_complete})")
             
         # Perform the actual conversion
-        logger.debug(f"Starting YouTube to MP3 conversion for URL: {url}")
-        file_path, filename = convert_youtube_to_mp3(url, static_folder, progress_callback)
+        logger.debug(f"Starting YouTube to {audio_format.upper()} conversion for URL: {url}")
+        file_path, filename = convert_youtube_to_mp3(url, static_folder, progress_callback, audio_format)
         
         # Verify the file was created
         if not os.path.exists(file_path):
-            raise FileNotFoundError(f"Expected MP3 file not found at {file_path}")
+            raise FileNotFoundError(f"Expected {audio_format.upper()} file not found at {file_path}")
             
-        # Double-check that the file is in the expected location
-        if not os.path.exists(expected_file_path):
-            logger.warning(f"File not in expected location. Copying from {file_path} to {expected_file_path}")
-            shutil.copy2(file_path, expected_file_path)
+        # Store it in the cache under the expected name
+        result_cache.put(key, file_path, f"youtube_{video_id}.{audio_format}", filename)
         
         # Update status to show completion
         conversion_status[status_key] = {
             'progress': 100,
-            'message': 'Your MP3 is ready for download!',
+            'message': ready_message,
             'complete': True,
-            'filename': filename or f"youtube_audio_{video_id}.mp3",
-            'download_url': f"/youtube/mp3/download/{video_id}"
+            'filename': filename or f"youtube_audio_{video_id}.{audio_format}",
+            'download_url': audio_download_url(video_id, audio_format)
         }
-        logger.info(f"YouTube to MP3 conversion completed: {filename}")
+        record_job('youtube_mp3', 'success')
+        logger.info(f"YouTube to {audio_format.upper()} conversion completed: {filename}")
         
     except Exception as e:
+        record_job('youtube_mp3', 'error')
         # Update status to show error
         conversion_status[status_key] = {
             'progress': 0,
@@ -365,56 +787,311 @@ def process_youtube_mp3(url, video_id, static_folder):
         }
         logger.exception(f"Error in YouTube to MP3 conversion: {e}")
 
+def mp4_status_key(video_id):
+    """Status store key for a YouTube MP4 job"""
+    return f"yt_mp4_{video_id}"
+
 @app.route('/youtube/mp4', methods=['GET','POST'])
 def youtube_mp4():
+    """YouTube to MP4 converter page; conversions run as background jobs"""
     error = None
+    status_message = None
+    progress = 0
+    processing = False
+    video_id = request.args.get('vid')
+    
     if request.method == 'POST':
         url = request.form.get('url')
-        try:
-            logger.debug(f"Starting YouTube to MP4 conversion for URL: {url}")
+        video_id = extract_youtube_video_id(url or '')
+        if not video_id:
+            error = "Could not extract video ID from URL. Please use a standard YouTube URL."
+        else:
+            # Cached results are served without contacting YouTube, reserving disk or queueing a job
+            if result_cache.get(youtube_cache_key(video_id, 'mp4', 'h264', 'best')) is not None:
+                youtube_mp4_cache_hit(video_id)
+                return redirect(url_for('youtube_mp4', vid=video_id))
             
-            # Convert the YouTube video to MP4
-            path, name = convert_youtube_to_mp4(url, app.static_folder)
-            logger.debug(f"Conversion completed - Path: {path}, Name: {name}")
+            length_error = video_length_error(url, video_id)
+            if length_error:
+                record_job('youtube_mp4', 'rejected')
+                return render_template('youtube_mp4.html', error=length_error, url=url), 400
             
-            # Additional safety check - if path doesn't exist, raise error
-            if not os.path.exists(path):
-                raise FileNotFoundError(f"The converted file does not exist at {path}")
-                
-            # Extra sanitization of file before sending
-            safe_name = "youtube_video.mp4"
-            if name:
-                # Create an extra-safe name with just alphanumeric chars
-                safe_name = re.sub(r'[^\w]+', '', os.path.splitext(name)[0])
-                safe_name = f"{safe_name}.mp4"
+            status_key = mp4_status_key(video_id)
+            claimed = conversion_status.claim(status_key, {
+                'progress': 0,
+                'message': 'Waiting in queue...',
+                'complete': False
+            })
+            
+            if not claimed:
+                logger.debug(f"MP4 conversion already in progress for video ID: {video_id}")
+            else:
+                try:
+                    lease_id = admission.admit(client_id(), youtube_projected_bytes(url, video_id, 'mp4'))
+                except AdmissionDenied as e:
+                    conversion_status.delete(status_key)
+                    record_job('youtube_mp4', 'rejected')
+                    logger.warning(f"Admission denied for MP4 video ID {video_id} ({e.status}): {e}")
+                    return render_template('youtube_mp4.html', error=str(e), url=url), e.status, e.headers
                 
-            logger.debug(f"Sending file with safe name: {safe_name}")
+                try:
+                    job, created = scheduler.submit(
+                        ('youtube_mp4', video_id),
+                        run_leased, lease_id, process_youtube_mp4, url, video_id, app.static_folder
+                    )
+                except SchedulerBusy as e:
+                    admission.release(lease_id)
+                    conversion_status.delete(status_key)
+                    record_job('youtube_mp4', 'rejected')
+                    logger.warning(f"Conversion queue full, rejecting MP4 video ID: {video_id}")
+                    body = render_template(
+                        'youtube_mp4.html',
+                        error="The converter is busy right now. Please try again in a moment.",
+                        url=url
+                    )
+                    return body, 503, {'Retry-After': str(e.retry_after)}
+                if not created:
+                    admission.release(lease_id)
+                logger.debug(f"Queued MP4 conversion job {job.id} for video ID: {video_id} (new: {created})")
             
-            return send_file(
-                path,
-                mimetype='video/mp4',
-                as_attachment=True,
-                download_name=safe_name
-            )
-        except Exception as e:
-            logger.exception("Error in YouTube to MP4 conversion")
-            error = str(e)
-    return render_template('youtube_mp4.html', error=error, url=request.form.get('url', ''))
+            # Redirect to status page
+            return redirect(url_for('youtube_mp4', vid=video_id))
+    
+    elif video_id:
+        # Status page for a queued, running or finished job
+        current_status = conversion_status.get(mp4_status_key(video_id))
+        if result_cache.get(youtube_cache_key(video_id, 'mp4', 'h264', 'best'), count=False) is not None:
+            status_message = "Your MP4 is ready for download!"
+        elif current_status is not None and current_status.get('error'):
+            error = current_status.get('message', 'An error occurred during conversion')
+        elif current_status is not None:
+            progress = current_status.get('progress', 0)
+            status_message = current_status.get('message', 'Processing...')
+            processing = True
+        else:
+            error = "No download found with that ID. It may have expired."
+    
+    return render_template(
+        'youtube_mp4.html',
+        error=error,
+        status_message=status_message,
+        progress=progress,
+        processing=processing,
+        video_id=video_id,
+        url=request.form.get('url', '')
+    )
+
+@app.route('/api/youtube/mp4/status/<video_id>')
+def youtube_mp4_status_api(video_id):
+    """API endpoint to get the current status of a YouTube MP4 conversion"""
+    from flask import jsonify
+    
+    record_poll('youtube_mp4_status')
+    job_id = mp4_status_key(video_id)
+    return jsonify(job_statuses(conversion_status.get_many([job_id]))[job_id])
+
+@app.route('/youtube/mp4/download/<video_id>')
+def download_youtube_mp4(video_id):
+    """Direct download endpoint for YouTube MP4 files"""
+    entry = result_cache.get(youtube_cache_key(video_id, 'mp4', 'h264', 'best'), count=False)
+    if entry is None:
+        logger.error(f"MP4 not found in cache for video ID: {video_id}")
+        return "File not found. It may have expired.", 404
+    
+    # Extra sanitization of file before sending
+    safe_name = "youtube_video.mp4"
+    if entry['download_name']:
+        # Create an extra-safe name with just alphanumeric chars
+        safe_name = re.sub(r'[^\w]+', '', os.path.splitext(entry['download_name'])[0])
+        safe_name = f"{safe_name or 'youtube_video'}.mp4"
+    
+    logger.debug(f"Serving MP4: {entry['path']}, Size: {entry['size']} bytes")
+    return serve_download(entry['path'], 'video/mp4', safe_name, cache_etag(entry), converter='youtube_mp4')
+
+def youtube_mp4_cache_hit(video_id):
+    """Mark a YouTube MP4 conversion complete from an existing cache entry"""
+    logger.info(f"Cache hit for MP4 video {video_id}, skipping download")
+    record_job('youtube_mp4', 'cache_hit')
+    conversion_status[mp4_status_key(video_id)] = {
+        'progress': 100,
+        'message': 'Your MP4 is ready for download!',
+        'complete': True,
+        'download_url': f"/youtube/mp4/download/{video_id}"
+    }
+
+def process_youtube_mp4(url, video_id, static_folder):
+    """Background job that downloads a YouTube video as MP4 into the result cache"""
+    status_key = mp4_status_key(video_id)
+    download_url = f"/youtube/mp4/download/{video_id}"
+    try:
+        key = youtube_cache_key(video_id, 'mp4', 'h264', 'best')
+        cached = result_cache.get(key)
+        if cached is not None:
+            youtube_mp4_cache_hit(video_id)
+            return
+        
+        conversion_status[status_key] = {
+            'progress': 0,
+            'message': 'Starting download...',
+            'complete': False
+        }
+        
+        def progress_callback(percent, message, is_complete=False):
+            # Complete is only reported once the file is in the cache
+            conversion_status[status_key] = {
+                'progress': min(percent, 99),
+                'message': message,
+                'complete': False
+            }
+        
+        logger.debug(f"Starting YouTube to MP4 conversion for URL: {url}")
+        path, name = convert_youtube_to_mp4(url, static_folder, progress_callback)
+        
+        # Additional safety check - if path doesn't exist, raise error
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"The converted file does not exist at {path}")
+        
+        result_cache.put(key, path, f"youtube_{video_id}.mp4", name)
+        
+        conversion_status[status_key] = {
+            'progress': 100,
+            'message': 'Your MP4 is ready for download!',
+            'complete': True,
+            'filename': name,
+            'download_url': download_url
+        }
+        record_job('youtube_mp4', 'success')
+        logger.info(f"YouTube to MP4 conversion completed: {name}")
+    
+    except Exception as e:
+        record_job('youtube_mp4', 'error')
+        conversion_status[status_key] = {
+            'progress': 0,
+            'message': f"Error: {str(e)}",
+            'complete': True,
+            'error': True
+        }
+        logger.exception(f"Error in YouTube to MP4 conversion: {e}")
+
+def attachment_header(download_name):
+    """Content-Disposition value for streamed downloads, matching what send_file sends"""
+    try:
+        download_name.encode('ascii')
+        return f'attachment; filename="{download_name}"'
+    except UnicodeEncodeError:
+        fallback = secure_filename(download_name) or 'download'
+        return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(download_name)}"
+
+def cache_etag(entry):
+    """Strong ETag for a cached result: stable for the cache key until the file is regenerated"""
+    return hashlib.sha1(f"{entry['key']}|{entry['size']}|{entry['created_at']}".encode()).hexdigest()[:32]
+
+def serve_download(path, mimetype, download_name, etag=None, converter=None):
+    """
+    Send an output file as an attachment with validators so interrupted
+    downloads can resume (Range/If-Range) and repeat requests revalidate
+    (If-None-Match). With SENDFILE_MODE set, only headers are produced and
+    the proxy streams the file and answers range requests itself.
+    The time until the response is closed is recorded as the converter's
+    serve phase.
+    
+    Outputs outside the result cache (no etag given) are deleted
+    DOWNLOAD_TTL seconds after they were last served.
+    """
+    if etag is None:
+        reaper.touch_file(path, app.config['DOWNLOAD_TTL'])
+    
+    if converter:
+        started = time.perf_counter()
+        
+        @after_this_request
+        def time_serve(response):
+            response.call_on_close(lambda: observe_phase(converter, 'serve', time.perf_counter() - started))
+            return response
+    
+    mode = app.config['SENDFILE_MODE']
+    if mode not in ('x-accel', 'x-sendfile'):
+        return send_file(path, mimetype=mimetype, as_attachment=True, download_name=download_name,
+                         conditional=True, etag=etag or True)
+    
+    response = Response(mimetype=mimetype)
+    response.headers['Content-Disposition'] = attachment_header(download_name)
+    if mode == 'x-accel':
+        relative = os.path.relpath(path, app.static_folder).replace(os.sep, '/')
+        response.headers['X-Accel-Redirect'] = app.config['SENDFILE_PREFIX'].rstrip('/') + '/' + quote(relative)
+    else:
+        response.headers['X-Sendfile'] = os.path.abspath(path)
+    if etag:
+        response.set_etag(etag)
+    response.last_modified = os.path.getmtime(path)
+    # Answers If-None-Match/If-Modified-Since with a 304 without involving the proxy
+    return response.make_conditional(request)
+
+def tiktok_cache_key(page_url):
+    """Result cache key for a TikTok sound, ignoring tracking query parameters"""
+    page = page_url.split('?')[0].split('#')[0].rstrip('/')
+    return cache_key('tiktok', hashlib.sha1(page.encode('utf-8')).hexdigest()[:16], 'mp3', 'mp3', 'source')
 
 @app.route('/tiktok/mp3', methods=['GET', 'POST'])
 def tiktok_mp3():
     if request.method == 'POST':
         url = request.form.get('url')
         try:
-            mp3_path, filename = convert_tiktok_to_mp3(url)
+            # Repeat requests are served straight from disk
+            key = tiktok_cache_key(url)
+            cached = result_cache.get(key)
+            if cached is not None:
+                record_job('tiktok_mp3', 'cache_hit')
+                return serve_download(cached['path'], 'audio/mpeg', cached['download_name'], cache_etag(cached),
+                                      converter='tiktok_mp3')
+            
+            # Reserve room for the teed copy before fetching anything
+            admit_request(TIKTOK_DEFAULT_BYTES)
+            title, music_url = resolve_tiktok_music(url)
+            filename = tiktok_filename(title)
+            
+            # Relay the upstream bytes to the client while teeing them into a
+            # partial file next to the cache; it joins the cache once complete
+            downloads_dir = os.path.join(app.static_folder, 'downloads')
+            fd, part_path = tempfile.mkstemp(prefix='tiktok_', suffix='.part', dir=downloads_dir)
+            os.close(fd)
+            # Safety net if this worker dies mid-stream; the relay removes partial files itself
+            reaper.schedule_file(part_path, app.config['UPLOAD_TTL'])
+            try:
+                try:
+                    chunks, length = stream_tiktok_mp3(music_url, tee_path=part_path)
+                except Exception as e:
+                    # The cached musicUrl may have expired - resolve the page again once
+                    logger.debug(f"Retrying TikTok stream with a fresh musicUrl after: {e}")
+                    forget_tiktok_music(url)
+                    title, music_url = resolve_tiktok_music(url)
+                    chunks, length = stream_tiktok_mp3(music_url, tee_path=part_path)
+            except Exception:
+                os.remove(part_path)
+                raise
+            
+            def generate():
+                yield from chunks
+                try:
+                    result_cache.put(key, part_path, f"tiktok_{key.split('|')[1]}.mp3", filename)
+                except Exception as e:
+                    logger.error(f"Could not cache TikTok audio for {url}: {e}")
+            
+            headers = {'Content-Disposition': attachment_header(filename)}
+            if length is not None:
+                headers['Content-Length'] = str(length)
             # Explicit MIME type ensures proper download
-            return send_file(
-                mp3_path,
-                mimetype='audio/mpeg',
-                as_attachment=True,
-                download_name=filename
-            )
+            response = Response(stream_with_context(counted('tiktok_mp3', generate())), mimetype='audio/mpeg',
+                                headers=headers)
+            # Runs even if the client leaves before the body is read: frees the upstream
+            # connection and removes the partial file
+            response.call_on_close(chunks.close)
+            return response
+        except AdmissionDenied as e:
+            record_job('tiktok_mp3', 'rejected')
+            return render_template('tiktok_mp3.html', error=str(e), url=url), e.status, e.headers
         except Exception as e:
+            record_job('tiktok_mp3', 'error')
             return render_template('tiktok_mp3.html', error=str(e), url=url)
     return render_template('tiktok_mp3.html')
 
@@ -422,160 +1099,422 @@ def tiktok_mp3():
 def external_seo_form():
     return render_template('external_seo_form.html')
 
+def render_audio_page(error=None):
+    """The audio converter page with its output options"""
+    return render_template('convert_to_wav.html', error=error, containers=CONTAINERS, sample_rates=SAMPLE_RATES)
+
 @app.route('/convert/to_wav', methods=['GET', 'POST'])
 def convert_to_wav_route():
+    """
+    Convert an uploaded audio file. Without options the result is 16-bit
+    44.1 kHz WAV; format, codec, sample_rate, bit_depth, channels and
+    bitrate fields pick another output (see convertors.audio).
+    """
     error = None
     if request.method == 'POST':
+        try:
+            admit_request(upload_projected_bytes(WAV_SIZE_RATIO))
+        except AdmissionDenied as e:
+            record_job('wav', 'rejected')
+            return render_audio_page(str(e)), e.status, e.headers
+        
         if 'audio_file' not in request.files:
             error = "No file part"
-            return render_template('convert_to_wav.html', error=error)
+            return render_audio_page(error)
             
         audio_file = request.files['audio_file']
         if audio_file.filename == '':
             error = "No selected file"
-            return render_template('convert_to_wav.html', error=error)
+            return render_audio_page(error)
+        
+        try:
+            target = target_from_options(request.form)
+        except ValueError as e:
+            return render_audio_page(str(e)), 400
+            
+        if audio_file and accepts('wav', audio_file.filename):
+            base_name, ext = os.path.splitext(audio_file.filename)
+            if app.config['WAV_STREAMING'] and ext.lower() in STREAMABLE_EXTENSIONS:
+                # Pipe the upload through ffmpeg straight into the response
+                try:
+                    return audio_stream_response(audio_file.stream, base_name, ext, target)
+                except Exception as e:
+                    record_job('wav', 'error')
+                    error = str(e)
+                    return render_audio_page(error)
             
-        if audio_file and audio_file.filename.lower().endswith(('.mp3', '.mp4', '.m4a')):
             try:
                 # Save the uploaded file temporarily
                 uploads_dir = os.path.join(app.static_folder, 'uploads')
                 os.makedirs(uploads_dir, exist_ok=True)
                 temp_path = os.path.join(uploads_dir, audio_file.filename)
                 audio_file.save(temp_path)
+                reaper.schedule_file(temp_path, app.config['UPLOAD_TTL'])
                 
-                # Convert the file to WAV
-                wav_path, filename = convert_to_wav(temp_path, app.static_folder)
+                # Convert the file, copying the audio stream when it already matches
+                out_path, filename = transcode_audio(temp_path, app.static_folder, target)
                 
                 # Clean up the temporary file
                 if os.path.exists(temp_path):
                     os.remove(temp_path)
                 
-                # Send the converted file
-                return send_file(
-                    wav_path,
-                    mimetype='audio/wav',
-                    as_attachment=True,
-                    download_name=filename
-                )
+                record_job('wav', 'success')
+                
+                # Send the converted file; it expires once nobody has fetched it for a while
+                return serve_download(out_path, target.mime_type, filename, converter='wav')
             except Exception as e:
+                record_job('wav', 'error')
                 error = str(e)
         else:
-            error = "Unsupported file format. Please upload an MP3 or MP4 audio file."
+            error = "Unsupported file format. Please upload an MP3, MP4, M4A, WAV, FLAC, OGG or Opus file."
     
-    return render_template('convert_to_wav.html', error=error)
+    return render_audio_page(error)
+
+# Shared by all batch requests so ffmpeg concurrency stays capped by the core count
+wav_batch_executor = ThreadPoolExecutor(
+    max_workers=app.config['WAV_BATCH_WORKERS'],
+    thread_name_prefix='wav-batch'
+)
+
+@app.route('/convert/to_wav/batch', methods=['POST'])
+def convert_to_wav_batch_route():
+    """
+    Convert many audio files to WAV in one request.
+
+    Files are converted concurrently and the ZIP is streamed back as each
+    one finishes. Per-file progress and errors are published under the job
+    ID returned in the X-Job-Id header (see /api/jobs/<id>/events); files
+    that fail are also listed in errors.txt inside the archive.
+    """
+    try:
+        admit_request(upload_projected_bytes(WAV_SIZE_RATIO))
+    except AdmissionDenied as e:
+        record_job('wav', 'rejected')
+        return render_audio_page(str(e)), e.status, e.headers
+    
+    audio_files = [f for f in request.files.getlist('audio_files') if f.filename]
+    if not audio_files:
+        return render_audio_page("No selected file"), 400
+    
+    unsupported = [f.filename for f in audio_files
+                   if not accepts('wav', f.filename)]
+    if unsupported:
+        error = (f"Unsupported file format: {', '.join(unsupported)}. "
+                 "Please upload MP3, MP4, M4A, WAV, FLAC, OGG or Opus files.")
+        return render_audio_page(error), 400
+    
+    try:
+        target = target_from_options(request.form)
+    except ValueError as e:
+        return render_audio_page(str(e)), 400
+    
+    batch_id = uuid.uuid4().hex
+    job_id = f"wav_batch_{batch_id}"
+    uploads_dir = os.path.join(app.static_folder, 'uploads')
+    os.makedirs(uploads_dir, exist_ok=True)
+    
+    # ffmpeg needs seekable input for MP4/M4A, so uploads go to disk under
+    # unique names; the original name is kept for the archive
+    items = []
+    taken = set()
+    for index, audio_file in enumerate(audio_files):
+        name = unique_name(audio_file.filename, taken)
+        _, ext = os.path.splitext(audio_file.filename)
+        path = os.path.join(uploads_dir, f"{batch_id}_{index}{ext.lower()}")
+        audio_file.save(path)
+        reaper.schedule_file(path, app.config['UPLOAD_TTL'])
+        items.append((name, path))
+    
+    total = len(items)
+    conversion_status[job_id] = {
+        'progress': 0,
+        'message': f"Converting {total} files...",
+        'complete': False,
+        'files': {name: {'status': 'queued', 'message': 'Waiting...'} for name, _ in items}
+    }
+    finished = [0]
+    lock = threading.Lock()
+    
+    def on_update(name, state, message):
+        # Called from the executor threads
+        with lock:
+            if state in ('done', 'error'):
+                finished[0] += 1
+            current = conversion_status.get(job_id) or {'files': {}}
+            files = current.get('files', {})
+            files[name] = {'status': state, 'message': message}
+            conversion_status.update(job_id, {
+                'files': files,
+                'progress': int(finished[0] * 100 / total),
+                'message': f"Converted {finished[0]} of {total} files"
+            })
+    
+    def results():
+        zip_names = set()
+        errors = []
+        try:
+            for name, wav_path, error in convert_batch_to_wav(items, app.static_folder, wav_batch_executor, on_update,
+                                                              target):
+                if error:
+                    logger.warning(f"Batch WAV conversion failed for {name}: {error}")
+                    record_job('wav', 'error')
+                    errors.append(f"{name}: {error}")
+                    continue
+                record_job('wav', 'success')
+                base_name, _ = os.path.splitext(name)
+                safe = re.sub(r'\W+', '', base_name) or 'audio'
+                try:
+                    yield unique_name(f"{safe}{target.extension}", zip_names), wav_path
+                finally:
+                    os.remove(wav_path)
+            
+            if errors:
+                yield 'errors.txt', ('\n'.join(errors) + '\n').encode('utf-8')
+            conversion_status.update(job_id, {
+                'complete': True,
+                'progress': 100,
+                'message': f"Converted {total - len(errors)} of {total} files"
+            })
+        finally:
+            for _, path in items:
+                if os.path.exists(path):
+                    os.remove(path)
+    
+    return Response(
+        stream_with_context(stream_zip(results())),
+        mimetype='application/zip',
+        headers={
+            'Content-Disposition': attachment_header(f"converted_{target.container}.zip"),
+            'X-Job-Id': job_id
+        }
+    )
+
+def audio_stream_response(source, base_name, ext, target):
+    """Stream source through ffmpeg and return the converted output as a download"""
+    chunks = stream_transcode(source, ext, target)
+    safe = re.sub(r'\W+', '', base_name)
+    return Response(
+        stream_with_context(counted('wav', chunks)),
+        mimetype=target.mime_type,
+        headers={'Content-Disposition': attachment_header(f"{safe or 'audio'}{target.extension}")}
+    )
+
+@app.route('/api/convert/to_wav/stream', methods=['POST'])
+def convert_to_wav_stream_api():
+    """
+    Convert a raw request body (not multipart) to WAV. The body is piped
+    into ffmpeg as it arrives, so nothing is written to disk. Pass the
+    original name as ?filename=song.mp3, and output options as for the
+    upload form (?format=flac&sample_rate=48000, ...).
+    """
+    base_name, ext = os.path.splitext(request.args.get('filename', 'audio.mp3'))
+    if ext.lower() not in STREAMABLE_EXTENSIONS:
+        return f"Streaming conversion supports {', '.join(STREAMABLE_EXTENSIONS)} input only.", 415
+    try:
+        target = target_from_options(request.args)
+    except ValueError as e:
+        return str(e), 400
+    try:
+        # Nothing touches the disk, but the job still counts against the client's quotas
+        admit_request(upload_projected_bytes(WAV_SIZE_RATIO), on_disk=False)
+    except AdmissionDenied as e:
+        record_job('wav', 'rejected')
+        return str(e), e.status, e.headers
+    try:
+        return audio_stream_response(request.stream, base_name, ext, target)
+    except Exception as e:
+        record_job('wav', 'error')
+        logger.exception(f"Error in streamed WAV conversion: {e}")
+        return str(e), 400
+
+_image_pool = None
+
+def get_image_pool():
+    """Process pool for CPU-bound image encoding, created on first use in each worker"""
+    global _image_pool
+    if _image_pool is None:
+        # forkserver: children start from a clean process rather than a
+        # copy of this threaded web worker
+        _image_pool = ProcessPoolExecutor(
+            max_workers=app.config['IMAGE_POOL_WORKERS'],
+            mp_context=multiprocessing.get_context('forkserver')
+        )
+    return _image_pool
+
+def detach_uploads(uploads):
+    """
+    Take ownership of uploaded file streams so they outlive the request.
+
+    Flask closes request.files when the view returns, before a streamed
+    response body is consumed. The caller must close the returned streams.
+    """
+    detached = []
+    for upload in uploads:
+        detached.append((upload.filename, upload.stream))
+        upload.stream = io.BytesIO()
+    return detached
+
+@app.route('/convert/webp_to_png/batch', methods=['POST'])
+def convert_webp_to_png_batch_route():
+    """
+    Convert many WebP images at once. Images are encoded in parallel in
+    the process pool and the ZIP is streamed back in completion order.
+    """
+    try:
+        # Images are encoded in memory and streamed back; only the quotas apply
+        admit_request(upload_projected_bytes(PNG_SIZE_RATIO), on_disk=False)
+    except AdmissionDenied as e:
+        record_job('webp_to_png', 'rejected')
+        return render_template('convert_webp_to_png.html', error=str(e), presets=PNG_PRESETS,
+                               default_preset=app.config['PNG_PRESET']), e.status, e.headers
+    
+    image_files = [f for f in request.files.getlist('image_files') if f.filename]
+    if not image_files:
+        return render_template('convert_webp_to_png.html', error="No selected file", presets=PNG_PRESETS,
+                               default_preset=app.config['PNG_PRESET']), 400
+    
+    preset = request.form.get('preset') or app.config['PNG_PRESET']
+    if preset not in PNG_PRESETS:
+        return render_template('convert_webp_to_png.html', error=f"Unknown PNG preset: {preset}",
+                               presets=PNG_PRESETS, default_preset=app.config['PNG_PRESET']), 400
+    
+    pool = get_image_pool()
+    # Bound memory: only this many uploads are read and in flight at once
+    window = app.config['IMAGE_POOL_WORKERS'] * 2
+    uploads = detach_uploads(image_files)
+    
+    def results():
+        pending = {}
+        queue = iter(uploads)
+        taken = set()
+        errors = []
+        
+        try:
+            while True:
+                for source_name, stream in queue:
+                    with stream:
+                        data = stream.read()
+                    # Pool processes have no metrics recorder; sizes are counted here
+                    record_bytes('webp_to_png', 'in', len(data))
+                    future = pool.submit(convert_webp_bytes_to_png, data, source_name, preset)
+                    pending[future] = source_name
+                    if len(pending) >= window:
+                        break
+                if not pending:
+                    break
+                
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    source_name = pending.pop(future)
+                    try:
+                        download_name, png_bytes = future.result()
+                    except Exception as e:
+                        logger.warning(f"Batch PNG conversion failed for {source_name}: {e}")
+                        record_job('webp_to_png', 'error')
+                        errors.append(f"{source_name}: {e}")
+                        continue
+                    record_job('webp_to_png', 'success')
+                    record_bytes('webp_to_png', 'out', len(png_bytes))
+                    yield unique_name(download_name, taken), png_bytes
+            
+            if errors:
+                yield 'errors.txt', ('\n'.join(errors) + '\n').encode('utf-8')
+        finally:
+            for future in pending:
+                future.cancel()
+            for _, stream in queue:
+                stream.close()
+    
+    return Response(
+        stream_with_context(stream_zip(results())),
+        mimetype='application/zip',
+        headers={'Content-Disposition': attachment_header('converted_png.zip')}
+    )
 
 @app.route('/convert/webp_to_png', methods=['GET', 'POST'])
 def convert_webp_to_png_route():
     error = None
     if request.method == 'POST':
+        try:
+            # Small uploads are converted in memory and never reach the disk
+            admit_request(upload_projected_bytes(PNG_SIZE_RATIO),
+                          on_disk=(request.content_length or 0) > app.config['WEBP_INMEMORY_MAX_BYTES'])
+        except AdmissionDenied as e:
+            record_job('webp_to_png', 'rejected')
+            return render_template('convert_webp_to_png.html', error=str(e), presets=PNG_PRESETS,
+                                   default_preset=app.config['PNG_PRESET']), e.status, e.headers
+        
         if 'image_file' not in request.files:
             error = "No file part"
-            return render_template('convert_webp_to_png.html', error=error)
+            return render_template('convert_webp_to_png.html', error=error, presets=PNG_PRESETS,
+                                   default_preset=app.config['PNG_PRESET'])
             
         image_file = request.files['image_file']
         if image_file.filename == '':
             error = "No selected file"
-            return render_template('convert_webp_to_png.html', error=error)
+            return render_template('convert_webp_to_png.html', error=error, presets=PNG_PRESETS,
+                                   default_preset=app.config['PNG_PRESET'])
+            
+        preset = request.form.get('preset') or app.config['PNG_PRESET']
+        if preset not in PNG_PRESETS:
+            error = f"Unknown PNG preset: {preset}"
+            return render_template('convert_webp_to_png.html', error=error, presets=PNG_PRESETS,
+                                   default_preset=app.config['PNG_PRESET'])
+            
+        if image_file and accepts('webp_to_png', image_file.filename):
+            size = request.content_length or 0
+            if size <= app.config['WEBP_INMEMORY_MAX_BYTES']:
+                # Fast path: decode from the upload stream and encode into memory
+                try:
+                    # The converter only counts output bytes for streams; the parsed upload is seekable
+                    image_file.stream.seek(0, os.SEEK_END)
+                    upload_size = image_file.stream.tell()
+                    image_file.stream.seek(0)
+                    png_buffer, filename = convert_webp_stream_to_png(
+                        image_file.stream, image_file.filename, preset,
+                        spool_max_size=app.config['WEBP_INMEMORY_MAX_BYTES']
+                    )
+                    record_bytes('webp_to_png', 'in', upload_size)
+                    record_job('webp_to_png', 'success')
+                    return send_file(
+                        png_buffer,
+                        mimetype='image/png',
+                        as_attachment=True,
+                        download_name=filename
+                    )
+                except Exception as e:
+                    record_job('webp_to_png', 'error')
+                    error = str(e)
+                    return render_template('convert_webp_to_png.html', error=error, presets=PNG_PRESETS,
+                                           default_preset=app.config['PNG_PRESET'])
             
-        if image_file and image_file.filename.lower().endswith('.webp'):
             try:
                 # Save the uploaded file temporarily
                 uploads_dir = os.path.join(app.static_folder, 'uploads')
                 os.makedirs(uploads_dir, exist_ok=True)
                 temp_path = os.path.join(uploads_dir, image_file.filename)
                 image_file.save(temp_path)
+                reaper.schedule_file(temp_path, app.config['UPLOAD_TTL'])
                 
                 # Convert the file to PNG
-                png_path, filename = convert_webp_to_png(temp_path, app.static_folder)
+                png_path, filename = convert_webp_to_png(temp_path, app.static_folder, preset)
                 
                 # Clean up the temporary file
                 if os.path.exists(temp_path):
                     os.remove(temp_path)
                 
-                # Send the converted file
-                return send_file(
-                    png_path,
-                    mimetype='image/png',
-                    as_attachment=True,
-                    download_name=filename
-                )
+                record_job('webp_to_png', 'success')
+                
+                # Send the converted file; it expires once nobody has fetched it for a while
+                return serve_download(png_path, 'image/png', filename, converter='webp_to_png')
             except Exception as e:
+                record_job('webp_to_png', 'error')
                 error = str(e)
         else:
             error = "Unsupported file format. Please upload a WebP image file."
     
-    return render_template('convert_webp_to_png.html', error=error)
+    return render_template('convert_webp_to_png.html', error=error, presets=PNG_PRESETS,
+                           default_preset=app.config['PNG_PRESET'])
 
-@app.route('/api/youtube/status/<video_id>')
-def youtube_status_api(video_id):
-    """API endpoint to get the current status of a YouTube conversion"""
-    from flask import jsonify
-    
-    status_key = f"yt_{video_id}"
-    response = {
-        "status": "unknown",
-        "progress": 0,
-        "message": "No information available",
-        "complete": False,
-        "file_ready": False,
-        "download_url": None,
-        "error": False
-    }
-    
-    # Check if file exists
-    expected_path = os.path.join(app.static_folder, 'downloads', f"youtube_{video_id}.mp3")
-    
-    if os.path.exists(expected_path):
-        # File already exists, ready for download
-        file_size = os.path.getsize(expected_path)
-        response.update({
-            "status": "complete",
-            "progress": 100,
-            "message": "Your file is ready for download!",
-            "complete": True,
-            "file_ready": True,
-            "download_url": f"/static/downloads/youtube_{video_id}.mp3",
-            "file_size": file_size
-        })
-        logger.debug(f"API status check: File exists for {video_id}, size: {file_size} bytes")
-    elif status_key in conversion_status:
-        # Get status from conversion status dictionary
-        current_status = conversion_status[status_key]
-        
-        # Check if there was an error
-        if current_status.get('error', False):
-            response.update({
-                "status": "error",
-                "message": current_status.get('message', 'An error occurred during conversion'),
-                "error": True,
-                "complete": True
-            })
-            logger.debug(f"API status check: Error state for {video_id}: {response['message']}")
-        else:
-            response.update({
-                "status": "processing" if not current_status.get('complete', False) else "complete",
-                "progress": current_status.get('progress', 0),
-                "message": current_status.get('message', 'Processing...'),
-                "complete": current_status.get('complete', False),
-                "file_ready": current_status.get('complete', False) and os.path.exists(expected_path)
-            })
-            
-            # If complete, add download URL but verify file exists
-            if current_status.get('complete', False):
-                if os.path.exists(expected_path):
-                    response["download_url"] = f"/static/downloads/youtube_{video_id}.mp3"
-                    response["file_ready"] = True
-                else:
-                    # This is a problem - marked complete but file doesn't exist
-                    response["message"] = "Error: File not found. Please try again."
-                    response["error"] = True
-                    logger.warning(f"API status check: File missing for completed conversion {video_id}")
-            
-            logger.debug(f"API status check: Status for {video_id}: {response['status']}, progress: {response['progress']}%")
-    else:
-        logger.warning(f"API status check: No status found for {video_id}")
-    
-    return jsonify(response)
-    
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
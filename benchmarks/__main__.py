@@ -0,0 +1,154 @@
+"""
+Offline benchmarks for the converters and Flask routes.
+
+    python -m benchmarks                      # full run
+    python -m benchmarks --quick --only wav   # small inputs, matching cases
+    python -m benchmarks --save baseline.json
+    python -m benchmarks --compare baseline.json --threshold 10
+
+Inputs are generated locally and YouTube/TikTok are replaced by a local
+HTTP server, so no network access is needed.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from .cases import all_cases
+from .fixtures import ensure_fixtures
+from .harness import run_isolated
+from .standin import StandInServer
+
+COLUMNS = [
+    ('ops/s', 'ops_per_s', '{:.2f}'),
+    ('MB/s', 'mb_per_s', '{:.1f}'),
+    ('p50 ms', 'p50_ms', '{:.1f}'),
+    ('p90 ms', 'p90_ms', '{:.1f}'),
+    ('p99 ms', 'p99_ms', '{:.1f}'),
+    ('CPU s', 'cpu_s', '{:.2f}'),
+    ('RSS MB', 'peak_rss_mb', '{:.0f}'),
+    ('child MB', 'peak_child_rss_mb', '{:.0f}'),
+    ('read MB', 'disk_read_mb', '{:.1f}'),
+    ('write MB', 'disk_write_mb', '{:.1f}'),
+    ('errors', 'errors', '{}'),
+]
+
+
+def print_table(results: Dict[str, Dict[str, Any]]):
+    width = max([len(name) for name in results] + [4])
+    print('case'.ljust(width) + ''.join(title.rjust(10) for title, _, _ in COLUMNS))
+    for name, result in results.items():
+        if 'failed' in result:
+            print(name.ljust(width) + f"  FAILED: {result['failed']}")
+            continue
+        print(name.ljust(width) + ''.join(fmt.format(result[key]).rjust(10) for _, key, fmt in COLUMNS))
+        if result.get('first_error'):
+            print(' ' * width + f"  first error: {result['first_error']}")
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], threshold: float) -> List[str]:
+    """
+    Print throughput and latency changes against a saved run and return the
+    names of cases that got worse by more than threshold percent.
+    """
+    def change(new, old):
+        return (new - old) / old * 100 if old else 0.0
+
+    regressions = []
+    width = max([len(name) for name in results] + [4])
+    print('case'.ljust(width) + 'ops/s'.rjust(12) + 'p50'.rjust(12) + 'p99'.rjust(12) + 'RSS'.rjust(12))
+    for name, result in results.items():
+        old = baseline.get(name)
+        if old is None or 'failed' in result or 'failed' in old:
+            continue
+        deltas = {
+            'ops/s': change(result['ops_per_s'], old['ops_per_s']),
+            'p50': change(result['p50_ms'], old['p50_ms']),
+            'p99': change(result['p99_ms'], old['p99_ms']),
+            'RSS': change(result['peak_rss_mb'], old['peak_rss_mb']),
+        }
+        # Lower throughput or higher median latency counts as a regression;
+        # p99 and memory are shown but too noisy on short runs to gate on
+        worse = deltas['ops/s'] < -threshold or deltas['p50'] > threshold
+        if worse:
+            regressions.append(name)
+        print(name.ljust(width) + ''.join(f"{value:+.1f}%".rjust(12) for value in deltas.values())
+              + ('  REGRESSION' if worse else ''))
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Offline converter and route benchmarks')
+    parser.add_argument('--quick', action='store_true', help='small inputs and few iterations')
+    parser.add_argument('--only', action='append', default=[], metavar='TEXT',
+                        help='run cases whose name contains TEXT (repeatable)')
+    parser.add_argument('--list', action='store_true', help='list case names and exit')
+    parser.add_argument('--iterations', type=int, help='override iterations per case')
+    parser.add_argument('--concurrency', type=int, help='override concurrent operations per case')
+    parser.add_argument('--warmup', type=int, default=1, help='untimed runs before measuring (default 1)')
+    parser.add_argument('--timeout', type=float, default=1800, help='seconds allowed per case (default 1800)')
+    parser.add_argument('--fixtures', default=os.path.join(tempfile.gettempdir(), 'webconverters-bench-fixtures'),
+                        help='where generated inputs are kept between runs')
+    parser.add_argument('--save', metavar='PATH', help='write results as JSON, e.g. to use as a baseline')
+    parser.add_argument('--compare', metavar='PATH', help='compare with results saved by --save')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='percent change counted as a regression in --compare (default 10)')
+    args = parser.parse_args(argv)
+
+    cases = [case for case in all_cases(args.quick)
+             if not args.only or any(text in case.name for text in args.only)]
+    if args.list:
+        for case in cases:
+            print(case.name)
+        return 0
+    if not cases:
+        print('No cases match', file=sys.stderr)
+        return 2
+
+    print(f"Preparing fixtures in {args.fixtures}...", file=sys.stderr)
+    fixtures = ensure_fixtures(args.fixtures)
+    results: Dict[str, Dict[str, Any]] = {}
+    with StandInServer(args.fixtures, os.path.basename(fixtures['mp3_medium'])) as server:
+        context = {'fixtures': fixtures, 'base_url': server.base_url}
+        for case in cases:
+            iterations = args.iterations or case.iterations
+            concurrency = args.concurrency or case.concurrency
+            print(f"{case.name}: {iterations} runs x{concurrency}", file=sys.stderr)
+            try:
+                results[case.name] = run_isolated(case.setup, (context, case.param), iterations, concurrency,
+                                                  args.warmup, args.timeout)
+            except Exception as e:
+                results[case.name] = {'failed': str(e)}
+
+    print()
+    print_table(results)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({
+                'created_at': time.time(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+                'quick': args.quick,
+                'results': results,
+            }, f, indent=2)
+        print(f"\nSaved results to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\nChange against {args.compare}:")
+        regressions = compare(results, baseline['results'], args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} case(s) regressed by more than {args.threshold:g}%")
+            return 1
+    return 1 if any('failed' in result for result in results.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,361 @@
+import io
+import logging
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional
+
+from .harness import Operation
+
+# Passed to every case: {'fixtures': {name: path}, 'base_url': stand-in server URL}
+Context = Dict[str, Any]
+
+
+class Case(NamedTuple):
+    name: str
+    setup: Callable[..., Any]
+    param: Any
+    iterations: int
+    concurrency: int = 1
+
+
+def _media_url(ctx: Context, fixture: str, run: int) -> str:
+    # A query per run gives every iteration its own metadata cache entry,
+    # like a first request for a new video
+    return f"{ctx['base_url']}/media/{os.path.basename(ctx['fixtures'][fixture])}?run={run}"
+
+
+def _prepare_ytdl():
+    from convertors import ytdl
+
+    if not os.path.exists(ytdl.FFMPEG_LOCATION):
+        ytdl.FFMPEG_LOCATION = shutil.which('ffmpeg') or ytdl.FFMPEG_LOCATION
+
+
+@contextmanager
+def _workdir() -> Iterator[str]:
+    path = tempfile.mkdtemp(prefix='webconverters-bench-')
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+@contextmanager
+def _output_folder(root: str) -> Iterator[str]:
+    # Converters name outputs after their input, so concurrent runs get their own folder
+    path = tempfile.mkdtemp(dir=root)
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+# Converters, called directly
+
+@contextmanager
+def webp_to_png(ctx: Context, fixture: str) -> Iterator[Operation]:
+    from convertors.webp_to_png import convert_webp_to_png
+
+    source = ctx['fixtures'][fixture]
+    with _workdir() as root:
+        def op(i):
+            with _output_folder(root) as static:
+                convert_webp_to_png(source, static)
+            return os.path.getsize(source)
+        yield op
+
+
+@contextmanager
+def webp_stream_to_png(ctx: Context, fixture: str) -> Iterator[Operation]:
+    from convertors.webp_to_png import convert_webp_stream_to_png
+
+    source = ctx['fixtures'][fixture]
+
+    def op(i):
+        with open(source, 'rb') as stream:
+            buffer, _ = convert_webp_stream_to_png(stream, os.path.basename(source))
+        buffer.close()
+        return os.path.getsize(source)
+    yield op
+
+
+@contextmanager
+def to_wav(ctx: Context, fixture: str) -> Iterator[Operation]:
+    from convertors.mp3_to_wav import convert_to_wav
+
+    source = ctx['fixtures'][fixture]
+    with _workdir() as root:
+        def op(i):
+            with _output_folder(root) as static:
+                convert_to_wav(source, static)
+            return os.path.getsize(source)
+        yield op
+
+
+@contextmanager
+def transcode_audio(ctx: Context, param) -> Iterator[Operation]:
+    # Other targets of the audio engine; ('m4a_short', {'format': 'm4a'}) is a stream copy
+    from convertors.audio import target_from_options, transcode_audio as convert
+
+    fixture, options = param
+    source = ctx['fixtures'][fixture]
+    target = target_from_options(options)
+    with _workdir() as root:
+        def op(i):
+            with _output_folder(root) as static:
+                convert(source, static, target)
+            return os.path.getsize(source)
+        yield op
+
+
+@contextmanager
+def stream_to_wav(ctx: Context, fixture: str) -> Iterator[Operation]:
+    from convertors.mp3_to_wav import stream_to_wav as convert
+
+    source = ctx['fixtures'][fixture]
+
+    def op(i):
+        with open(source, 'rb') as stream:
+            for _ in convert(stream, os.path.splitext(source)[1]):
+                pass
+        return os.path.getsize(source)
+    yield op
+
+
+@contextmanager
+def tiktok_to_mp3(ctx: Context, fixture: str) -> Iterator[Operation]:
+    from convertors.tiktok_mp3 import convert_tiktok_to_mp3
+
+    media = os.path.basename(ctx['fixtures'][fixture])
+    with _workdir() as root:
+        def op(i):
+            with _output_folder(root) as static:
+                # A new page each time, so the page resolution isn't cached
+                path, _ = convert_tiktok_to_mp3(f"{ctx['base_url']}/music/sound-{i}?media={media}", static)
+                return os.path.getsize(path)
+        yield op
+
+
+@contextmanager
+def youtube_audio(ctx: Context, param) -> Iterator[Operation]:
+    from convertors.youtube_mp3 import convert_youtube_to_mp3
+
+    _prepare_ytdl()
+    fixture, audio_format = param
+    with _workdir() as root:
+        def op(i):
+            with _output_folder(root) as static:
+                convert_youtube_to_mp3(_media_url(ctx, fixture, i), static, None, audio_format)
+            return os.path.getsize(ctx['fixtures'][fixture])
+        yield op
+
+
+@contextmanager
+def youtube_mp4(ctx: Context, fixture: str) -> Iterator[Operation]:
+    from convertors.youtube_mp4 import convert_youtube_to_mp4
+
+    _prepare_ytdl()
+    with _workdir() as root:
+        def op(i):
+            with _output_folder(root) as static:
+                convert_youtube_to_mp4(_media_url(ctx, fixture, i), static)
+            return os.path.getsize(ctx['fixtures'][fixture])
+        yield op
+
+
+# Flask routes, through the test client
+
+def app_environment(root: str) -> Dict[str, str]:
+    """Settings that keep the app's databases under root and switch off admission limits"""
+    return {
+        'STATUS_STORE': f"sqlite:///{os.path.join(root, 'status.db')}",
+        'RESULT_CACHE_INDEX': os.path.join(root, 'cache.db'),
+        'ADMISSION_DB': os.path.join(root, 'admission.db'),
+        'METRICS_DB': os.path.join(root, 'metrics.db'),
+        'MIN_FREE_BYTES': '0',
+        'CLIENT_MAX_JOBS': '0',
+        'CLIENT_MAX_BYTES': '0',
+    }
+
+
+@contextmanager
+def _client():
+    """
+    Import the app with its databases in a scratch directory and without
+    admission limits, and remove whatever the routes leave in the static
+    folder afterwards.
+    """
+    with _workdir() as root:
+        os.environ.update(app_environment(root))
+        import app as webapp
+
+        logging.getLogger().setLevel(logging.WARNING)
+        folders = [os.path.join(webapp.app.static_folder, name) for name in ('downloads', 'uploads')]
+        before = {folder: set(os.listdir(folder)) if os.path.isdir(folder) else set() for folder in folders}
+        try:
+            yield webapp, webapp.app.test_client()
+        finally:
+            for folder in folders:
+                if os.path.isdir(folder):
+                    for name in set(os.listdir(folder)) - before[folder]:
+                        path = os.path.join(folder, name)
+                        if os.path.isfile(path):
+                            os.remove(path)
+
+
+def _upload(path: str, name: Optional[str] = None):
+    with open(path, 'rb') as f:
+        return io.BytesIO(f.read()), name or os.path.basename(path)
+
+
+def _check(response, route: str) -> int:
+    # Reading the body runs streamed responses to completion
+    body = response.get_data()
+    response.close()
+    if response.status_code != 200:
+        raise RuntimeError(f"{route} answered {response.status_code}: {body[:200]!r}")
+    return len(body)
+
+
+@contextmanager
+def route_webp_to_png(ctx: Context, fixture: str) -> Iterator[Operation]:
+    source = ctx['fixtures'][fixture]
+    with _client() as (_, client):
+        def op(i):
+            _check(client.post('/convert/webp_to_png', data={'image_file': _upload(source)},
+                               content_type='multipart/form-data'), '/convert/webp_to_png')
+            return os.path.getsize(source)
+        yield op
+
+
+@contextmanager
+def route_webp_to_png_batch(ctx: Context, param) -> Iterator[Operation]:
+    fixture, count = param
+    source = ctx['fixtures'][fixture]
+    with _client() as (_, client):
+        def op(i):
+            files = [_upload(source, f"image{n}.webp") for n in range(count)]
+            _check(client.post('/convert/webp_to_png/batch', data={'image_files': files},
+                               content_type='multipart/form-data'), '/convert/webp_to_png/batch')
+            return os.path.getsize(source) * count
+        yield op
+
+
+@contextmanager
+def route_to_wav(ctx: Context, fixture: str) -> Iterator[Operation]:
+    # MP3 uploads are piped through ffmpeg; M4A uploads go through disk
+    source = ctx['fixtures'][fixture]
+    with _client() as (_, client):
+        def op(i):
+            _check(client.post('/convert/to_wav', data={'audio_file': _upload(source)},
+                               content_type='multipart/form-data'), '/convert/to_wav')
+            return os.path.getsize(source)
+        yield op
+
+
+@contextmanager
+def route_to_wav_batch(ctx: Context, param) -> Iterator[Operation]:
+    fixture, count = param
+    source = ctx['fixtures'][fixture]
+    ext = os.path.splitext(source)[1]
+    with _client() as (_, client):
+        def op(i):
+            files = [_upload(source, f"audio{n}{ext}") for n in range(count)]
+            _check(client.post('/convert/to_wav/batch', data={'audio_files': files},
+                               content_type='multipart/form-data'), '/convert/to_wav/batch')
+            return os.path.getsize(source) * count
+        yield op
+
+
+@contextmanager
+def route_to_wav_stream(ctx: Context, fixture: str) -> Iterator[Operation]:
+    source = ctx['fixtures'][fixture]
+    with open(source, 'rb') as f:
+        data = f.read()
+    with _client() as (_, client):
+        def op(i):
+            _check(client.post(f'/api/convert/to_wav/stream?filename={os.path.basename(source)}', data=data,
+                               content_type='application/octet-stream'), '/api/convert/to_wav/stream')
+            return len(data)
+        yield op
+
+
+@contextmanager
+def route_tiktok_mp3(ctx: Context, param) -> Iterator[Operation]:
+    fixture, cached = param
+    media = os.path.basename(ctx['fixtures'][fixture])
+    with _client() as (_, client):
+        def op(i):
+            # Cached runs repeat one page (served from the result cache after warm-up)
+            slug = 'sound' if cached else f"sound-{i}"
+            url = f"{ctx['base_url']}/music/{slug}?media={media}"
+            return _check(client.post('/tiktok/mp3', data={'url': url}), '/tiktok/mp3')
+        yield op
+
+
+@contextmanager
+def route_youtube_download(ctx: Context, param) -> Iterator[Operation]:
+    fixture, audio_format = param
+    from convertors.youtube_mp3 import convert_youtube_to_mp3
+
+    _prepare_ytdl()
+    video_id = 'benchmark01'
+    with _client() as (webapp, client):
+        # Convert once and register the result the way a finished job does
+        path, name = convert_youtube_to_mp3(_media_url(ctx, fixture, 0), webapp.app.static_folder, None,
+                                            audio_format)
+        webapp.result_cache.put(webapp.audio_cache_key(video_id, audio_format), path,
+                                f"youtube_{video_id}.{audio_format}", name)
+        query = '' if audio_format == 'mp3' else f'?format={audio_format}'
+
+        def op(i):
+            return _check(client.get(f'/youtube/mp3/download/{video_id}{query}'), '/youtube/mp3/download')
+        yield op
+
+
+@contextmanager
+def route_get(ctx: Context, path: str) -> Iterator[Operation]:
+    with _client() as (_, client):
+        def op(i):
+            _check(client.get(path), path)
+            return 0
+        yield op
+
+
+def all_cases(quick: bool = False) -> List[Case]:
+    """Every benchmark case; quick keeps the small inputs and fewer iterations"""
+    n = 3 if quick else 10
+    webp = ['webp_small'] if quick else ['webp_small', 'webp_medium', 'webp_large']
+    mp3 = ['mp3_short'] if quick else ['mp3_short', 'mp3_medium', 'mp3_long']
+    m4a = 'm4a_short' if quick else 'm4a_medium'
+    cases = []
+    for fixture in webp:
+        cases.append(Case(f'converter/webp_to_png/{fixture}', webp_to_png, fixture, n))
+        cases.append(Case(f'converter/webp_stream_to_png/{fixture}', webp_stream_to_png, fixture, n))
+        cases.append(Case(f'route/webp_to_png/{fixture}', route_webp_to_png, fixture, n))
+    batch_webp = 'webp_small' if quick else 'webp_medium'
+    cases.append(Case(f'route/webp_to_png_batch/8x_{batch_webp}', route_webp_to_png_batch, (batch_webp, 8), n))
+    for fixture in mp3:
+        cases.append(Case(f'converter/to_wav/{fixture}', to_wav, fixture, n))
+        cases.append(Case(f'converter/stream_to_wav/{fixture}', stream_to_wav, fixture, n))
+        cases.append(Case(f'route/to_wav/{fixture}', route_to_wav, fixture, n))
+        cases.append(Case(f'route/to_wav_stream/{fixture}', route_to_wav_stream, fixture, n))
+    cases.append(Case(f'converter/to_wav/{m4a}', to_wav, m4a, n))
+    cases.append(Case(f'route/to_wav/{m4a}', route_to_wav, m4a, n))
+    for fixture, options in (('mp3_short', {'format': 'flac'}), ('mp3_short', {'format': 'opus', 'bitrate': '96'}),
+                             (m4a, {'format': 'mp3'}), (m4a, {'format': 'm4a'})):
+        label = '_'.join(options.values())
+        cases.append(Case(f'converter/transcode_audio/{fixture}_to_{label}', transcode_audio, (fixture, options), n))
+    cases.append(Case('route/to_wav_batch/4x_mp3_short', route_to_wav_batch, ('mp3_short', 4), n))
+    cases.append(Case('converter/tiktok_to_mp3/mp3_medium', tiktok_to_mp3, 'mp3_medium', n))
+    cases.append(Case('route/tiktok_mp3/cold', route_tiktok_mp3, ('mp3_medium', False), n))
+    cases.append(Case('route/tiktok_mp3/cached', route_tiktok_mp3, ('mp3_medium', True), n))
+    cases.append(Case(f'converter/youtube_mp3/{m4a}', youtube_audio, (m4a, 'mp3'), n))
+    cases.append(Case(f'converter/youtube_m4a/{m4a}', youtube_audio, (m4a, 'm4a'), n))
+    cases.append(Case('converter/youtube_mp4/mp4_clip', youtube_mp4, 'mp4_clip', max(2, n // 3)))
+    cases.append(Case(f'route/youtube_mp3_download/{m4a}', route_youtube_download, (m4a, 'mp3'), n * 5))
+    cases.append(Case('route/job_status', route_get, '/api/youtube/mp4/status/benchmark01', n * 20, 4))
+    cases.append(Case('route/metrics', route_get, '/metrics', n * 5))
+    return cases
@@ -0,0 +1,88 @@
+import os
+import random
+import subprocess
+from typing import Dict, Tuple
+
+from PIL import Image
+
+# name -> (width, height). Noise keeps the images from compressing to
+# nothing, so encode times resemble real photos rather than flat colour.
+WEBP_SIZES: Dict[str, Tuple[int, int]] = {
+    'small': (320, 240),
+    'medium': (1280, 960),
+    'large': (3840, 2160),
+}
+
+# name -> seconds of audio
+AUDIO_DURATIONS: Dict[str, int] = {
+    'short': 15,
+    'medium': 120,
+    'long': 600,
+}
+
+# Seconds of the H.264/AAC clip used as a YouTube MP4 source
+VIDEO_DURATION = 20
+
+SEED = 1234
+
+
+def _run(args):
+    subprocess.run(['ffmpeg', '-hide_banner', '-loglevel', 'error', '-y'] + args, check=True)
+
+
+def _make_webp(path: str, size: Tuple[int, int]):
+    rnd = random.Random(SEED)
+    width, height = size
+    # Smooth gradient with a little grain on top
+    noise = Image.frombytes('L', (width, height), rnd.randbytes(width * height))
+    gradient = Image.linear_gradient('L').resize((width, height))
+    image = Image.merge('RGB', (gradient, noise.point(lambda v: v // 4 + 96), gradient.transpose(Image.FLIP_LEFT_RIGHT)))
+    image.save(path, format='WEBP', quality=80)
+
+
+def _make_audio(path: str, seconds: int, codec_args):
+    # Two tones an octave apart, stereo, so encoders have something to work on
+    _run([
+        '-f', 'lavfi', '-i', f'sine=frequency=440:sample_rate=44100:duration={seconds}',
+        '-f', 'lavfi', '-i', f'sine=frequency=880:sample_rate=44100:duration={seconds}',
+        '-filter_complex', '[0:a][1:a]amerge=inputs=2[a]', '-map', '[a]',
+    ] + codec_args + [path])
+
+
+def _make_video(path: str, seconds: int):
+    _run([
+        '-f', 'lavfi', '-i', f'testsrc2=size=1280x720:rate=30:duration={seconds}',
+        '-f', 'lavfi', '-i', f'sine=frequency=440:sample_rate=44100:duration={seconds}',
+        '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p',
+        '-c:a', 'aac', '-b:a', '128k', '-ac', '2', '-shortest', '-movflags', '+faststart', path
+    ])
+
+
+def ensure_fixtures(directory: str) -> Dict[str, str]:
+    """
+    Generate the benchmark inputs in directory unless they already exist
+    and return {fixture name: path}. Contents are deterministic, so runs on
+    the same machine compare like with like.
+
+    Names: webp_<size>, mp3_<duration>, m4a_<duration> and mp4_clip.
+    """
+    os.makedirs(directory, exist_ok=True)
+    fixtures = {}
+
+    def build(name, filename, make, *args):
+        path = os.path.join(directory, filename)
+        if not os.path.exists(path):
+            partial = path + '.part' + os.path.splitext(filename)[1]
+            make(partial, *args)
+            os.replace(partial, path)
+        fixtures[name] = path
+
+    for name, size in WEBP_SIZES.items():
+        build(f'webp_{name}', f'{name}.webp', _make_webp, size)
+    for name, seconds in AUDIO_DURATIONS.items():
+        build(f'mp3_{name}', f'{name}.mp3', _make_audio, seconds, ['-c:a', 'libmp3lame', '-b:a', '128k'])
+        # Index up front, as hosted media is; the pipelined YouTube path needs it
+        build(f'm4a_{name}', f'{name}.m4a', _make_audio, seconds,
+              ['-c:a', 'aac', '-b:a', '128k', '-movflags', '+faststart'])
+    build('mp4_clip', 'clip.mp4', _make_video, VIDEO_DURATION)
+    return fixtures
@@ -0,0 +1,162 @@
+import math
+import multiprocessing
+import os
+import queue
+import resource
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, ContextManager, Dict, List, Optional
+
+# Operation under test: called with the iteration number, returns the
+# number of input bytes it processed (0 if that doesn't apply)
+Operation = Callable[[int], int]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of values (0 for an empty list)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), math.ceil(pct / 100 * len(ordered))))
+    return ordered[rank - 1]
+
+
+def _proc_io() -> Dict[str, int]:
+    # Bytes this process actually caused to be read from / written to storage (Linux only)
+    try:
+        with open('/proc/self/io') as f:
+            fields = dict(line.split(':', 1) for line in f)
+        return {'read': int(fields['read_bytes']), 'write': int(fields['write_bytes'])}
+    except (OSError, KeyError, ValueError):
+        return {'read': 0, 'write': 0}
+
+
+def _usage():
+    return resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+
+
+def _maxrss_bytes(usage) -> int:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return usage.ru_maxrss if os.uname().sysname == 'Darwin' else usage.ru_maxrss * 1024
+
+
+def measure(op: Operation, iterations: int, concurrency: int = 1, warmup: int = 1) -> Dict[str, Any]:
+    """
+    Run op iterations times on concurrency threads and return timings and
+    resource usage.
+
+    Peak RSS is a high-water mark for the whole process, so each case should
+    run in a fresh process (see run_isolated). Child processes (ffmpeg) are
+    reported separately: their peak is the largest single child (an upper
+    bound, as it may include the interpreter pages present before exec) and
+    their disk I/O comes from block counts, since /proc/self/io excludes them.
+    """
+    for i in range(warmup):
+        op(-1 - i)
+
+    latencies: List[float] = []
+    errors: List[str] = []
+    processed = [0]
+    lock = threading.Lock()
+
+    def timed(i: int):
+        started = time.perf_counter()
+        try:
+            count = op(i) or 0
+        except Exception as e:
+            with lock:
+                errors.append(f"{type(e).__name__}: {e}")
+            return
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            processed[0] += count
+
+    io_before = _proc_io()
+    self_before, children_before = _usage()
+    started = time.perf_counter()
+    if concurrency <= 1:
+        for i in range(iterations):
+            timed(i)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(timed, range(iterations)))
+    wall = time.perf_counter() - started
+    self_after, children_after = _usage()
+    io_after = _proc_io()
+
+    completed = len(latencies)
+    return {
+        'iterations': iterations,
+        'concurrency': concurrency,
+        'completed': completed,
+        'errors': len(errors),
+        'first_error': errors[0] if errors else None,
+        'wall_s': wall,
+        'ops_per_s': completed / wall if wall else 0.0,
+        'mb_per_s': processed[0] / wall / 1024 ** 2 if wall else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p90_ms': percentile(latencies, 90) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'max_ms': max(latencies) * 1000 if latencies else 0.0,
+        'cpu_s': (self_after.ru_utime - self_before.ru_utime + self_after.ru_stime - self_before.ru_stime
+                  + children_after.ru_utime - children_before.ru_utime
+                  + children_after.ru_stime - children_before.ru_stime),
+        'peak_rss_mb': _maxrss_bytes(self_after) / 1024 ** 2,
+        'peak_child_rss_mb': _maxrss_bytes(children_after) / 1024 ** 2,
+        'disk_read_mb': (io_after['read'] - io_before['read']
+                         + (children_after.ru_inblock - children_before.ru_inblock) * 512) / 1024 ** 2,
+        'disk_write_mb': (io_after['write'] - io_before['write']
+                          + (children_after.ru_oublock - children_before.ru_oublock) * 512) / 1024 ** 2,
+    }
+
+
+def _isolated_entry(results, setup: Callable[..., ContextManager[Operation]], args: tuple, iterations: int,
+                    concurrency: int, warmup: int):
+    # The report goes to the parent's stdout, which this process shares; keep
+    # stray output (yt-dlp's, when YDL_VERBOSE=1) from landing in the table
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        with setup(*args) as op:
+            measurement = measure(op, iterations, concurrency, warmup)
+        results.put(('ok', measurement))
+    except BaseException as e:
+        results.put(('error', f"{type(e).__name__}: {e}"))
+    # Skip interpreter shutdown: the app's reaper thread and process pools
+    # aren't part of the measurement and can hold up a normal exit
+    results.close()
+    results.join_thread()
+    os._exit(0)
+
+
+def run_isolated(setup: Callable[..., ContextManager[Operation]], args: tuple, iterations: int,
+                 concurrency: int = 1, warmup: int = 1, timeout: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Measure a case in a fresh interpreter, so imports, caches and peak
+    memory of one case don't leak into the next. setup(*args) is a context
+    manager yielding the operation and cleaning up after it; it must be
+    importable (a module-level function).
+    """
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    process = ctx.Process(target=_isolated_entry, args=(results, setup, args, iterations, concurrency, warmup))
+    process.start()
+    deadline = time.monotonic() + timeout if timeout else None
+    try:
+        while True:
+            try:
+                status, payload = results.get(timeout=1)
+                break
+            except queue.Empty:
+                if not process.is_alive():
+                    raise RuntimeError(f"Benchmark process exited with code {process.exitcode}")
+                if deadline is not None and time.monotonic() > deadline:
+                    process.kill()
+                    raise RuntimeError(f"Benchmark did not finish within {timeout} seconds")
+    finally:
+        process.join(timeout=10)
+    if status != 'ok':
+        raise RuntimeError(payload)
+    return payload
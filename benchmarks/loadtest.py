@@ -0,0 +1,461 @@
+"""
+Mixed-traffic load test against the app running under gunicorn, comparing
+worker configurations.
+
+    python -m benchmarks.loadtest                          # sync, gthread, gevent
+    python -m benchmarks.loadtest --config gthread --duration 60 --pollers 400
+    python -m benchmarks.loadtest --save loadtest.json
+
+Each configuration gets a fresh gunicorn (see benchmarks.loadtest_app: the
+YouTube download is a stand-in, WAV conversions run on generated fixtures)
+and the same traffic:
+
+- pollers hitting the YouTube status APIs, one job or a batch per request
+- video clients submitting MP4 jobs and following their event streams
+- uploaders sending MP3s to /convert/to_wav at a throttled rate, like
+  clients on slow links
+- a canary loading the home page
+
+Short requests (polls and the canary) slower than --starvation-ms or timing
+out count as starved: the symptom of every worker being tied up by streams
+and uploads. WORKER TIMEOUT lines in gunicorn's log are counted as well.
+"""
+import argparse
+import http.client
+import importlib.util
+import json
+import os
+import random
+import shutil
+import socket
+import string
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from .cases import app_environment
+from .fixtures import ensure_fixtures
+from .harness import percentile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Worker configurations: name -> (extra gunicorn arguments, module the worker class needs)
+CONFIGS: Dict[str, Tuple[List[str], Optional[str]]] = {
+    'sync': (['--worker-class', 'sync'], None),
+    'gthread': (['--worker-class', 'gthread'], None),
+    'gevent': (['--worker-class', 'gevent', '--worker-connections', '1000'], 'gevent'),
+    'eventlet': (['--worker-class', 'eventlet', '--worker-connections', '1000'], 'eventlet'),
+}
+
+# Request kinds whose latency shows whether workers are free to take new work
+SHORT_KINDS = ('poll', 'canary')
+
+KIND_ORDER = ('poll', 'canary', 'submit', 'events', 'upload')
+
+
+class Recorder:
+    """Thread-safe collection of request outcomes inside the measurement window"""
+
+    def __init__(self, window_start: float, window_end: float):
+        self.window_start = window_start
+        self.window_end = window_end
+        self._lock = threading.Lock()
+        self.samples: Dict[str, List[Tuple[float, str]]] = {}
+        self.first_errors: Dict[str, str] = {}
+
+    def record(self, kind: str, started: float, latency: float, outcome: str, detail: Optional[str] = None):
+        # outcome: 'ok', 'error' or 'timeout'
+        if not self.window_start <= started < self.window_end:
+            return
+        with self._lock:
+            self.samples.setdefault(kind, []).append((latency, outcome))
+            if outcome != 'ok' and detail and kind not in self.first_errors:
+                self.first_errors[kind] = detail
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _video_id() -> str:
+    # 11 characters, like a YouTube ID; the prefix makes load-test jobs recognisable
+    return 'lt' + ''.join(random.choice(string.ascii_letters + string.digits) for _ in range(9))
+
+
+class Traffic:
+    """Client threads generating the mixed workload against one server"""
+
+    def __init__(self, base: Tuple[str, int], args, upload_path: str, recorder: Recorder, stop: threading.Event):
+        self.host, self.port = base
+        self.args = args
+        self.recorder = recorder
+        self.stop = stop
+        self.active_ids: List[str] = []
+        self._ids_lock = threading.Lock()
+        with open(upload_path, 'rb') as f:
+            data = f.read()
+        self.boundary = uuid.uuid4().hex
+        self.upload_body = (
+            f"--{self.boundary}\r\n"
+            f'Content-Disposition: form-data; name="audio_file"; filename="{os.path.basename(upload_path)}"\r\n'
+            "Content-Type: audio/mpeg\r\n\r\n"
+        ).encode() + data + f"\r\n--{self.boundary}--\r\n".encode()
+
+    def _connection(self, timeout: float) -> http.client.HTTPConnection:
+        return http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+
+    def _timed(self, kind: str, call, ok_status=(200,)):
+        """Run call(conn) -> status, recording latency and outcome under kind"""
+        started = time.time()
+        clock = time.perf_counter()
+        conn = self._connection(self.args.request_timeout)
+        try:
+            status = call(conn)
+            outcome = 'ok' if status in ok_status else 'error'
+            detail = f"HTTP {status}"
+        except (socket.timeout, TimeoutError) as e:
+            outcome, detail = 'timeout', f"{type(e).__name__}: {e}"
+        except (OSError, http.client.HTTPException) as e:
+            outcome, detail = 'error', f"{type(e).__name__}: {e}"
+        finally:
+            conn.close()
+        self.recorder.record(kind, started, time.perf_counter() - clock, outcome, detail)
+        return outcome
+
+    def _get(self, path: str):
+        def call(conn):
+            conn.request('GET', path)
+            response = conn.getresponse()
+            response.read()
+            return response.status
+        return call
+
+    def _sleep(self, seconds: float):
+        self.stop.wait(seconds)
+
+    def poller(self):
+        # Spread the first polls over the interval instead of a thundering herd
+        self._sleep(random.uniform(0, self.args.poll_interval))
+        while not self.stop.is_set():
+            with self._ids_lock:
+                video_id = random.choice(self.active_ids) if self.active_ids else _video_id()
+                batch = random.sample(self.active_ids, min(len(self.active_ids), 10))
+            choice = random.random()
+            if choice < 1 / 3:
+                path = f"/api/youtube/mp4/status/{video_id}"
+            elif choice < 2 / 3:
+                path = f"/api/youtube/status/{video_id}"
+            else:
+                path = f"/api/jobs/status?ids={','.join(f'yt_mp4_{video_id}' for video_id in batch or [video_id])}"
+            self._timed('poll', self._get(path))
+            self._sleep(self.args.poll_interval * random.uniform(0.8, 1.2))
+
+    def canary(self):
+        while not self.stop.is_set():
+            self._timed('canary', self._get('/'))
+            self._sleep(0.5)
+
+    def video_client(self):
+        while not self.stop.is_set():
+            video_id = _video_id()
+
+            def submit(conn):
+                body = f"url=https://www.youtube.com/watch?v={video_id}"
+                conn.request('POST', '/youtube/mp4', body=body,
+                             headers={'Content-Type': 'application/x-www-form-urlencoded'})
+                response = conn.getresponse()
+                response.read()
+                return response.status
+
+            if self._timed('submit', submit, ok_status=(302, 303)) != 'ok':
+                self._sleep(1)
+                continue
+            with self._ids_lock:
+                self.active_ids.append(video_id)
+            try:
+                self._follow_events(f"yt_mp4_{video_id}")
+            finally:
+                with self._ids_lock:
+                    self.active_ids.remove(video_id)
+
+    def _follow_events(self, job_id: str):
+        """Hold the job's event stream until it ends, reconnecting as a browser would"""
+        # Keep-alive comments arrive every SSE_HEARTBEAT seconds, so allow at least two
+        timeout = max(self.args.request_timeout, self.args.sse_heartbeat * 2 + 1)
+        while not self.stop.is_set():
+            started = time.time()
+            clock = time.perf_counter()
+            conn = self._connection(timeout)
+            ended = False
+            try:
+                conn.request('GET', f"/api/jobs/{job_id}/events")
+                response = conn.getresponse()
+                if response.status != 200:
+                    response.read()
+                    self.recorder.record('events', started, time.perf_counter() - clock, 'error',
+                                         f"HTTP {response.status}")
+                    return
+                # Latency of a stream is the wait for its first event
+                first = True
+                while not self.stop.is_set():
+                    line = response.fp.readline()
+                    if not line:
+                        break
+                    if first:
+                        self.recorder.record('events', started, time.perf_counter() - clock, 'ok')
+                        first = False
+                    if line.startswith(b'event: end'):
+                        ended = True
+                        break
+            except (socket.timeout, TimeoutError) as e:
+                self.recorder.record('events', started, time.perf_counter() - clock, 'timeout',
+                                     f"{type(e).__name__}: {e}")
+            except (OSError, http.client.HTTPException) as e:
+                self.recorder.record('events', started, time.perf_counter() - clock, 'error',
+                                     f"{type(e).__name__}: {e}")
+                self._sleep(1)
+            finally:
+                conn.close()
+            if ended:
+                return
+
+    def uploader(self):
+        chunk = 16 * 1024
+        delay = chunk / (self.args.upload_kbps * 1024)
+
+        def upload(conn):
+            conn.putrequest('POST', '/convert/to_wav')
+            conn.putheader('Content-Type', f"multipart/form-data; boundary={self.boundary}")
+            conn.putheader('Content-Length', str(len(self.upload_body)))
+            conn.endheaders()
+            for offset in range(0, len(self.upload_body), chunk):
+                conn.send(self.upload_body[offset:offset + chunk])
+                time.sleep(delay)
+            response = conn.getresponse()
+            response.read()
+            return response.status
+
+        while not self.stop.is_set():
+            self._timed('upload', upload)
+            self._sleep(random.uniform(0, 1))
+
+    def start(self) -> List[threading.Thread]:
+        workers = ([self.poller] * self.args.pollers + [self.video_client] * self.args.video_clients
+                   + [self.uploader] * self.args.uploaders + [self.canary])
+        threads = [threading.Thread(target=target, daemon=True) for target in workers]
+        for thread in threads:
+            thread.start()
+        return threads
+
+
+def _wait_ready(port: int, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with code {process.returncode}")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/')
+            if conn.getresponse().status == 200:
+                conn.close()
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"gunicorn did not answer within {timeout} seconds")
+
+
+def _static_files() -> Dict[str, set]:
+    folders = [os.path.join(REPO_ROOT, 'static', name) for name in ('downloads', 'uploads')]
+    return {folder: set(os.listdir(folder)) if os.path.isdir(folder) else set() for folder in folders}
+
+
+def _remove_new_files(before: Dict[str, set]):
+    for folder, names in before.items():
+        if os.path.isdir(folder):
+            for name in set(os.listdir(folder)) - names:
+                path = os.path.join(folder, name)
+                if os.path.isfile(path):
+                    os.remove(path)
+
+
+def summarize(recorder: Recorder, seconds: float, starvation_ms: float) -> Dict[str, Any]:
+    kinds = {}
+    short_total = short_starved = 0
+    for kind in KIND_ORDER:
+        samples = recorder.samples.get(kind, [])
+        latencies = [latency for latency, outcome in samples if outcome == 'ok']
+        timeouts = sum(1 for _, outcome in samples if outcome == 'timeout')
+        kinds[kind] = {
+            'requests': len(samples),
+            'req_per_s': len(samples) / seconds,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'max_ms': max(latencies) * 1000 if latencies else 0.0,
+            'errors': sum(1 for _, outcome in samples if outcome == 'error'),
+            'timeouts': timeouts,
+            'first_error': recorder.first_errors.get(kind),
+        }
+        if kind in SHORT_KINDS:
+            short_total += len(samples)
+            short_starved += sum(1 for latency, outcome in samples
+                                 if outcome != 'ok' or latency * 1000 > starvation_ms)
+    total = sum(kind['requests'] for kind in kinds.values())
+    return {
+        'req_per_s': total / seconds,
+        'starved_pct': short_starved / short_total * 100 if short_total else 0.0,
+        'kinds': kinds,
+    }
+
+
+def run_config(name: str, args, upload_path: str, scratch: str) -> Dict[str, Any]:
+    extra, module = CONFIGS[name]
+    if module and importlib.util.find_spec(module) is None:
+        return {'skipped': f"{module} is not installed"}
+    if name == 'gthread':
+        extra = extra + ['--threads', str(args.threads)]
+
+    port = _free_port()
+    root = os.path.join(scratch, name)
+    os.makedirs(root, exist_ok=True)
+    env = dict(os.environ)
+    env.update(app_environment(root))
+    env.update({
+        'MAX_VIDEO_DURATION': '0',
+        'SSE_HEARTBEAT': str(args.sse_heartbeat),
+        'SSE_MAX_DURATION': str(args.sse_max_duration),
+        'LOADTEST_JOB_SECONDS': str(args.job_seconds),
+        'PYTHONUNBUFFERED': '1',
+    })
+    command = [
+        sys.executable, '-m', 'gunicorn', 'benchmarks.loadtest_app:app',
+        '--bind', f"127.0.0.1:{port}",
+        '--workers', str(args.workers),
+        '--timeout', str(args.worker_timeout),
+        '--graceful-timeout', '5',
+        '--log-level', 'info',
+    ] + extra
+
+    log_path = os.path.join(root, 'gunicorn.log')
+    before = _static_files()
+    with open(log_path, 'w') as log:
+        process = subprocess.Popen(command, cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            _wait_ready(port, process)
+            stop = threading.Event()
+            now = time.time()
+            recorder = Recorder(now + args.ramp, now + args.ramp + args.duration)
+            threads = Traffic(('127.0.0.1', port), args, upload_path, recorder, stop).start()
+            time.sleep(args.ramp + args.duration)
+            stop.set()
+            # Requests still in flight were started inside the window; give them
+            # a moment to finish so slow ones are counted rather than dropped
+            deadline = time.monotonic() + args.request_timeout + 5
+            for thread in threads:
+                thread.join(timeout=max(0, deadline - time.monotonic()))
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+            _remove_new_files(before)
+
+    with open(log_path, errors='replace') as f:
+        log_text = f.read()
+    result = summarize(recorder, args.duration, args.starvation_ms)
+    result['worker_timeouts'] = log_text.count('WORKER TIMEOUT')
+    # Every boot past the initial ones replaced a worker that died or was killed
+    result['worker_restarts'] = max(0, log_text.count('Booting worker') - args.workers)
+    result['command'] = ' '.join(command[2:])
+    return result
+
+
+def print_report(results: Dict[str, Dict[str, Any]], starvation_ms: float):
+    for name, result in results.items():
+        print(f"== {name}")
+        if 'skipped' in result:
+            print(f"   skipped: {result['skipped']}")
+            continue
+        if 'failed' in result:
+            print(f"   FAILED: {result['failed']}")
+            continue
+        print(f"   {result['command']}")
+        print(f"   {result['req_per_s']:.1f} req/s, {result['starved_pct']:.1f}% of short requests over "
+              f"{starvation_ms:g} ms or failed, {result['worker_timeouts']} worker timeouts, "
+              f"{result['worker_restarts']} worker restarts")
+        print('   ' + 'kind'.ljust(8) + ''.join(title.rjust(10) for title in
+                                                 ('requests', 'req/s', 'p50 ms', 'p99 ms', 'max ms', 'errors',
+                                                  'timeouts')))
+        for kind, stats in result['kinds'].items():
+            print('   ' + kind.ljust(8)
+                  + f"{stats['requests']:>10}{stats['req_per_s']:>10.1f}{stats['p50_ms']:>10.1f}"
+                  + f"{stats['p99_ms']:>10.1f}{stats['max_ms']:>10.1f}{stats['errors']:>10}{stats['timeouts']:>10}")
+            if stats['first_error']:
+                print('   ' + ' ' * 8 + f"first error: {stats['first_error']}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.loadtest',
+                                     description='Mixed-traffic load test comparing gunicorn worker types')
+    parser.add_argument('--config', action='append', choices=sorted(CONFIGS), default=[],
+                        help='worker configuration to test (repeatable; default sync, gthread and gevent)')
+    parser.add_argument('--workers', type=int, default=3, help='gunicorn worker processes (default 3)')
+    parser.add_argument('--threads', type=int, default=16, help='threads per gthread worker (default 16)')
+    parser.add_argument('--worker-timeout', type=int, default=30,
+                        help="gunicorn --timeout; streams longer than this expose sync workers (default 30)")
+    parser.add_argument('--duration', type=float, default=30, help='measured seconds per configuration (default 30)')
+    parser.add_argument('--ramp', type=float, default=5, help='unmeasured seconds before measuring (default 5)')
+    parser.add_argument('--pollers', type=int, default=200, help='concurrent status pollers (default 200)')
+    parser.add_argument('--poll-interval', type=float, default=1.0, help='seconds between polls (default 1)')
+    parser.add_argument('--video-clients', type=int, default=4,
+                        help='clients submitting MP4 jobs and following their events (default 4)')
+    parser.add_argument('--job-seconds', type=float, default=20, help='duration of a stand-in MP4 job (default 20)')
+    parser.add_argument('--uploaders', type=int, default=3, help='slow WAV uploaders (default 3)')
+    parser.add_argument('--upload-kbps', type=float, default=64, help='upload rate per uploader in KiB/s (default 64)')
+    parser.add_argument('--sse-heartbeat', type=int, default=5, help='server SSE_HEARTBEAT (default 5)')
+    parser.add_argument('--sse-max-duration', type=int, default=60, help='server SSE_MAX_DURATION (default 60)')
+    parser.add_argument('--request-timeout', type=float, default=10, help='client timeout per request (default 10)')
+    parser.add_argument('--starvation-ms', type=float, default=1000,
+                        help='short requests slower than this count as starved (default 1000)')
+    parser.add_argument('--fixtures', default=os.path.join(tempfile.gettempdir(), 'webconverters-bench-fixtures'),
+                        help='where generated inputs are kept between runs')
+    parser.add_argument('--save', metavar='PATH', help='write results as JSON')
+    args = parser.parse_args(argv)
+
+    configs = args.config or ['sync', 'gthread', 'gevent']
+    print(f"Preparing fixtures in {args.fixtures}...", file=sys.stderr)
+    upload_path = ensure_fixtures(args.fixtures)['mp3_short']
+
+    results: Dict[str, Dict[str, Any]] = {}
+    scratch = tempfile.mkdtemp(prefix='webconverters-loadtest-')
+    try:
+        for name in configs:
+            print(f"{name}: {args.ramp:g}s ramp + {args.duration:g}s measured", file=sys.stderr)
+            try:
+                results[name] = run_config(name, args, upload_path, scratch)
+            except Exception as e:
+                results[name] = {'failed': str(e)}
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    print()
+    print_report(results, args.starvation_ms)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'created_at': time.time(), 'cpu_count': os.cpu_count(), 'args': vars(args),
+                       'results': results}, f, indent=2)
+        print(f"\nSaved results to {args.save}")
+    return 1 if any('failed' in result for result in results.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,46 @@
+"""
+WSGI entry point for the load test: the real app with the YouTube download
+replaced by a stand-in that reports progress for a while and writes a
+dummy file, so jobs, status polling and event streams behave as in
+production without network access or transcoding cost.
+
+    gunicorn benchmarks.loadtest_app:app
+
+LOADTEST_JOB_SECONDS sets how long a stand-in job runs (default 20),
+LOADTEST_OUTPUT_BYTES the size of the file it writes (default 1 MiB).
+"""
+import os
+import time
+import uuid
+
+import app as webapp
+
+JOB_SECONDS = float(os.environ.get('LOADTEST_JOB_SECONDS', 20))
+OUTPUT_BYTES = int(os.environ.get('LOADTEST_OUTPUT_BYTES', 1024 ** 2))
+PROGRESS_INTERVAL = 0.5
+
+
+def convert_youtube_to_mp4(url, static_folder, progress_callback=None):
+    steps = max(1, int(JOB_SECONDS / PROGRESS_INTERVAL))
+    for step in range(steps):
+        time.sleep(JOB_SECONDS / steps)
+        if progress_callback:
+            progress_callback(int(step * 100 / steps), f"Downloading... {step * 100 // steps}%")
+
+    name = f"loadtest_{uuid.uuid4().hex}.mp4"
+    path = os.path.join(static_folder, 'downloads', name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'\0' * OUTPUT_BYTES)
+    return path, name
+
+
+def youtube_projected_bytes(url, video_id, output):
+    # Skip the metadata probe, which would go to YouTube
+    return 2 * OUTPUT_BYTES
+
+
+webapp.convert_youtube_to_mp4 = convert_youtube_to_mp4
+webapp.youtube_projected_bytes = youtube_projected_bytes
+
+app = webapp.app
@@ -0,0 +1,171 @@
+import json
+import mimetypes
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import unquote
+
+# Same marker the TikTok converter looks for
+NEXT_DATA_MARKER = '<script id="__NEXT_DATA__" type="application/json">'
+
+_RANGE_RE = re.compile(r'bytes=(\d*)-(\d*)$')
+
+mimetypes.add_type('audio/mp4', '.m4a')
+mimetypes.add_type('audio/mpeg', '.mp3')
+
+
+def tiktok_page(title: str, music_url: str) -> str:
+    """A music detail page shaped like TikTok's: the data sits in nested __NEXT_DATA__ JSON"""
+    data = {
+        'props': {
+            'pageProps': {
+                'musicInfo': {
+                    'music': {'id': '7000000000000000000', 'title': title, 'playUrl': music_url,
+                              'musicUrl': music_url, 'authorName': 'benchmark'},
+                    'stats': {'videoCount': 0},
+                },
+            },
+        },
+        'page': '/music/[...slug]',
+    }
+    return (
+        '<!DOCTYPE html><html><head><title>' + title + '</title></head><body>'
+        '<div id="root"></div>'
+        + NEXT_DATA_MARKER + json.dumps(data) + '</script>'
+        '</body></html>'
+    )
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    media_dir = ''
+    # Default audio file that TikTok pages point to
+    tiktok_media = ''
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self._serve(head=True)
+
+    def do_GET(self):
+        self._serve(head=False)
+
+    def _serve(self, head: bool):
+        path = unquote(self.path.split('?', 1)[0])
+        if path.startswith('/music/'):
+            # /music/<slug>?media=<file> serves a page linking to that fixture
+            query = dict(part.partition('=')[::2] for part in self.path.partition('?')[2].split('&') if part)
+            media = query.get('media') or self.tiktok_media
+            host = self.headers.get('Host') or '127.0.0.1'
+            body = tiktok_page(path.rsplit('/', 1)[-1], f"http://{host}/media/{media}").encode('utf-8')
+            self._send(200, 'text/html; charset=utf-8', body, head)
+        elif path.startswith('/media/'):
+            self._send_file(os.path.join(self.media_dir, os.path.basename(path)), head)
+        else:
+            self._send(404, 'text/plain', b'not found', head)
+
+    def _send(self, status: int, content_type: str, body: bytes, head: bool):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def _send_file(self, path: str, head: bool):
+        if not os.path.isfile(path):
+            self._send(404, 'text/plain', b'not found', head)
+            return
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        status = 200
+        match = _RANGE_RE.match(self.headers.get('Range', ''))
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            else:
+                start = max(0, size - int(match.group(2)))
+            if start >= size or start > end:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            status = 206
+
+        self.send_response(status)
+        self.send_header('Content-Type', mimetypes.guess_type(path)[0] or 'application/octet-stream')
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(end - start + 1))
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.end_headers()
+        if head:
+            return
+        with open(path, 'rb') as f:
+            f.seek(start)
+            remaining = end - start + 1
+            try:
+                while remaining:
+                    chunk = f.read(min(256 * 1024, remaining))
+                    if not chunk:
+                        break
+                    self.wfile.write(chunk)
+                    remaining -= len(chunk)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients dropping keep-alive connections is normal here
+        pass
+
+
+class StandInServer:
+    """
+    Local HTTP server standing in for TikTok and YouTube's media hosts.
+
+    /music/<slug> returns a TikTok-style music page whose __NEXT_DATA__
+    points at /media/<file>; ?media=<file> picks another fixture. Files
+    under /media/ are served from media_dir with Range support, so yt-dlp
+    can treat them as direct-URL videos and the converters can fetch them
+    in byte ranges as they would from YouTube.
+    """
+
+    def __init__(self, media_dir: str, tiktok_media: str, host: str = '127.0.0.1', port: int = 0):
+        handler = type('Handler', (_Handler,), {'media_dir': media_dir, 'tiktok_media': tiktok_media})
+        self._server = _Server((host, port), handler)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def tiktok_url(self, slug: str, media: Optional[str] = None) -> str:
+        return f"{self.base_url}/music/{slug}" + (f"?media={media}" if media else '')
+
+    def media_url(self, filename: str) -> str:
+        return f"{self.base_url}/media/{filename}"
+
+    def start(self) -> 'StandInServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, name='standin', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> 'StandInServer':
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
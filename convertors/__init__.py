@@ -1,7 +1,15 @@
-from .youtube_mp3 import convert_youtube_to_mp3
-from .youtube_mp4 import convert_youtube_to_mp4
-from .tiktok_mp3 import convert_tiktok_to_mp3
-from .mp3_to_wav import convert_to_wav
-from .webp_to_png import convert_webp_to_png
+from .registry import CONVERTERS, Converter, load
 
-__all__ = ['convert_youtube_to_mp3', 'convert_youtube_to_mp4', 'convert_tiktok_to_mp3', 'convert_to_wav', 'convert_webp_to_png']
\ No newline at end of file
+# Converter functions are imported on first access, so importing the
+# package doesn't pull in yt-dlp, Pillow or requests
+_FUNCTIONS = {converter.function: converter.name for converter in CONVERTERS.values()}
+
+
+def __getattr__(name):
+    if name in _FUNCTIONS:
+        return load(_FUNCTIONS[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+__all__ = ['convert_youtube_to_mp3', 'convert_youtube_to_mp4', 'convert_tiktok_to_mp3', 'convert_to_wav',
+           'convert_webp_to_png', 'CONVERTERS', 'Converter', 'load']
@@ -0,0 +1,341 @@
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from typing import BinaryIO, Dict, Iterator, List, Mapping, NamedTuple, Optional, Tuple
+
+from .instrumentation import observe_phase, phase, record_bytes
+from .remux import FFMPEG, probe_audio
+
+# Uploads the engine accepts
+INPUT_EXTENSIONS = ('.mp3', '.mp4', '.m4a', '.wav', '.flac', '.ogg', '.opus')
+
+# Inputs ffmpeg can decode from a non-seekable pipe, with the demuxer to
+# use. MP4/M4A usually keep their index (moov atom) at the end of the file
+# and need a real file.
+STREAMABLE_EXTENSIONS = {'.mp3': 'mp3', '.wav': 'wav', '.flac': 'flac', '.ogg': 'ogg', '.opus': 'ogg'}
+
+# Codec implied by a streamed input's extension, where there is only one
+_STREAM_CODECS = {'.mp3': 'mp3', '.flac': 'flac', '.opus': 'opus'}
+
+# Pipe read/write size for streamed conversions
+STREAM_CHUNK_SIZE = 64 * 1024
+
+SAMPLE_RATES = (8000, 11025, 12000, 16000, 22050, 24000, 32000, 44100, 48000, 88200, 96000, 176400, 192000)
+
+
+class Codec(NamedTuple):
+    encoder: str
+    lossy: bool
+    # kbps: used when no bitrate is requested, and the accepted range
+    default_bitrate: Optional[int] = None
+    bitrates: Optional[Tuple[int, int]] = None
+    # Lossless codecs: bit depth -> (encoder, extra ffmpeg arguments)
+    bit_depths: Optional[Dict[int, Tuple[str, List[str]]]] = None
+    # Sample rates the encoder takes (None: any of SAMPLE_RATES)
+    sample_rates: Optional[Tuple[int, ...]] = None
+
+
+# Keyed by ffmpeg's codec name, so a probed source codec compares directly
+# (PCM is the exception: ffmpeg names it per sample format, pcm_s16le etc.)
+CODECS: Dict[str, Codec] = {
+    'pcm': Codec('pcm_s16le', False, bit_depths={
+        8: ('pcm_u8', []), 16: ('pcm_s16le', []), 24: ('pcm_s24le', []), 32: ('pcm_s32le', []),
+    }),
+    'flac': Codec('flac', False, bit_depths={
+        16: ('flac', ['-sample_fmt', 's16']), 24: ('flac', ['-sample_fmt', 's32', '-bits_per_raw_sample', '24']),
+    }),
+    'alac': Codec('alac', False, bit_depths={
+        16: ('alac', ['-sample_fmt', 's16p']), 24: ('alac', ['-sample_fmt', 's32p', '-bits_per_raw_sample', '24']),
+    }),
+    'mp3': Codec('libmp3lame', True, 192, (32, 320),
+                 sample_rates=(8000, 11025, 12000, 16000, 22050, 24000, 32000, 44100, 48000)),
+    'aac': Codec('aac', True, 192, (32, 512)),
+    'opus': Codec('libopus', True, 128, (6, 510), sample_rates=(8000, 12000, 16000, 24000, 48000)),
+    'vorbis': Codec('libvorbis', True, 160, (45, 500)),
+}
+
+
+class Container(NamedTuple):
+    label: str
+    muxer: str
+    extension: str
+    mime_type: str
+    # Codecs it can hold; the first is the default
+    codecs: Tuple[str, ...]
+
+
+CONTAINERS: Dict[str, Container] = {
+    'wav': Container('WAV (uncompressed)', 'wav', '.wav', 'audio/wav', ('pcm',)),
+    'flac': Container('FLAC (lossless)', 'flac', '.flac', 'audio/flac', ('flac',)),
+    'mp3': Container('MP3', 'mp3', '.mp3', 'audio/mpeg', ('mp3',)),
+    'm4a': Container('M4A (AAC or ALAC)', 'ipod', '.m4a', 'audio/mp4', ('aac', 'alac')),
+    'ogg': Container('Ogg Vorbis', 'ogg', '.ogg', 'audio/ogg', ('vorbis', 'opus', 'flac')),
+    'opus': Container('Opus', 'opus', '.opus', 'audio/ogg', ('opus',)),
+}
+
+
+class AudioTarget(NamedTuple):
+    """What to produce; None keeps the source's value (or the codec default)"""
+    container: str
+    codec: str
+    sample_rate: Optional[int] = None
+    bit_depth: Optional[int] = None
+    channels: Optional[int] = None
+    bitrate: Optional[int] = None
+
+    @property
+    def extension(self) -> str:
+        return CONTAINERS[self.container].extension
+
+    @property
+    def mime_type(self) -> str:
+        return CONTAINERS[self.container].mime_type
+
+
+# What convert_to_wav has always produced
+WAV_TARGET = AudioTarget('wav', 'pcm', sample_rate=44100, bit_depth=16)
+
+# Request fields read by target_from_options; 'format' is the container
+OPTION_NAMES = ('format', 'codec', 'sample_rate', 'bit_depth', 'channels', 'bitrate')
+
+
+def audio_target(container: str = 'wav', codec: Optional[str] = None, sample_rate: Optional[int] = None,
+                 bit_depth: Optional[int] = None, channels: Optional[int] = None,
+                 bitrate: Optional[int] = None) -> AudioTarget:
+    """Validated AudioTarget; raises ValueError with a message fit for the user"""
+    if container not in CONTAINERS:
+        raise ValueError(f"Unsupported output format: {container}. Choose one of {', '.join(CONTAINERS)}.")
+    allowed = CONTAINERS[container].codecs
+    codec = codec or allowed[0]
+    if codec not in allowed:
+        raise ValueError(f"{container.upper()} files can't hold {codec}; use {', '.join(allowed)}.")
+    spec = CODECS[codec]
+
+    if sample_rate is not None and sample_rate not in (spec.sample_rates or SAMPLE_RATES):
+        rates = ', '.join(str(rate) for rate in spec.sample_rates or SAMPLE_RATES)
+        raise ValueError(f"Unsupported sample rate for {codec}: {sample_rate} Hz. Use one of {rates}.")
+    if bit_depth is not None:
+        if not spec.bit_depths:
+            raise ValueError(f"Bit depth only applies to lossless output, not {codec}.")
+        if bit_depth not in spec.bit_depths:
+            raise ValueError(f"Unsupported bit depth for {codec}: {bit_depth}. "
+                             f"Use {', '.join(str(depth) for depth in spec.bit_depths)}.")
+    if channels is not None and not 1 <= channels <= 8:
+        raise ValueError("Channels must be between 1 and 8.")
+    if bitrate is not None:
+        if not spec.lossy:
+            raise ValueError(f"Bitrate only applies to lossy output, not {codec}.")
+        low, high = spec.bitrates
+        if not low <= bitrate <= high:
+            raise ValueError(f"Bitrate for {codec} must be between {low} and {high} kbps.")
+    return AudioTarget(container, codec, sample_rate, bit_depth, channels, bitrate)
+
+
+def target_from_options(options: Mapping[str, str], default: AudioTarget = WAV_TARGET) -> AudioTarget:
+    """
+    AudioTarget from request fields (format, codec, sample_rate, bit_depth,
+    channels, bitrate). Returns default when none of them is set; empty
+    fields keep the source's value. Raises ValueError for bad input.
+    """
+    values = {name: (options.get(name) or '').strip().lower() for name in OPTION_NAMES}
+    if not any(values.values()):
+        return default
+    numbers = {}
+    for name in ('sample_rate', 'bit_depth', 'channels', 'bitrate'):
+        if values[name]:
+            try:
+                numbers[name] = int(values[name].rstrip('k'))
+            except ValueError:
+                raise ValueError(f"{name.replace('_', ' ').capitalize()} must be a whole number.")
+    return audio_target(values['format'] or default.container, values['codec'] or None, **numbers)
+
+
+def _can_copy(source: Dict[str, Optional[int]], target: AudioTarget) -> bool:
+    codec = source.get('codec') or ''
+    if target.codec == 'pcm':
+        # Only the sample formats we'd produce ourselves (no big-endian or float PCM)
+        if codec not in {encoder for encoder, _ in CODECS['pcm'].bit_depths.values()}:
+            return False
+    elif codec != target.codec:
+        return False
+    return (target.sample_rate in (None, source.get('sample_rate'))
+            and target.channels in (None, source.get('channels'))
+            and target.bit_depth in (None, source.get('bit_depth'))
+            and target.bitrate in (None, source.get('bitrate')))
+
+
+def _sample_rate(spec: Codec, source_rate: Optional[int]) -> Optional[int]:
+    # Resample only when the encoder can't take the source rate: up to the
+    # nearest rate it supports, or down to its highest
+    if not spec.sample_rates or source_rate is None or source_rate in spec.sample_rates:
+        return None
+    higher = [rate for rate in spec.sample_rates if rate >= source_rate]
+    return higher[0] if higher else spec.sample_rates[-1]
+
+
+def output_args(target: AudioTarget, source: Optional[Dict[str, Optional[int]]] = None,
+                pipe: bool = False) -> Tuple[List[str], bool]:
+    """
+    ffmpeg output arguments producing target from source (as returned by
+    probe_audio; partial or None when unknown). The audio stream is copied
+    when its codec and every requested property already match. Returns
+    (args, copied).
+    """
+    source = source or {}
+    spec = CODECS[target.codec]
+    container = CONTAINERS[target.container]
+    args = ['-vn', '-map', '0:a:0']
+    copied = _can_copy(source, target)
+    if copied:
+        args += ['-c:a', 'copy']
+    else:
+        if spec.bit_depths:
+            depth = target.bit_depth or source.get('bit_depth')
+            encoder, extra = spec.bit_depths[depth if depth in spec.bit_depths else 16]
+            args += ['-c:a', encoder] + extra
+        else:
+            args += ['-c:a', spec.encoder, '-b:a', f"{target.bitrate or spec.default_bitrate}k"]
+        sample_rate = target.sample_rate or _sample_rate(spec, source.get('sample_rate'))
+        if sample_rate:
+            args += ['-ar', str(sample_rate)]
+        if target.channels:
+            args += ['-ac', str(target.channels)]
+    if container.muxer == 'ipod':
+        # A pipe can't be rewound to write the index, so fragment instead
+        args += ['-movflags', 'frag_keyframe+empty_moov' if pipe else '+faststart']
+    return args + ['-f', container.muxer], copied
+
+
+def transcode_audio(file_path: str, static_folder: str, target: AudioTarget = WAV_TARGET) -> Tuple[str, str]:
+    """
+    Convert an audio file (or the audio of a video) to target, move it into
+    static/downloads, and return (filepath_on_disk, download_name).
+    """
+    filename = os.path.basename(file_path)
+    base_name, ext = os.path.splitext(filename)
+    if ext.lower() not in INPUT_EXTENSIONS:
+        raise ValueError(f"Unsupported file format. Please upload one of: {', '.join(INPUT_EXTENSIONS)}.")
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        source = probe_audio(file_path)
+        if source is None:
+            raise ValueError("The file has no audio stream.")
+        args, copied = output_args(target, source)
+
+        out_filename = f"{base_name}{target.extension}"
+        out_path = os.path.join(tmpdir, out_filename)
+        try:
+            # Copying a stream that already matches costs next to no CPU
+            with phase('wav', 'remux' if copied else 'transcode'):
+                subprocess.run([FFMPEG, '-y', '-v', 'error', '-i', file_path] + args + [out_path],
+                               check=True, capture_output=True, text=True)
+        except subprocess.CalledProcessError as e:
+            raise RuntimeError(f"Failed to convert file: {e.stderr}")
+        record_bytes('wav', 'in', os.path.getsize(file_path))
+        record_bytes('wav', 'out', os.path.getsize(out_path))
+
+        downloads_dir = os.path.join(static_folder, 'downloads')
+        os.makedirs(downloads_dir, exist_ok=True)
+        dst = os.path.join(downloads_dir, out_filename)
+        with phase('wav', 'move'):
+            shutil.move(out_path, dst)
+
+        safe = re.sub(r'\W+', '', base_name)
+        return dst, f"{safe}{target.extension}"
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def stream_transcode(source: BinaryIO, ext: str, target: AudioTarget = WAV_TARGET,
+                     chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Convert an audio stream to target without touching the disk.
+
+    source is fed to ffmpeg's stdin from a background thread while the
+    output is read from its stdout. A stream can't be probed up front, so
+    it is copied only when the extension pins down the codec and no
+    property change is requested. WAV written to a pipe has its RIFF and
+    data sizes left at 0xFFFFFFFF, which players treat as "until end of
+    stream". ffmpeg is started and the first chunk read before this
+    returns, so a bad input raises here instead of producing a truncated
+    download.
+    """
+    input_format = STREAMABLE_EXTENSIONS.get(ext.lower())
+    if input_format is None:
+        raise ValueError(f"Streaming conversion is not supported for {ext} files.")
+    args, _ = output_args(target, {'codec': _STREAM_CODECS.get(ext.lower())}, pipe=True)
+
+    stderr = tempfile.TemporaryFile()
+    process = subprocess.Popen(
+        [FFMPEG, '-hide_banner', '-loglevel', 'error', '-f', input_format, '-i', 'pipe:0'] + args + ['pipe:1'],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=stderr
+    )
+
+    started = time.perf_counter()
+    received = 0
+
+    def feed():
+        nonlocal received
+        try:
+            while True:
+                chunk = source.read(chunk_size)
+                if not chunk:
+                    break
+                process.stdin.write(chunk)
+                received += len(chunk)
+        except (BrokenPipeError, ValueError):
+            # ffmpeg exited early; its stderr explains why
+            pass
+        finally:
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+
+    def failure() -> RuntimeError:
+        stderr.seek(0)
+        message = stderr.read().decode('utf-8', errors='replace')
+        return RuntimeError(f"Failed to convert file: {message}")
+
+    first = process.stdout.read(chunk_size)
+    if not first:
+        process.wait()
+        feeder.join()
+        error = failure()
+        stderr.close()
+        raise error
+
+    def relay():
+        sent = 0
+        try:
+            sent += len(first)
+            yield first
+            while True:
+                chunk = process.stdout.read(chunk_size)
+                if not chunk:
+                    break
+                sent += len(chunk)
+                yield chunk
+            if process.wait() != 0:
+                raise failure()
+        finally:
+            # Client disconnects close the generator early - stop ffmpeg
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            feeder.join(timeout=5)
+            process.stdout.close()
+            stderr.close()
+            observe_phase('wav', 'stream', time.perf_counter() - started)
+            record_bytes('wav', 'in', received)
+            record_bytes('wav', 'out', sent)
+
+    return relay()
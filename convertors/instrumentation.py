@@ -0,0 +1,38 @@
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+# Set by the application to collect timings; converters work without it
+_observe_phase: Optional[Callable[[str, str, float], None]] = None
+_add_bytes: Optional[Callable[[str, str, int], None]] = None
+
+
+def set_recorder(observe_phase: Callable[[str, str, float], None], add_bytes: Callable[[str, str, int], None]):
+    """
+    Route converter measurements to the application's metrics:
+    observe_phase(converter, phase, seconds) and
+    add_bytes(converter, direction, count) with direction 'in' or 'out'.
+    """
+    global _observe_phase, _add_bytes
+    _observe_phase = observe_phase
+    _add_bytes = add_bytes
+
+
+def observe_phase(converter: str, phase: str, seconds: float):
+    if _observe_phase is not None:
+        _observe_phase(converter, phase, seconds)
+
+
+def record_bytes(converter: str, direction: str, count: int):
+    if _add_bytes is not None and count:
+        _add_bytes(converter, direction, count)
+
+
+@contextmanager
+def phase(converter: str, name: str) -> Iterator[None]:
+    """Time a block as one phase (metadata, download, transcode, move, ...) of a conversion"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_phase(converter, name, time.perf_counter() - started)
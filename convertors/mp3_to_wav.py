@@ -1,57 +1,66 @@
 import os
-import re
-import tempfile
-import shutil
-import subprocess
-from typing import Tuple
+from concurrent.futures import Executor, as_completed
+from typing import BinaryIO, Callable, Iterator, List, Optional, Tuple
+
+from .audio import STREAM_CHUNK_SIZE, WAV_TARGET, AudioTarget, stream_transcode, transcode_audio
 
 def convert_to_wav(file_path: str, static_folder: str) -> Tuple[str, str]:
     """
-    Convert an MP3 or MP4A file to WAV format,
+    Convert an audio file to 16-bit 44.1 kHz WAV,
     move it into static/downloads, and return (filepath_on_disk, download_name).
     """
-    # 1) make a temp work dir
-    tmpdir = tempfile.mkdtemp()
-    
+    return transcode_audio(file_path, static_folder, WAV_TARGET)
+
+def stream_to_wav(source: BinaryIO, ext: str, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    """Convert an audio stream to 16-bit 44.1 kHz WAV without touching the disk (see stream_transcode)"""
+    return stream_transcode(source, ext, WAV_TARGET, chunk_size)
+
+
+def convert_batch_to_wav(items: List[Tuple[str, str]], static_folder: str, executor: Executor,
+                         on_update: Optional[Callable[[str, str, str], None]] = None,
+                         target: AudioTarget = WAV_TARGET
+                         ) -> Iterator[Tuple[str, Optional[str], Optional[str]]]:
+    """
+    Convert many files to WAV (or another target) concurrently on the given executor.
+
+    items is a list of (name, file_path). Yields (name, wav_path, error)
+    in completion order, so the caller can hand off each result as soon
+    as it is ready. on_update(name, state, message) is called as each
+    file starts ('converting') and finishes ('done' or 'error').
+    """
+    def run(name: str, path: str) -> str:
+        if on_update:
+            on_update(name, 'converting', 'Converting...')
+        wav_path, _ = transcode_audio(path, static_folder, target)
+        return wav_path
+
+    def discard(future):
+        # Output of a conversion nobody is waiting for any more
+        if not future.cancelled() and future.exception() is None:
+            try:
+                os.remove(future.result())
+            except FileNotFoundError:
+                pass
+
+    futures = {executor.submit(run, name, path): name for name, path in items}
+    collected = set()
     try:
-        # Get the filename and extension
-        filename = os.path.basename(file_path)
-        base_name, ext = os.path.splitext(filename)
-        
-        # 2) Check file format
-        if ext.lower() not in ['.mp3', '.mp4', '.m4a']:
-            raise ValueError("Unsupported file format. Please upload an MP3 or MP4 audio file.")
-            
-        # 3) Convert to WAV using ffmpeg
-        wav_filename = f"{base_name}.wav"
-        wav_path = os.path.join(tmpdir, wav_filename)
-        
-        try:
-            subprocess.run([
-                'ffmpeg', '-i', file_path,
-                '-acodec', 'pcm_s16le',
-                '-ar', '44100',
-                wav_path
-            ], check=True, capture_output=True, text=True)
-        except subprocess.CalledProcessError as e:
-            raise RuntimeError(f"Failed to convert file: {e.stderr}")
-        
-        # 4) Move to static/downloads
-        downloads_dir = os.path.join(static_folder, 'downloads')
-        os.makedirs(downloads_dir, exist_ok=True)
-        dst = os.path.join(downloads_dir, wav_filename)
-        shutil.move(wav_path, dst)
-        
-        # 5) Clean up temp dir
-        shutil.rmtree(tmpdir, ignore_errors=True)
-        
-        # 6) Sanitize a download-friendly name
-        safe = re.sub(r'\W+', '', base_name)
-        download_name = f"{safe}.wav"
-        
-        return dst, download_name
-        
-    except Exception as e:
-        # Clean up on error
-        shutil.rmtree(tmpdir, ignore_errors=True)
-        raise e
\ No newline at end of file
+        for future in as_completed(futures):
+            collected.add(future)
+            name = futures[future]
+            try:
+                wav_path = future.result()
+            except Exception as e:
+                if on_update:
+                    on_update(name, 'error', str(e))
+                yield name, None, str(e)
+                continue
+            if on_update:
+                on_update(name, 'done', 'Converted')
+            yield name, wav_path, None
+    finally:
+        # Stopped early (e.g. client disconnected): drop queued work and
+        # clean up after conversions that are still running
+        for future in futures:
+            if future not in collected and not future.cancel():
+                future.add_done_callback(discard)
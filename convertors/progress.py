@@ -0,0 +1,56 @@
+import logging
+import os
+import time
+from typing import Callable, Optional
+
+# yt-dlp calls progress hooks for every chunk it writes, many times a
+# second. Updates are passed on once progress has moved MIN_DELTA points,
+# or has moved at all after MIN_INTERVAL seconds without an update.
+MIN_DELTA = int(os.environ.get('PROGRESS_MIN_DELTA', 5))
+MIN_INTERVAL = float(os.environ.get('PROGRESS_MIN_INTERVAL', 1.0))
+# Published updates are logged when they cross a multiple of LOG_STEP
+LOG_STEP = int(os.environ.get('PROGRESS_LOG_STEP', 25))
+
+logger = logging.getLogger(__name__)
+
+
+class ProgressPublisher:
+    """
+    Coalesces progress updates before they reach a progress_callback
+    (percent, message, is_complete), which writes the shared job status.
+
+    Hot loops ask due(percent) and only build the message and publish()
+    when it returns True. Milestones such as "Merging video and audio..."
+    are published directly and always passed on.
+    """
+
+    def __init__(self, callback: Optional[Callable], name: str, min_delta: int = MIN_DELTA,
+                 min_interval: float = MIN_INTERVAL, log_step: int = LOG_STEP):
+        self.callback = callback
+        self.name = name
+        self.min_delta = min_delta
+        self.min_interval = min_interval
+        self.log_step = log_step
+        self._percent = None
+        self._published_at = 0.0
+        self._logged = -1
+
+    def due(self, percent: int) -> bool:
+        """True if an update at percent would be passed on"""
+        if self.callback is None or percent == self._percent:
+            return False
+        if self._percent is None or abs(percent - self._percent) >= self.min_delta:
+            return True
+        return time.monotonic() - self._published_at >= self.min_interval
+
+    def publish(self, percent: int, message: str, is_complete: bool = False):
+        """Pass an update on to the callback"""
+        if self.callback is None:
+            return
+        self._percent = percent
+        self._published_at = time.monotonic()
+        self.callback(percent, message, is_complete)
+        # Sampled: a job logs a handful of progress lines, not one per update
+        if is_complete or percent // self.log_step > self._logged // self.log_step:
+            self._logged = percent
+            logger.debug("%s: %d%% - %s", self.name, percent, message)
@@ -0,0 +1,56 @@
+import importlib
+from typing import Callable, Dict, Iterable, NamedTuple, Optional, Tuple
+
+
+class Converter(NamedTuple):
+    name: str
+    title: str
+    route: str
+    # File extensions accepted as uploads, or the kind of URL for link converters
+    inputs: Tuple[str, ...]
+    output_mime: str
+    module: str
+    function: str
+    # Heavy third-party modules the converter imports on first use
+    requires: Tuple[str, ...] = ()
+
+
+# Names match the converter label used in metrics
+CONVERTERS: Dict[str, Converter] = {converter.name: converter for converter in (
+    Converter('youtube_mp3', 'YouTube to MP3', '/youtube/mp3', ('youtube_url',), 'audio/mpeg',
+              'youtube_mp3', 'convert_youtube_to_mp3', ('yt_dlp', 'requests')),
+    Converter('youtube_mp4', 'YouTube to MP4', '/youtube/mp4', ('youtube_url',), 'video/mp4',
+              'youtube_mp4', 'convert_youtube_to_mp4', ('yt_dlp', 'requests')),
+    Converter('tiktok_mp3', 'TikTok to MP3', '/tiktok/mp3', ('tiktok_url',), 'audio/mpeg',
+              'tiktok_mp3', 'convert_tiktok_to_mp3', ('requests',)),
+    # WAV unless the request asks for another format (see convertors.audio)
+    Converter('wav', 'Audio converter', '/convert/to_wav', ('.mp3', '.mp4', '.m4a', '.wav', '.flac', '.ogg', '.opus'),
+              'audio/wav', 'mp3_to_wav', 'convert_to_wav'),
+    Converter('webp_to_png', 'WebP to PNG', '/convert/webp_to_png', ('.webp',), 'image/png',
+              'webp_to_png', 'convert_webp_to_png', ('PIL.Image', 'PIL.WebPImagePlugin', 'PIL.PngImagePlugin')),
+)}
+
+
+def accepts(name: str, filename: str) -> bool:
+    """True if filename has an extension the converter takes as upload"""
+    return filename.lower().endswith(tuple(ext for ext in CONVERTERS[name].inputs if ext.startswith('.')))
+
+
+def load(name: str) -> Callable:
+    """Import a converter's module and return its entry point"""
+    converter = CONVERTERS[name]
+    module = importlib.import_module(f"{__package__}.{converter.module}")
+    return getattr(module, converter.function)
+
+
+def preload(names: Optional[Iterable[str]] = None):
+    """
+    Import converters and their heavy dependencies now instead of on first
+    use. Called in the gunicorn master when preloading, so forked workers
+    share these pages copy-on-write instead of each importing them.
+    """
+    for name in names or CONVERTERS:
+        converter = CONVERTERS[name]
+        load(name)
+        for module in converter.requires:
+            importlib.import_module(module)
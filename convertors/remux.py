@@ -0,0 +1,171 @@
+import json
+import re
+import subprocess
+from typing import Dict, List, Optional
+
+FFMPEG = 'ffmpeg'
+FFPROBE = 'ffprobe'
+
+# For each output container: the codecs it can carry as-is, per stream
+# type, and the encoder arguments used when the source codec is not one
+# of them. Streams that already fit are copied, which costs next to no CPU.
+CONTAINER_CODECS = {
+    'mp4': {
+        'video': ({'h264'}, ['-c:v', 'libx264', '-preset', 'veryfast']),
+        'audio': ({'aac'}, ['-c:a', 'aac', '-b:a', '192k']),
+    },
+    'm4a': {
+        'audio': ({'aac', 'alac'}, ['-c:a', 'aac', '-b:a', '192k']),
+    },
+    'mp3': {
+        'audio': ({'mp3'}, ['-c:a', 'libmp3lame', '-ar', '44100', '-ac', '2', '-b:a', '192k']),
+    },
+}
+
+# yt-dlp reports codecs as RFC 6381 strings (avc1.64001F, mp4a.40.2, ...)
+_INFO_CODECS = {
+    'avc1': 'h264', 'avc3': 'h264', 'h264': 'h264',
+    'mp4a': 'aac', 'aac': 'aac',
+    'mp3': 'mp3', 'alac': 'alac',
+}
+
+_STREAM_RE = re.compile(r'Stream #\d+:\d+.*?: (Video|Audio): (\w+)')
+
+# ffmpeg -i audio stream line: codec, rate, channel layout, sample format, bits, bitrate
+_AUDIO_RE = re.compile(r'Stream #\d+:\d+.*?: Audio: (\w+).*?, (\d+) Hz, ([^,]+), (\w+)(?: \((\d+) bit\))?(?:, (\d+) kb/s)?')
+
+_LAYOUT_CHANNELS = {'mono': 1, 'stereo': 2, '2.1': 3, 'quad': 4, '4.0': 4, '5.0': 5, '5.1': 6, '6.1': 7, '7.1': 8}
+
+_SAMPLE_FMT_BITS = {'u8': 8, 'u8p': 8, 's16': 16, 's16p': 16, 's32': 32, 's32p': 32}
+
+
+def codecs_from_info(info: Dict) -> Dict[str, Optional[str]]:
+    """
+    Source codecs of a yt-dlp download, from the selected formats' metadata.
+    Values are ffmpeg codec names where known (h264, aac, mp3), otherwise
+    the codec family yt-dlp reported, or None for an absent stream.
+    """
+    codecs = {'video': None, 'audio': None}
+    for fmt in info.get('requested_formats') or [info]:
+        for stream, field in (('video', 'vcodec'), ('audio', 'acodec')):
+            value = fmt.get(field)
+            if value and value != 'none' and codecs[stream] is None:
+                family = value.split('.')[0].lower()
+                codecs[stream] = _INFO_CODECS.get(family, family)
+    return codecs
+
+
+def probe_codecs(path: str) -> Dict[str, Optional[str]]:
+    """Codec of the first video and audio stream in a file, via ffprobe (or ffmpeg -i without it)"""
+    codecs = {'video': None, 'audio': None}
+    try:
+        result = subprocess.run([
+            FFPROBE, '-v', 'error',
+            '-show_entries', 'stream=codec_type,codec_name',
+            '-of', 'json', path
+        ], check=True, capture_output=True, text=True)
+        streams = [(s.get('codec_type'), s.get('codec_name')) for s in json.loads(result.stdout).get('streams', [])]
+    except FileNotFoundError:
+        # ffmpeg -i always exits non-zero without an output file; the stream list is on stderr
+        result = subprocess.run([FFMPEG, '-hide_banner', '-i', path], capture_output=True, text=True)
+        streams = [(kind.lower(), name) for kind, name in _STREAM_RE.findall(result.stderr)]
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"Could not read media streams: {e.stderr}")
+
+    for kind, name in streams:
+        if kind in codecs and codecs[kind] is None:
+            codecs[kind] = name
+    return codecs
+
+
+def probe_audio(path: str) -> Optional[Dict[str, Optional[int]]]:
+    """
+    Properties of the first audio stream in a file: codec (ffmpeg name),
+    sample_rate, channels, bit_depth (None for float/lossy decodes) and
+    bitrate in kbps. None if the file has no audio.
+    """
+    try:
+        result = subprocess.run([
+            FFPROBE, '-v', 'error', '-select_streams', 'a:0',
+            '-show_entries', 'stream=codec_name,sample_rate,channels,sample_fmt,bits_per_raw_sample,bit_rate',
+            '-of', 'json', path
+        ], check=True, capture_output=True, text=True)
+        streams = json.loads(result.stdout).get('streams', [])
+        if not streams:
+            return None
+        stream = streams[0]
+        bits = stream.get('bits_per_raw_sample')
+        rate = stream.get('bit_rate')
+        audio = {
+            'codec': stream.get('codec_name'),
+            'sample_rate': int(stream['sample_rate']) if stream.get('sample_rate') else None,
+            'channels': stream.get('channels'),
+            'bit_depth': int(bits) if bits and str(bits).isdigit() else _SAMPLE_FMT_BITS.get(stream.get('sample_fmt')),
+            'bitrate': int(rate) // 1000 if rate and str(rate).isdigit() else None,
+        }
+    except FileNotFoundError:
+        result = subprocess.run([FFMPEG, '-hide_banner', '-i', path], capture_output=True, text=True)
+        match = _AUDIO_RE.search(result.stderr)
+        if not match:
+            return None
+        codec, sample_rate, layout, sample_fmt, bits, bitrate = match.groups()
+        channels = _LAYOUT_CHANNELS.get(layout.split('(')[0].strip())
+        if channels is None and layout.endswith(' channels'):
+            channels = int(layout.split()[0])
+        audio = {
+            'codec': codec,
+            'sample_rate': int(sample_rate),
+            'channels': channels,
+            'bit_depth': int(bits) if bits else _SAMPLE_FMT_BITS.get(sample_fmt),
+            'bitrate': int(bitrate) if bitrate else None,
+        }
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"Could not read media streams: {e.stderr}")
+
+    # PCM carries its sample size in the codec name (pcm_s24le)
+    pcm = re.match(r'pcm_[su](\d+)', audio['codec'] or '')
+    if pcm:
+        audio['bit_depth'] = int(pcm.group(1))
+    return audio
+
+
+def fits_container(codecs: Dict[str, Optional[str]], container: str) -> bool:
+    """True if every stream the container keeps can be stream-copied into it"""
+    for stream, (allowed, _) in CONTAINER_CODECS[container].items():
+        if codecs.get(stream) is not None and codecs[stream] not in allowed:
+            return False
+    return True
+
+
+def remux_args(codecs: Dict[str, Optional[str]], container: str) -> List[str]:
+    """ffmpeg output arguments that copy compatible streams and encode only the rest"""
+    spec = CONTAINER_CODECS[container]
+    args = []
+    if 'video' in spec:
+        args += ['-map', '0:v:0?', '-map', '0:a:0?']
+    else:
+        args += ['-vn', '-map', '0:a:0']
+    for stream, (allowed, encode) in spec.items():
+        flag = '-c:v' if stream == 'video' else '-c:a'
+        args += [flag, 'copy'] if codecs.get(stream) in allowed else encode
+    if container in ('mp4', 'm4a'):
+        args += ['-movflags', '+faststart']
+    return args
+
+
+def remux_or_transcode(src: str, dst: str, container: str,
+                       codecs: Optional[Dict[str, Optional[str]]] = None) -> bool:
+    """
+    Write src to dst in the given container, re-encoding only streams whose
+    codec the container cannot carry. Returns True if nothing was re-encoded.
+    """
+    if codecs is None:
+        codecs = probe_codecs(src)
+    try:
+        subprocess.run(
+            [FFMPEG, '-y', '-v', 'error', '-i', src] + remux_args(codecs, container) + [dst],
+            check=True, capture_output=True, text=True
+        )
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"FFmpeg conversion failed: {e.stderr}")
+    return fits_container(codecs, container)
@@ -1,68 +1,226 @@
 import os
 import re
 import json
+import shutil
 import tempfile
-import requests
-from typing import Any, Dict, List, Tuple, Union
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple, Union
 
+from .instrumentation import observe_phase, phase, record_bytes
+from .ttl_cache import TTLCache
 
-def _find_key(obj: Union[Dict[str, Any], List[Any]], key: str) -> Any:
+if TYPE_CHECKING:
+    import requests
+
+# Read size for relaying the upstream MP3; large enough to keep syscalls
+# and WSGI writes per request low
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Connect/read timeout for TikTok requests, in seconds
+REQUEST_TIMEOUT = (5, 30)
+
+# How long a page -> (title, musicUrl) resolution is reused; musicUrl is a
+# signed link, so keep this well below its lifetime
+RESOLVE_TTL = int(os.environ.get('TIKTOK_RESOLVE_TTL', 600))
+
+NEXT_DATA_MARKER = '<script id="__NEXT_DATA__" type="application/json">'
+
+# Created on first use so workers that never fetch from TikTok don't import requests
+_session: Optional['requests.Session'] = None
+_session_lock = threading.Lock()
+
+_resolved = TTLCache(maxsize=1024, ttl=RESOLVE_TTL)
+
+
+def http_session() -> 'requests.Session':
+    """Keep-alive connection pool shared by every request in this process"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            session.mount('https://', HTTPAdapter(pool_connections=8, pool_maxsize=32))
+            session.mount('http://', HTTPAdapter(pool_connections=8, pool_maxsize=32))
+            _session = session
+        return _session
+
+
+def _find_keys(obj: Union[Dict[str, Any], List[Any]], keys: Tuple[str, ...]) -> Dict[str, Any]:
     """
-    Recursively search for given key in a nested dict/list.
+    Search a nested dict/list once and return the first value found for
+    each of the given keys (depth-first, in document order). Keys that do
+    not occur are missing from the result.
     """
-    if isinstance(obj, dict):
-        if key in obj:
-            return obj[key]
-        for value in obj.values():
-            try:
-                return _find_key(value, key)
-            except KeyError:
-                continue
-    elif isinstance(obj, list):
-        for item in obj:
+    found: Dict[str, Any] = {}
+    stack = [obj]
+    while stack and len(found) < len(keys):
+        node = stack.pop()
+        if isinstance(node, dict):
+            for key in keys:
+                if key not in found and key in node:
+                    found[key] = node[key]
+            children = node.values()
+        elif isinstance(node, list):
+            children = node
+        else:
+            continue
+        # Push in reverse so children are visited in their original order
+        stack.extend(reversed([c for c in children if isinstance(c, (dict, list))]))
+    return found
+
+
+def _extract_next_data(html: str) -> str:
+    """Return the raw JSON inside <script id="__NEXT_DATA__">"""
+    start = html.find(NEXT_DATA_MARKER)
+    if start == -1:
+        raise RuntimeError('Could not find NEXT_DATA JSON on page')
+    start += len(NEXT_DATA_MARKER)
+    end = html.find('</script>', start)
+    if end == -1:
+        raise RuntimeError('Could not find NEXT_DATA JSON on page')
+    return html[start:end]
+
+
+def resolve_tiktok_music(page_url: str) -> Tuple[str, str]:
+    """
+    Fetches the TikTok music detail page, parses JSON and returns
+    (title, musicUrl). Results are cached per page for RESOLVE_TTL seconds.
+    """
+    cached = _resolved.get(page_url)
+    if cached is not None:
+        return cached
+
+    with phase('tiktok_mp3', 'metadata'):
+        # Retrieve page HTML
+        resp = http_session().get(page_url, timeout=REQUEST_TIMEOUT)
+        resp.raise_for_status()
+
+        # Extract title and musicUrl in a single pass over the JSON
+        data = json.loads(_extract_next_data(resp.text))
+        found = _find_keys(data, ('title', 'musicUrl'))
+    for key in ('title', 'musicUrl'):
+        if key not in found:
+            raise RuntimeError(f'{key} not found')
+
+    result = (found['title'], found['musicUrl'])
+    _resolved.set(page_url, result)
+    return result
+
+
+def forget_tiktok_music(page_url: str):
+    """Drop a cached page resolution, e.g. after its signed musicUrl expired"""
+    _resolved.pop(page_url)
+
+
+def tiktok_filename(title: str) -> str:
+    """Download name for a TikTok sound: the title without whitespace"""
+    base_name = re.sub(r'\s+', '', title)
+    return f"{base_name}.mp3"
+
+
+class _Relay:
+    """
+    Iterator over the upstream MP3's chunks. close() releases the upstream
+    connection and removes an incomplete tee file even if iteration never
+    started, which a generator's finally block can't do.
+    """
+
+    def __init__(self, dl_resp: 'requests.Response', tee_path: Optional[str], chunk_size: int):
+        self._dl_resp = dl_resp
+        self._tee_path = tee_path
+        self.finished = False
+        self._chunks = self._relay(chunk_size)
+
+    def __iter__(self) -> Iterator[bytes]:
+        return self
+
+    def __next__(self) -> bytes:
+        return next(self._chunks)
+
+    def _relay(self, chunk_size: int) -> Iterator[bytes]:
+        tee = open(self._tee_path, 'wb') if self._tee_path else None
+        started = time.perf_counter()
+        received = 0
+        try:
+            for chunk in self._dl_resp.iter_content(chunk_size=chunk_size):
+                if tee:
+                    tee.write(chunk)
+                received += len(chunk)
+                yield chunk
+            self.finished = True
+        finally:
+            if tee:
+                tee.close()
+            self._release()
+            observe_phase('tiktok_mp3', 'download', time.perf_counter() - started)
+            # The MP3 is relayed as-is, so what comes in goes out
+            record_bytes('tiktok_mp3', 'in', received)
+            record_bytes('tiktok_mp3', 'out', received)
+
+    def close(self):
+        """Stop relaying; safe to call more than once"""
+        self._chunks.close()
+        self._release()
+
+    def _release(self):
+        self._dl_resp.close()
+        if self._tee_path and not self.finished:
+            # Client went away or upstream failed - don't keep a partial file
             try:
-                return _find_key(item, key)
-            except KeyError:
-                continue
-    raise KeyError(f'{key} not found')
+                os.remove(self._tee_path)
+            except FileNotFoundError:
+                pass
+
+
+def stream_tiktok_mp3(music_url: str, tee_path: Optional[str] = None,
+                      chunk_size: int = STREAM_CHUNK_SIZE) -> Tuple[_Relay, Optional[int]]:
+    """
+    Open the upstream MP3 and return (chunks, content_length).
+
+    The request is made before returning so HTTP errors surface to the
+    caller while it can still answer with an error page. If tee_path is
+    given, every chunk is also written there; the file is complete once
+    the iterator is exhausted. Callers must close() chunks if they may not
+    exhaust it: that releases the connection and removes a partial file.
+    """
+    dl_resp = http_session().get(music_url, stream=True, timeout=REQUEST_TIMEOUT)
+    try:
+        dl_resp.raise_for_status()
+    except Exception:
+        dl_resp.close()
+        raise
+    length = dl_resp.headers.get('Content-Length')
+    return _Relay(dl_resp, tee_path, chunk_size), int(length) if length and length.isdigit() else None
 
 
-def convert_tiktok_to_mp3(page_url: str) -> Tuple[str, str]:
+def convert_tiktok_to_mp3(page_url: str, static_folder: str) -> Tuple[str, str]:
     """
     Fetches the TikTok music detail page, parses JSON to extract title and musicUrl,
-    downloads the MP3 to a temp file named after the title (no spaces),
+    downloads the MP3 named after the title (no spaces) into static/downloads,
     and returns a tuple of (filepath, filename).
     """
-    # Retrieve page HTML
-    resp = requests.get(page_url)
-    resp.raise_for_status()
-    html = resp.text
-
-    # Extract JSON from <script id="__NEXT_DATA__">
-    match = re.search(r'<script id="__NEXT_DATA__" type="application/json">(.*?)</script>', html, re.S)
-    if not match:
-        raise RuntimeError('Could not find NEXT_DATA JSON on page')
-    data = json.loads(match.group(1))
-
-    # Extract title and musicUrl
-    try:
-        title = _find_key(data, 'title')
-        music_url = _find_key(data, 'musicUrl')
-    except KeyError as e:
-        raise RuntimeError(str(e))
+    title, music_url = resolve_tiktok_music(page_url)
 
     # Sanitize filename: remove spaces and unsafe chars
-    base_name = re.sub(r'\s+', '', title)
-    filename = f"{base_name}.mp3"
+    filename = tiktok_filename(title)
 
-    # Download MP3
+    # Download MP3 into a work dir that is removed on success and failure alike
     tmpdir = tempfile.mkdtemp()
-    filepath = os.path.join(tmpdir, filename)
-    dl_resp = requests.get(music_url, stream=True)
-    dl_resp.raise_for_status()
+    try:
+        filepath = os.path.join(tmpdir, filename)
+        chunks, _ = stream_tiktok_mp3(music_url, tee_path=filepath)
+        for _ in chunks:
+            pass
 
-    with open(filepath, 'wb') as f:
-        for chunk in dl_resp.iter_content(chunk_size=8192):
-            f.write(chunk)
+        downloads_dir = os.path.join(static_folder, 'downloads')
+        os.makedirs(downloads_dir, exist_ok=True)
+        dst = os.path.join(downloads_dir, filename)
+        with phase('tiktok_mp3', 'move'):
+            shutil.move(filepath, dst)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
 
-    return filepath, filename
\ No newline at end of file
+    return dst, filename
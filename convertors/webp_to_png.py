@@ -1,15 +1,31 @@
+import io
 import os
 import re
 import tempfile
 import shutil
-from PIL import Image
-from typing import Tuple
+from typing import Any, BinaryIO, Dict, Tuple
 
-def convert_webp_to_png(file_path: str, static_folder: str) -> Tuple[str, str]:
+from .instrumentation import phase, record_bytes
+
+# PNG encoder settings, from fastest to smallest output. PIL's default
+# (compress_level 6) matches 'balanced'.
+PNG_PRESETS: Dict[str, Dict[str, Any]] = {
+    'fast': {'compress_level': 1},
+    'balanced': {'compress_level': 6},
+    'small': {'compress_level': 9, 'optimize': True},
+}
+
+# Encoded PNGs larger than this spill from memory to a temp file
+SPOOL_MAX_SIZE = 32 * 1024 * 1024
+
+def convert_webp_to_png(file_path: str, static_folder: str, preset: str = 'balanced') -> Tuple[str, str]:
     """
     Convert a WebP image to PNG format,
     move it into static/downloads, and return (filepath_on_disk, download_name).
     """
+    if preset not in PNG_PRESETS:
+        raise ValueError(f"Unknown PNG preset: {preset}")
+    
     # 1) make a temp work dir
     tmpdir = tempfile.mkdtemp()
     
@@ -18,8 +34,9 @@ def convert_webp_to_png(file_path: str, static_folder: str) -> Tuple[str, str]:
         filename = os.path.basename(file_path)
         base_name, ext = os.path.splitext(filename)
         
-        # 2) Load the image file using PIL
+        # 2) Load the image file using PIL (imported here so only workers that convert images load it)
         if ext.lower() == '.webp':
+            from PIL import Image
             img = Image.open(file_path)
         else:
             raise ValueError("Unsupported file format. Please upload a WebP image file.")
@@ -27,13 +44,17 @@ def convert_webp_to_png(file_path: str, static_folder: str) -> Tuple[str, str]:
         # 3) Convert to PNG
         png_filename = f"{base_name}.png"
         png_path = os.path.join(tmpdir, png_filename)
-        img.save(png_path, format="PNG")
+        with phase('webp_to_png', 'transcode'):
+            img.save(png_path, format="PNG", **PNG_PRESETS[preset])
+        record_bytes('webp_to_png', 'in', os.path.getsize(file_path))
+        record_bytes('webp_to_png', 'out', os.path.getsize(png_path))
         
         # 4) Move to static/downloads
         downloads_dir = os.path.join(static_folder, 'downloads')
         os.makedirs(downloads_dir, exist_ok=True)
         dst = os.path.join(downloads_dir, png_filename)
-        shutil.move(png_path, dst)
+        with phase('webp_to_png', 'move'):
+            shutil.move(png_path, dst)
         
         # 5) Clean up temp dir
         shutil.rmtree(tmpdir, ignore_errors=True)
@@ -48,3 +69,45 @@ def convert_webp_to_png(file_path: str, static_folder: str) -> Tuple[str, str]:
         # Clean up on error
         shutil.rmtree(tmpdir, ignore_errors=True)
         raise e
+
+
+def convert_webp_stream_to_png(stream: BinaryIO, filename: str, preset: str = 'balanced',
+                               spool_max_size: int = SPOOL_MAX_SIZE) -> Tuple[BinaryIO, str]:
+    """
+    Convert a WebP image read from a file-like object to PNG without
+    touching static/, and return (png_buffer, download_name).
+
+    The PNG is encoded into a SpooledTemporaryFile that stays in memory up
+    to spool_max_size bytes; the buffer is rewound and ready to send.
+    """
+    base_name, ext = os.path.splitext(os.path.basename(filename))
+    if ext.lower() != '.webp':
+        raise ValueError("Unsupported file format. Please upload a WebP image file.")
+    if preset not in PNG_PRESETS:
+        raise ValueError(f"Unknown PNG preset: {preset}")
+
+    from PIL import Image
+
+    buffer = tempfile.SpooledTemporaryFile(max_size=spool_max_size)
+    try:
+        with phase('webp_to_png', 'transcode'), Image.open(stream) as img:
+            img.save(buffer, format="PNG", **PNG_PRESETS[preset])
+    except Exception:
+        buffer.close()
+        raise
+    record_bytes('webp_to_png', 'out', buffer.tell())
+    buffer.seek(0)
+
+    safe = re.sub(r'\W+', '', base_name)
+    return buffer, f"{safe}.png"
+
+
+def convert_webp_bytes_to_png(data: bytes, filename: str, preset: str = 'balanced') -> Tuple[str, bytes]:
+    """
+    Convert WebP bytes to PNG bytes and return (download_name, png_bytes).
+
+    Takes and returns plain bytes so it can run in a worker process.
+    """
+    png_buffer, download_name = convert_webp_stream_to_png(io.BytesIO(data), filename, preset)
+    with png_buffer:
+        return download_name, png_buffer.read()
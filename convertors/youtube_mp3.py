@@ -1,155 +1,230 @@
+import logging
 import os
 import re
 import tempfile
 import shutil
 import subprocess
-from yt_dlp import YoutubeDL
-from typing import Tuple, Dict, Any
+from typing import Optional, Tuple, Dict, Any
 
-def convert_youtube_to_mp3(url: str, static_folder: str, progress_callback=None) -> Tuple[str, str]:
+from .instrumentation import phase, record_bytes
+from .progress import ProgressPublisher
+from .remux import codecs_from_info, remux_args, remux_or_transcode
+from .ytdl import extract_and_download, get_video_info, is_direct_format, iter_format_bytes, parse_video_id, \
+    select_format
+
+# Audio outputs. yt-dlp's FFmpegExtractAudio stream-copies when the source
+# already has the target codec (AAC for m4a, MP3 for mp3), so 'm4a' picks
+# an AAC source and normally finishes without any re-encoding.
+AUDIO_FORMATS = {
+    'mp3': {'format': 'bestaudio/best', 'codec': 'mp3', 'quality': '192', 'mimetype': 'audio/mpeg'},
+    'm4a': {'format': 'bestaudio[ext=m4a]/bestaudio/best', 'codec': 'aac', 'quality': 'source', 'mimetype': 'audio/mp4'},
+}
+
+# Feed downloaded bytes straight into ffmpeg so downloading and encoding
+# overlap. Formats that are not plain HTTP (DASH/HLS fragments) and any
+# pipeline failure fall back to the regular download-then-convert path.
+PIPELINE = os.environ.get('YOUTUBE_PIPELINE', '1') == '1'
+
+logger = logging.getLogger(__name__)
+
+
+def _convert_pipelined(url: str, cache_key: Optional[str], out_path: str, audio_format: str,
+                       progress: ProgressPublisher) -> Optional[Dict[str, Any]]:
+    """
+    Download the selected audio format and encode it in one pass: bytes are
+    written to ffmpeg's stdin as they arrive and ffmpeg writes out_path.
+    Returns the selected format's info, or None if the format can't be
+    fetched directly and the caller should use the regular path.
+    """
+    fmt = select_format(get_video_info(url, cache_key), AUDIO_FORMATS[audio_format]['format'])
+    if not is_direct_format(fmt):
+        logger.debug(f"Format {fmt.get('format_id')} ({fmt.get('protocol')}) can't be piped, using regular download")
+        return None
+
+    total = fmt.get('filesize') or fmt.get('filesize_approx')
+    stderr = tempfile.TemporaryFile()
+    # -xerror: an MP4 with its index at the end can't be demuxed from a pipe,
+    # and ffmpeg would otherwise exit 0 with an empty output file
+    process = subprocess.Popen(
+        ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-xerror', '-y', '-i', 'pipe:0']
+        + remux_args(codecs_from_info(fmt), audio_format) + [out_path],
+        stdin=subprocess.PIPE, stderr=stderr
+    )
+
+    def failure() -> RuntimeError:
+        stderr.seek(0)
+        return RuntimeError(f"Pipelined conversion failed: {stderr.read().decode('utf-8', errors='replace')}")
+
+    try:
+        received = 0
+        try:
+            for chunk in iter_format_bytes(fmt):
+                process.stdin.write(chunk)
+                received += len(chunk)
+                if total:
+                    percent = min(95, 5 + int(received / total * 90))
+                    if progress.due(percent):
+                        progress.publish(percent, f"Downloading and converting: {received * 100 / total:.1f}% complete")
+            process.stdin.close()
+            record_bytes('youtube_mp3', 'in', received)
+        except BrokenPipeError:
+            # ffmpeg gave up on the input; its stderr explains why
+            process.wait()
+            raise failure()
+        if process.wait() != 0:
+            raise failure()
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        stderr.close()
+    return fmt
+
+def convert_youtube_to_mp3(url: str, static_folder: str, progress_callback=None,
+                           audio_format: str = 'mp3') -> Tuple[str, str]:
     """
-    Download audio from a YouTube URL, convert to MP3,
+    Download audio from a YouTube URL, convert to MP3 (or remux to M4A),
     move it into static/downloads, and return (filepath_on_disk, download_name).
     
     Args:
         url: YouTube URL to convert
         static_folder: Flask static folder path
         progress_callback: Optional callback function to update progress (receives percentage and message)
+        audio_format: Output format, a key of AUDIO_FORMATS
     """
+    if audio_format not in AUDIO_FORMATS:
+        raise ValueError(f"Unsupported audio format: {audio_format}")
+    output = AUDIO_FORMATS[audio_format]
+    
     # 1) make a temp work dir
     tmpdir = tempfile.mkdtemp()
     
     try:
         # Extract video ID from URL for safe filename
-        video_id = url.split("v=")[-1].split("&")[0] if "v=" in url else "video"
+        video_id = parse_video_id(url) or "video"
         safe_filename = f"youtube_{video_id}"
         
+        # Updates are coalesced before they reach progress_callback
+        progress = ProgressPublisher(progress_callback, f"youtube_mp3 {video_id}")
+        
         # Define progress hook to capture download progress
         def progress_hook(d):
             if d['status'] == 'downloading':
-                # Extract progress percentage
-                if '_percent_str' in d:
-                    percent_str = d['_percent_str'].strip()
-                    percent = float(percent_str.replace('%', ''))
-                    
-                    # Print raw progress for debugging
-                    print(f"Download progress: {percent_str}")
-                    
-                    # Calculate download-phase percentage (5-95%)
-                    # Use a more linear progression that feels better: 
-                    # - 0-25% of download → 5-30% of total progress
-                    # - 25-75% of download → 30-70% of total progress
-                    # - 75-100% of download → 70-95% of total progress
-                    if percent < 25:
-                        download_percent = 5 + (percent * 1)  # 5-30%
-                    elif percent < 75:
-                        download_percent = 30 + ((percent - 25) * 0.8)  # 30-70%
-                    else:
-                        download_percent = 70 + ((percent - 75) * 1)  # 70-95%
-                    
-                    download_percent = min(95, max(5, int(download_percent)))
-                    
-                    if progress_callback:
-                        # Call the progress callback with percentage and message
-                        progress_callback(
-                            download_percent, 
-                            f"Downloading: {percent_str} complete",
-                            False  # Not complete yet
-                        )
-                elif 'downloaded_bytes' in d and 'total_bytes' in d and d['total_bytes'] > 0:
-                    # Alternative calculation if percent_str is not available
-                    percent = (d['downloaded_bytes'] / d['total_bytes']) * 100
-                    download_percent = max(5, int(percent * 0.7))
-                    
-                    if progress_callback:
-                        progress_callback(
-                            download_percent,
-                            f"Downloading: {percent:.1f}% complete",
-                            False  # Not complete yet
-                        )
+                # Byte counts when yt-dlp knows the size, its formatted percentage otherwise
+                total = d.get('total_bytes') or d.get('total_bytes_estimate')
+                if total:
+                    percent = d.get('downloaded_bytes', 0) / total * 100
+                elif '_percent_str' in d:
+                    percent = float(d['_percent_str'].strip().replace('%', ''))
+                else:
+                    return
+                
+                # Calculate download-phase percentage (5-95%)
+                # Use a more linear progression that feels better: 
+                # - 0-25% of download → 5-30% of total progress
+                # - 25-75% of download → 30-70% of total progress
+                # - 75-100% of download → 70-95% of total progress
+                if percent < 25:
+                    download_percent = 5 + (percent * 1)  # 5-30%
+                elif percent < 75:
+                    download_percent = 30 + ((percent - 25) * 0.8)  # 30-70%
+                else:
+                    download_percent = 70 + ((percent - 75) * 1)  # 70-95%
+                
+                download_percent = min(95, max(5, int(download_percent)))
+                # Only build the message for updates that get passed on
+                if progress.due(download_percent):
+                    progress.publish(download_percent, f"Downloading: {percent:.1f}% complete")
             
             elif d['status'] == 'finished':
-                if progress_callback:
-                    progress_callback(70, "Download complete. Converting to MP3...", False)  # Not complete until MP3 is ready
+                # Not complete until the file is ready
+                progress.publish(70, f"Download complete. Converting to {audio_format.upper()}...")
         
-        # 2) tell yt_dlp to download best audio + convert to mp3 with safe filename
+        # 2) tell yt_dlp to download best audio + convert with safe filename
         ydl_opts = {
-            'format': 'bestaudio/best',
+            'format': output['format'],
             'outtmpl': os.path.join(tmpdir, safe_filename + '.%(ext)s'),  # Use safe filename pattern
             'postprocessors': [{
                 'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '192',
+                'preferredcodec': audio_format,
+                'preferredquality': output['quality'] if output['quality'] != 'source' else None,
             }],
             'progress_hooks': [progress_hook],
-            'verbose': True,
-            'ffmpeg_location': '/usr/bin/ffmpeg'
         }
         
-        with YoutubeDL(ydl_opts) as ydl:
-            if progress_callback:
-                progress_callback(5, "Fetching video information...")
-                
-            info = ydl.extract_info(url, download=True)
-            title = info.get('title', 'Unknown Title')
-            
-            # Get a clean, readable title for the download name
-            clean_title = re.sub(r'[^\w\s-]', '', title)
-            clean_title = re.sub(r'\s+', '_', clean_title)
-            
-            if progress_callback:
-                progress_callback(80, "Processing audio...")
+        progress.publish(5, "Fetching video information...")
+        
+        # Metadata comes from the shared info cache when this video was seen recently
+        cache_key = video_id if video_id != "video" else None
+        with phase('youtube_mp3', 'metadata'):
+            get_video_info(url, cache_key)
+        info = None
+        pipelined = False
+        if PIPELINE:
+            try:
+                with phase('youtube_mp3', 'download_transcode'):
+                    info = _convert_pipelined(url, cache_key, os.path.join(tmpdir, f"{safe_filename}.{audio_format}"),
+                                              audio_format, progress)
+                pipelined = info is not None
+            except Exception as e:
+                logger.warning(f"Pipelined conversion failed for {url}, falling back: {e}")
+                for leftover in os.listdir(tmpdir):
+                    os.remove(os.path.join(tmpdir, leftover))
+        if info is None:
+            # Includes yt-dlp's own audio extraction
+            with phase('youtube_mp3', 'download'):
+                info = extract_and_download(url, ydl_opts, cache_key=cache_key)
+        title = info.get('title', 'Unknown Title')
+        
+        # Get a clean, readable title for the download name
+        clean_title = re.sub(r'[^\w\s-]', '', title)
+        clean_title = re.sub(r'\s+', '_', clean_title)
+        
+        if not pipelined:
+            progress.publish(80, "Processing audio...")
         
         # 3) The output file should be predictable now
-        mp3_filename = f"{safe_filename}.mp3"
-        mp3_path = os.path.join(tmpdir, mp3_filename)
+        audio_filename = f"{safe_filename}.{audio_format}"
+        audio_path = os.path.join(tmpdir, audio_filename)
         
-        if not os.path.exists(mp3_path):
-            # Look for any mp3 file if the expected one doesn't exist
-            mp3_files = [f for f in os.listdir(tmpdir) if f.lower().endswith('.mp3')]
-            if mp3_files:
-                mp3_filename = mp3_files[0]
-                mp3_path = os.path.join(tmpdir, mp3_filename)
+        if not os.path.exists(audio_path):
+            # Look for any file of the right type if the expected one doesn't exist
+            audio_files = [f for f in os.listdir(tmpdir) if f.lower().endswith(f'.{audio_format}')]
+            if audio_files:
+                audio_filename = audio_files[0]
+                audio_path = os.path.join(tmpdir, audio_filename)
             else:
                 # Try to find any files and convert if needed
                 source_files = os.listdir(tmpdir)
                 if not source_files:
                     raise FileNotFoundError("No files were downloaded")
                     
-                # Take the first downloaded file and convert it manually
+                # Take the first downloaded file and convert it manually,
+                # copying the audio stream when its codec already fits
                 source_file = os.path.join(tmpdir, source_files[0])
+                with phase('youtube_mp3', 'transcode'):
+                    copied = remux_or_transcode(source_file, audio_path, audio_format)
+                logger.debug(f"Manually {'remuxed' if copied else 'transcoded'} {source_file} to {audio_path}")
                 
-                try:
-                    print(f"Manually converting {source_file} to {mp3_path}")
-                    subprocess.run([
-                        'ffmpeg', '-i', source_file,
-                        '-vn',  # No video
-                        '-ar', '44100',  # Audio sample rate
-                        '-ac', '2',  # Stereo
-                        '-b:a', '192k',  # Bitrate
-                        mp3_path
-                    ], check=True, capture_output=True, text=True)
-                except subprocess.CalledProcessError as e:
-                    raise RuntimeError(f"Manual FFmpeg conversion failed: {e.stderr}")
-                
-                if not os.path.exists(mp3_path):
-                    raise FileNotFoundError("MP3 not found after conversion attempts")
+                if not os.path.exists(audio_path):
+                    raise FileNotFoundError(f"{audio_format.upper()} not found after conversion attempts")
 
         # 4) Move the file to static/downloads
         downloads_dir = os.path.join(static_folder, 'downloads')
         os.makedirs(downloads_dir, exist_ok=True)
         
-        dst = os.path.join(downloads_dir, mp3_filename)
-        shutil.move(mp3_path, dst)
+        dst = os.path.join(downloads_dir, audio_filename)
+        record_bytes('youtube_mp3', 'out', os.path.getsize(audio_path))
+        with phase('youtube_mp3', 'move'):
+            shutil.move(audio_path, dst)
 
         # 5) Create a sensible download name using the video title
-        download_name = f"{clean_title or safe_filename}.mp3"
+        download_name = f"{clean_title or safe_filename}.{audio_format}"
         
         # Final progress update to indicate completion
-        if progress_callback:
-            progress_callback(100, "Conversion complete! Your file is ready for download.", True)
+        progress.publish(100, "Conversion complete! Your file is ready for download.", True)
         
-        print(f"Returning file path: {dst}, download name: {download_name}")
+        logger.debug("Returning file path: %s, download name: %s", dst, download_name)
         return dst, download_name
         
     except Exception as e:
@@ -1,18 +1,16 @@
+import logging
 import os
 import re
 import tempfile
 import shutil
-import subprocess
-from yt_dlp import YoutubeDL
 from typing import Tuple, Dict, Any
 
-import os
-import re
-import tempfile
-import shutil
-import subprocess
-from yt_dlp import YoutubeDL
-from typing import Tuple, Dict, Any
+from .instrumentation import phase, record_bytes
+from .progress import ProgressPublisher
+from .remux import codecs_from_info, fits_container, remux_or_transcode
+from .ytdl import MP4_FORMAT, extract_and_download, get_video_info, parse_video_id
+
+logger = logging.getLogger(__name__)
 
 def sanitize_filename(filename):
     """Remove all non-alphanumeric characters from filename"""
@@ -25,27 +23,68 @@ def sanitize_filename(filename):
     # Return sanitized name with original extension
     return f"{safe_name}{ext}"
 
-def convert_youtube_to_mp4(url: str, static_folder: str) -> Tuple[str, str]:
+def convert_youtube_to_mp4(url: str, static_folder: str, progress_callback=None) -> Tuple[str, str]:
     """
     Download video from a YouTube URL in MP4 format,
     move it into static/downloads, and return (filepath_on_disk, download_name).
+    
+    Args:
+        url: YouTube URL to convert
+        static_folder: Flask static folder path
+        progress_callback: Optional callback function to update progress (receives percentage and message)
     """
     # 1) temp work dir
     tmpdir = tempfile.mkdtemp()
     
     try:
-        # 2) download best mp4 into tmpdir
+        # Video and audio are downloaded as separate streams; each one gets
+        # an equal share of the 5-90% download range
+        streams_finished = [0]
+        # Updates are coalesced before they reach progress_callback
+        progress = ProgressPublisher(progress_callback, f"youtube_mp4 {parse_video_id(url)}")
+        
+        def progress_hook(d):
+            if not progress_callback:
+                return
+            if d['status'] == 'downloading':
+                total = d.get('total_bytes') or d.get('total_bytes_estimate')
+                if total:
+                    percent = d.get('downloaded_bytes', 0) / total * 100
+                    requested = d.get('info_dict', {}).get('requested_formats') or [None]
+                    share = 85 / len(requested)
+                    overall = 5 + share * min(streams_finished[0], len(requested) - 1) + share * percent / 100
+                    overall = min(90, int(overall))
+                    # Only build the message for updates that get passed on
+                    if progress.due(overall):
+                        progress.publish(overall, f"Downloading: {percent:.1f}% complete")
+            elif d['status'] == 'finished':
+                streams_finished[0] += 1
+        
+        def postprocessor_hook(d):
+            if not progress_callback:
+                return
+            if d['status'] == 'started' and d.get('postprocessor') == 'Merger':
+                progress.publish(92, "Merging video and audio...")
+            elif d['status'] == 'finished' and d.get('postprocessor') == 'Merger':
+                progress.publish(97, "Finalizing video...")
+        
+        # 2) download best mp4 into tmpdir, preferring H.264 + AAC (see MP4_FORMAT)
         ydl_opts = {
-            'format': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best',
+            'format': MP4_FORMAT,
             'outtmpl': os.path.join(tmpdir, '%(title)s.%(ext)s'),
             'merge_output_format': 'mp4',
-            'verbose': True,  # Add verbose output for debugging
-            'ffmpeg_location': '/usr/bin/ffmpeg'  # Explicitly set ffmpeg path
+            'progress_hooks': [progress_hook],
+            'postprocessor_hooks': [postprocessor_hook],
         }
         
-        with YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=True)
-            title = info.get('title', 'video')
+        progress.publish(2, "Fetching video information...")
+        cache_key = parse_video_id(url)
+        with phase('youtube_mp4', 'metadata'):
+            get_video_info(url, cache_key)
+        # Includes yt-dlp merging the video and audio streams
+        with phase('youtube_mp4', 'download'):
+            info = extract_and_download(url, ydl_opts, cache_key=cache_key)
+        title = info.get('title', 'video')
 
         # 3) Find all files in the temp directory
         all_files = os.listdir(tmpdir)
@@ -69,16 +108,18 @@ def convert_youtube_to_mp4(url: str, static_folder: str) -> Tuple[str, str]:
             mp4_filename = f"{safe_base_name}.mp4"
             mp4_path = os.path.join(tmpdir, mp4_filename)
             
-            try:
-                subprocess.run([
-                    'ffmpeg', '-i', source_path,
-                    '-c:v', 'libx264',
-                    '-c:a', 'aac',
-                    mp4_path
-                ], check=True, capture_output=True, text=True)
-                mp4_list = [mp4_filename]
-            except subprocess.CalledProcessError as e:
-                raise RuntimeError(f"Manual FFmpeg conversion failed: {e.stderr}")
+            # Streams that are already H.264/AAC are copied; only the rest is encoded
+            with phase('youtube_mp4', 'transcode'):
+                remux_or_transcode(source_path, mp4_path, 'mp4')
+            mp4_list = [mp4_filename]
+        elif not fits_container(codecs_from_info(info), 'mp4'):
+            # No H.264 source was offered; re-encode only the stream(s)
+            # that aren't H.264/AAC so every cached MP4 plays everywhere
+            original_path = os.path.join(tmpdir, mp4_list[0])
+            reencoded_path = os.path.join(tmpdir, f"reencoded_{mp4_list[0]}")
+            with phase('youtube_mp4', 'transcode'):
+                remux_or_transcode(original_path, reencoded_path, 'mp4')
+            os.replace(reencoded_path, original_path)
         
         if not mp4_list:
             raise FileNotFoundError("MP4 not found after download/conversion")
@@ -101,13 +142,18 @@ def convert_youtube_to_mp4(url: str, static_folder: str) -> Tuple[str, str]:
         os.makedirs(downloads_dir, exist_ok=True)
         
         dst = os.path.join(downloads_dir, sanitized_filename)
-        shutil.move(src, dst)
+        record_bytes('youtube_mp4', 'out', os.path.getsize(src))
+        with phase('youtube_mp4', 'move'):
+            shutil.move(src, dst)
 
         # 5) Create a download-friendly name
         base, _ = os.path.splitext(sanitized_filename)
         download_name = f"{base}.mp4"
         
-        print(f"Returning file path: {dst}, download name: {download_name}")
+        # Final progress update to indicate completion
+        progress.publish(100, "Conversion complete! Your file is ready for download.", True)
+        
+        logger.debug("Returning file path: %s, download name: %s", dst, download_name)
         return dst, download_name
         
     except Exception as e:
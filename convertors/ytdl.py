@@ -0,0 +1,313 @@
+import copy
+import logging
+import os
+import queue
+import re
+import threading
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Dict, Iterator, Optional
+
+from .ttl_cache import TTLCache
+
+if TYPE_CHECKING:
+    import requests
+    from yt_dlp import YoutubeDL
+
+logger = logging.getLogger(__name__)
+
+FFMPEG_LOCATION = '/usr/bin/ffmpeg'
+
+# yt-dlp console output is very chatty; keep it off unless debugging
+VERBOSE = os.environ.get('YDL_VERBOSE', '0') == '1'
+
+# Metadata extractors kept ready per process
+POOL_SIZE = int(os.environ.get('YDL_POOL_SIZE', 4))
+
+# extract_info results are reused for this long. Format URLs are signed and
+# expire after a few hours, so keep it well below that.
+INFO_TTL = int(os.environ.get('YDL_INFO_TTL', 1800))
+
+# Bitrate of the MP3s we produce, used for output size estimates
+MP3_BITRATE_KBPS = 192
+
+# Watch, short-link, shorts, embed and live URLs on any youtube.com subdomain
+_VIDEO_ID_RE = re.compile(
+    r'(?:youtube(?:-nocookie)?\.com/(?:watch\?(?:.*&)?v=|shorts/|embed/|live/|v/)|youtu\.be/)'
+    r'([A-Za-z0-9_-]{11})(?![A-Za-z0-9_-])'
+)
+
+# The MP4 converter's format selection. H.264 + AAC sources are preferred
+# so merging them is a plain remux rather than a transcode.
+MP4_FORMAT = ('bestvideo[ext=mp4][vcodec^=avc1]+bestaudio[ext=m4a]/best[ext=mp4][vcodec^=avc1]/'
+              'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best')
+
+# Protocols we can fetch ourselves with plain (ranged) HTTP requests
+DIRECT_PROTOCOLS = ('http', 'https')
+
+# Bytes per ranged request when fetching a format directly. YouTube
+# throttles long single responses, so yt-dlp also fetches in ~10 MB ranges.
+HTTP_CHUNK_SIZE = 10 * 1024 * 1024
+
+# Read size while relaying a range
+READ_SIZE = 64 * 1024
+
+# Connect/read timeout for direct format downloads, in seconds
+REQUEST_TIMEOUT = (5, 30)
+
+# yt-dlp and requests are imported on first use: yt-dlp alone is the bulk
+# of a worker's import time and memory, and many workers never need it
+_session: Optional['requests.Session'] = None
+_session_lock = threading.Lock()
+
+_pool: 'queue.LifoQueue[YoutubeDL]' = queue.LifoQueue(maxsize=POOL_SIZE)
+_info_cache = TTLCache(maxsize=512, ttl=INFO_TTL)
+_inflight: Dict[str, '_Flight'] = {}
+_inflight_lock = threading.Lock()
+
+
+class _Flight:
+    """A metadata extraction in progress, which other callers for the same key wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.info: Optional[Dict[str, Any]] = None
+        self.error: Optional[BaseException] = None
+
+
+def http_session() -> 'requests.Session':
+    """Keep-alive connections for direct format downloads, created on first use"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+            session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+            _session = session
+        return _session
+
+
+def base_options() -> Dict[str, Any]:
+    """Options shared by every YoutubeDL instance"""
+    return {
+        'quiet': not VERBOSE,
+        'no_warnings': not VERBOSE,
+        'verbose': VERBOSE,
+        'noprogress': True,
+        'ffmpeg_location': FFMPEG_LOCATION,
+    }
+
+
+@contextmanager
+def pooled_ydl() -> Iterator['YoutubeDL']:
+    """
+    Borrow a metadata-only YoutubeDL instance. Instances are not thread
+    safe, so each one is used by a single caller at a time and returned
+    to the pool afterwards; extractors it has initialized stay warm.
+    """
+    try:
+        ydl = _pool.get_nowait()
+    except queue.Empty:
+        from yt_dlp import YoutubeDL
+        ydl = YoutubeDL(base_options())
+    try:
+        yield ydl
+    finally:
+        try:
+            _pool.put_nowait(ydl)
+        except queue.Full:
+            ydl.close()
+
+
+def get_video_info(url: str, cache_key: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Return yt-dlp metadata for url without downloading, from cache when
+    possible. cache_key (normally the video ID) lets different URL forms
+    of the same video share an entry. Concurrent callers for the same key
+    wait for a single extraction instead of each fetching it.
+    """
+    key = cache_key or url
+    info = _info_cache.get(key)
+    if info is not None:
+        return info
+
+    with _inflight_lock:
+        flight = _inflight.get(key)
+        if flight is None:
+            # An extraction may have finished since the check above
+            info = _info_cache.get(key)
+            if info is not None:
+                return info
+            flight = _inflight[key] = _Flight()
+            leader = True
+        else:
+            leader = False
+
+    if not leader:
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.info
+
+    # The slot is always released, and waiters get the leader's exception if it fails
+    try:
+        with pooled_ydl() as ydl:
+            flight.info = ydl.sanitize_info(ydl.extract_info(url, download=False))
+        _info_cache.set(key, flight.info)
+    except BaseException as e:
+        flight.error = e
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+        flight.done.set()
+    return flight.info
+
+
+def forget_video_info(url: str, cache_key: Optional[str] = None):
+    """Drop cached metadata, e.g. after its format URLs stopped working"""
+    _info_cache.pop(cache_key or url)
+
+
+def download_with_info(info: Dict[str, Any], ydl_opts: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Download a video described by previously extracted info with the given
+    options (format, outtmpl, hooks, postprocessors). Format selection runs
+    against the cached format list, so no metadata request is made.
+    """
+    from yt_dlp import YoutubeDL
+
+    opts = base_options()
+    opts.update(ydl_opts)
+    with YoutubeDL(opts) as ydl:
+        return ydl.process_ie_result(copy.deepcopy(info), download=True)
+
+
+def extract_and_download(url: str, ydl_opts: Dict[str, Any], cache_key: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Download url using cached metadata when available. If the cached
+    format URLs have expired, the metadata is fetched again once.
+    """
+    from yt_dlp.utils import DownloadError
+
+    info = get_video_info(url, cache_key)
+    try:
+        return download_with_info(info, ydl_opts)
+    except DownloadError as e:
+        logger.info(f"Download with cached info failed, refreshing metadata: {e}")
+        forget_video_info(url, cache_key)
+        return download_with_info(get_video_info(url, cache_key), ydl_opts)
+
+
+def select_format(info: Dict[str, Any], format_spec: str) -> Dict[str, Any]:
+    """
+    Run yt-dlp's format selection on cached info without downloading.
+    The result carries the chosen format's url, protocol, http_headers and
+    codecs at the top level (or requested_formats when streams are merged).
+    """
+    from yt_dlp import YoutubeDL
+
+    opts = base_options()
+    opts['format'] = format_spec
+    with YoutubeDL(opts) as ydl:
+        return ydl.process_ie_result(copy.deepcopy(info), download=False)
+
+
+def is_direct_format(fmt: Dict[str, Any]) -> bool:
+    """True for a single progressive format that can be fetched with plain HTTP (not DASH/HLS fragments)"""
+    return (not fmt.get('requested_formats')
+            and fmt.get('protocol') in DIRECT_PROTOCOLS
+            and not fmt.get('fragments')
+            and bool(fmt.get('url')))
+
+
+def iter_format_bytes(fmt: Dict[str, Any], chunk_size: Optional[int] = None) -> Iterator[bytes]:
+    """
+    Yield the bytes of a directly downloadable format as they arrive,
+    fetching it in consecutive byte ranges.
+    """
+    chunk_size = chunk_size or (fmt.get('downloader_options') or {}).get('http_chunk_size') or HTTP_CHUNK_SIZE
+    headers = dict(fmt.get('http_headers') or {})
+    session = http_session()
+    start = 0
+    total = None
+    while total is None or start < total:
+        headers['Range'] = f'bytes={start}-{start + chunk_size - 1}'
+        with session.get(fmt['url'], headers=headers, stream=True, timeout=REQUEST_TIMEOUT) as response:
+            response.raise_for_status()
+            if response.status_code != 206:
+                # Server ignored the range and is sending the whole file
+                if start:
+                    raise RuntimeError("Server stopped honouring range requests")
+                yield from response.iter_content(READ_SIZE)
+                return
+            size = response.headers.get('Content-Range', '').rsplit('/', 1)[-1]
+            total = int(size) if size.isdigit() else None
+            received = 0
+            for data in response.iter_content(READ_SIZE):
+                received += len(data)
+                yield data
+        if not received:
+            break
+        start += received
+        if total is None and received < chunk_size:
+            break
+
+
+def parse_video_id(url: str) -> Optional[str]:
+    """Return the 11-character video ID from a YouTube URL, or None"""
+    match = _VIDEO_ID_RE.search(url or '')
+    return match.group(1) if match else None
+
+
+def _format_bytes(fmt: Dict[str, Any], duration: Optional[float]) -> Optional[int]:
+    """Exact or approximate size of one format, falling back to bitrate x duration"""
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if size:
+        return int(size)
+    if fmt.get('tbr') and duration:
+        return int(fmt['tbr'] * 1000 / 8 * duration)
+    return None
+
+
+def summarize_info(info: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Reduce extract_info output to what clients need before committing to a
+    download: title, duration, the available formats and estimated sizes of
+    the MP3 and MP4 outputs this app produces.
+    """
+    duration = info.get('duration')
+    formats = info.get('formats') or []
+    # Size the formats the MP4 converter would actually pick
+    mp4_bytes = None
+    if formats:
+        try:
+            selected = select_format(info, MP4_FORMAT)
+        except Exception as e:
+            logger.debug(f"No MP4 format selected for {info.get('id')}: {e}")
+        else:
+            sizes = [_format_bytes(fmt, duration) for fmt in selected.get('requested_formats') or [selected]]
+            mp4_bytes = sum(sizes) if None not in sizes else None
+
+    return {
+        'id': info.get('id'),
+        'title': info.get('title'),
+        'duration': duration,
+        'is_live': bool(info.get('is_live')),
+        'formats': [{
+            'format_id': fmt.get('format_id'),
+            'ext': fmt.get('ext'),
+            'vcodec': fmt.get('vcodec'),
+            'acodec': fmt.get('acodec'),
+            'height': fmt.get('height'),
+            'abr': fmt.get('abr'),
+            'tbr': fmt.get('tbr'),
+            'bytes': _format_bytes(fmt, duration),
+        } for fmt in formats if fmt.get('format_id')],
+        'estimated_bytes': {
+            'mp3': int(duration * MP3_BITRATE_KBPS * 1000 / 8) if duration else None,
+            'mp4': mp4_bytes,
+        },
+    }
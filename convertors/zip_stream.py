@@ -0,0 +1,75 @@
+import os
+import time
+import zipfile
+from typing import Iterable, Iterator, Tuple, Union
+
+# Copy size when adding files from disk
+COPY_CHUNK_SIZE = 256 * 1024
+
+
+class _Sink:
+    """
+    Write-only buffer handed to ZipFile. It has no tell()/seek(), so
+    ZipFile switches to streaming mode and writes data descriptors after
+    each member instead of seeking back to patch headers.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(entries: Iterable[Tuple[str, Union[bytes, str]]]) -> Iterator[bytes]:
+    """
+    Build a ZIP archive on the fly and yield it in pieces.
+
+    entries yields (name_in_archive, data) where data is either bytes or
+    a path to a file on disk; each member is emitted as soon as entries
+    produces it, so memory stays bounded by one member (bytes) or one copy
+    chunk (paths). Members are stored uncompressed since the converted
+    media is already compressed or is raw PCM that deflates poorly for
+    the CPU it costs.
+    """
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+        for name, data in entries:
+            if isinstance(data, bytes):
+                zf.writestr(name, data)
+            else:
+                info = zipfile.ZipInfo(name, date_time=time.localtime(os.path.getmtime(data))[:6])
+                with open(data, 'rb') as src, zf.open(info, 'w', force_zip64=True) as dst:
+                    while True:
+                        chunk = src.read(COPY_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        dst.write(chunk)
+                        pending = sink.drain()
+                        if pending:
+                            yield pending
+            pending = sink.drain()
+            if pending:
+                yield pending
+    yield sink.drain()
+
+
+def unique_name(name: str, taken: set) -> str:
+    """Return name, or name with a numeric suffix if it is already in taken; records the result"""
+    base, ext = os.path.splitext(name)
+    candidate = name
+    counter = 1
+    while candidate in taken:
+        candidate = f"{base}_{counter}{ext}"
+        counter += 1
+    taken.add(candidate)
+    return candidate
@@ -0,0 +1,184 @@
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Hashable, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ExpiryScheduler:
+    """
+    One reaper thread for everything that expires.
+
+    Deadlines live in a heap; rescheduling a key just records the new
+    deadline and the stale heap entry is skipped when it surfaces, so
+    extending an expiry on access is O(log n) and never stacks timers.
+    Periodic tasks (status purges, cache trimming) run on the same thread.
+
+    With autostart=False nothing runs until start() is called; a gunicorn
+    master that preloads the app must not own threads when it forks.
+    """
+
+    def __init__(self, autostart: bool = True):
+        self._heap = []
+        self._entries: Dict[Hashable, Tuple[float, Callable[[], None]]] = {}
+        self._periodic = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self._startup_tasks = []
+        self._autostart = autostart
+
+    def _ensure_thread(self):
+        # Started lazily (and restarted after a fork) so every worker
+        # process runs exactly one reaper.
+        if not self._autostart:
+            return
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name='expiry-reaper', daemon=True)
+        self._thread.start()
+
+    def start(self):
+        """Start the reaper thread in this process, e.g. in a worker after fork"""
+        with self._cond:
+            self._autostart = True
+            self._ensure_thread()
+
+    def schedule(self, key: Hashable, ttl: float, action: Callable[[], None]):
+        """Run action once key has gone ttl seconds without being rescheduled"""
+        deadline = time.time() + ttl
+        with self._cond:
+            self._entries[key] = (deadline, action)
+            heapq.heappush(self._heap, (deadline, next(self._seq), key))
+            self._ensure_thread()
+            self._cond.notify()
+
+    def cancel(self, key: Hashable):
+        with self._cond:
+            self._entries.pop(key, None)
+
+    def schedule_file(self, path: str, ttl: float):
+        """
+        Delete path once it has not been touched for ttl seconds.
+
+        Idleness is judged from the file's mtime when the deadline fires,
+        so a touch_file() from any worker process extends the lifetime.
+        """
+        def expire():
+            try:
+                idle = time.time() - os.path.getmtime(path)
+            except FileNotFoundError:
+                return
+            if idle < ttl:
+                # Touched since scheduling, possibly by another process
+                self.schedule(('file', path), ttl - idle, expire)
+                return
+            try:
+                os.remove(path)
+                logger.debug(f"Expired file removed: {path}")
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error(f"Error removing expired file {path}: {e}")
+
+        self.schedule(('file', path), ttl, expire)
+
+    def touch_file(self, path: str, ttl: float):
+        """Mark a file as used and push its expiry back by ttl seconds"""
+        try:
+            os.utime(path, None)
+        except FileNotFoundError:
+            return
+        self.schedule_file(path, ttl)
+
+    def every(self, interval: float, task: Callable[[], None]):
+        """Run task every interval seconds on the reaper thread"""
+        with self._cond:
+            self._periodic.append([time.time() + interval, interval, task])
+            self._ensure_thread()
+            self._cond.notify()
+
+    def at_startup(self, task: Callable[[], None]):
+        """Run task once when the reaper thread starts in this process"""
+        with self._cond:
+            self._startup_tasks.append(task)
+            self._ensure_thread()
+            self._cond.notify()
+
+    def _next_wakeup(self, now: float) -> float:
+        wakeup = now + 60
+        if self._heap:
+            wakeup = min(wakeup, self._heap[0][0])
+        for next_run, _, _ in self._periodic:
+            wakeup = min(wakeup, next_run)
+        return wakeup
+
+    def _run(self):
+        with self._cond:
+            startup, self._startup_tasks = self._startup_tasks, []
+        for task in startup:
+            self._call(task)
+
+        while True:
+            due = []
+            with self._cond:
+                now = time.time()
+                while self._heap and self._heap[0][0] <= now:
+                    deadline, _, key = heapq.heappop(self._heap)
+                    entry = self._entries.get(key)
+                    # Skip heap entries superseded by a later schedule()
+                    if entry is not None and entry[0] == deadline:
+                        del self._entries[key]
+                        due.append(entry[1])
+                for periodic in self._periodic:
+                    if periodic[0] <= now:
+                        periodic[0] = now + periodic[1]
+                        due.append(periodic[2])
+                due.extend(self._startup_tasks)
+                self._startup_tasks = []
+                if not due:
+                    self._cond.wait(max(0.0, self._next_wakeup(now) - now))
+                    continue
+            for action in due:
+                self._call(action)
+
+    @staticmethod
+    def _call(action: Callable[[], None]):
+        try:
+            action()
+        except Exception as e:
+            logger.exception(f"Expiry task failed: {e}")
+
+
+def sweep_directory(path: str, max_age: float, limit: int = 1000, keep: Optional[Set[str]] = None) -> int:
+    """
+    Remove files in path older than max_age seconds, looking at no more
+    than limit entries so a huge backlog cannot stall startup. Names in
+    keep are left alone. Returns the number of files removed.
+    """
+    if not os.path.isdir(path):
+        return 0
+    keep = keep or set()
+    cutoff = time.time() - max_age
+    removed = 0
+    with os.scandir(path) as it:
+        for entry in itertools.islice(it, limit):
+            if entry.name in keep or not entry.is_file(follow_symlinks=False):
+                continue
+            try:
+                if entry.stat(follow_symlinks=False).st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                logger.error(f"Error sweeping {entry.path}: {e}")
+    if removed:
+        logger.info(f"Swept {removed} orphaned files from {path}")
+    return removed
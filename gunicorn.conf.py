@@ -0,0 +1,23 @@
+"""
+Gunicorn settings, read from the working directory; command-line flags
+take precedence.
+
+PRELOAD_APP=1 imports the app and every converter's dependencies (yt-dlp,
+Pillow, requests) once in the master. Workers are forked with all of it
+already loaded and share those pages copy-on-write, so they boot faster and
+use less memory in total. Code changes then need a full restart rather
+than a HUP. Without it each worker imports the app itself and loads
+converter dependencies on first use.
+"""
+import os
+
+preload_app = os.environ.get('PRELOAD_APP', '0') == '1'
+
+
+def post_fork(server, worker):
+    if preload_app:
+        # The master imported the app without starting threads; each worker runs its own
+        # reaper and log writer
+        import app
+        app.log_handler.start()
+        app.reaper.start()
@@ -0,0 +1,134 @@
+import logging
+import queue
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SchedulerBusy(Exception):
+    """Raised when the job queue is full and a new job cannot be accepted."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Conversion queue is full, retry in {retry_after} seconds")
+        self.retry_after = retry_after
+
+
+class Job:
+    """A unit of work tracked by the JobScheduler."""
+
+    def __init__(self, key: Hashable, fn: Callable, args: Tuple, kwargs: Dict[str, Any]):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.state = 'queued'
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._done = threading.Event()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the job finishes, return False on timeout"""
+        return self._done.wait(timeout)
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+
+class JobScheduler:
+    """
+    Bounded worker pool for long running conversions.
+
+    Jobs are pushed onto a bounded queue and picked up by a fixed number
+    of worker threads. Submitting a job whose key is already queued or
+    running returns the existing job instead of starting a duplicate
+    (single-flight). When the queue is full, submit() raises SchedulerBusy
+    so the caller can answer with 503 + Retry-After.
+    """
+
+    def __init__(self, workers: int = 2, max_queue: int = 16, retry_after: int = 30):
+        self.workers = max(1, workers)
+        self.max_queue = max(1, max_queue)
+        self.retry_after = retry_after
+        self._queue: 'queue.Queue[Job]' = queue.Queue(maxsize=self.max_queue)
+        self._inflight: Dict[Hashable, Job] = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        self._active = 0
+
+    def _ensure_workers(self):
+        # Threads are started lazily so gunicorn workers forked from a
+        # preloaded master each get their own pool.
+        alive = [t for t in self._threads if t.is_alive()]
+        for i in range(self.workers - len(alive)):
+            t = threading.Thread(target=self._worker, name=f"job-worker-{len(alive) + i}", daemon=True)
+            t.start()
+            alive.append(t)
+        self._threads = alive
+
+    def submit(self, key: Hashable, fn: Callable, *args, **kwargs) -> Tuple[Job, bool]:
+        """
+        Queue fn(*args, **kwargs) under the given key.
+
+        Returns (job, created). created is False when an in-flight job
+        with the same key already exists and was returned instead.
+        """
+        with self._lock:
+            existing = self._inflight.get(key)
+            if existing is not None:
+                logger.debug(f"Attaching to in-flight job {existing.id} for {key}")
+                return existing, False
+
+            job = Job(key, fn, args, kwargs)
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                raise SchedulerBusy(self.retry_after)
+            self._inflight[key] = job
+            self._ensure_workers()
+
+        logger.debug(f"Queued job {job.id} for {key} (queue depth: {self._queue.qsize()})")
+        return job, True
+
+    def get(self, key: Hashable) -> Optional[Job]:
+        """Return the in-flight job for a key, if any"""
+        with self._lock:
+            return self._inflight.get(key)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            job.state = 'running'
+            job.started_at = time.time()
+            with self._lock:
+                self._active += 1
+            try:
+                job.result = job.fn(*job.args, **job.kwargs)
+                job.state = 'complete'
+            except Exception as e:
+                logger.exception(f"Job {job.id} for {job.key} failed: {e}")
+                job.error = e
+                job.state = 'error'
+            finally:
+                job.finished_at = time.time()
+                with self._lock:
+                    self._active -= 1
+                    if self._inflight.get(job.key) is job:
+                        del self._inflight[job.key]
+                job._done.set()
+                self._queue.task_done()
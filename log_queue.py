@@ -0,0 +1,103 @@
+import atexit
+import logging
+import os
+import queue
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+# Records waiting for the writer thread; beyond this new ones are dropped
+DEFAULT_MAX_QUEUE = 10000
+
+FORMAT = '%(asctime)s %(process)d %(levelname)s %(name)s: %(message)s'
+
+
+class BackgroundLogHandler(QueueHandler):
+    """
+    Logging handler that puts records on a queue for a writer thread, so
+    request and converter threads never wait on log I/O. When the queue is
+    full, records are dropped and counted rather than blocking the caller.
+
+    The writer thread is started lazily (and again after a fork) so every
+    process has its own. With autostart=False records are written directly
+    until start() is called; a gunicorn master that preloads the app must
+    not own threads when it forks.
+    """
+
+    def __init__(self, target: logging.Handler, max_queue: int = DEFAULT_MAX_QUEUE, autostart: bool = True):
+        super().__init__(queue.Queue(max_queue))
+        self.target = target
+        self.max_queue = max_queue
+        self.dropped = 0
+        self._listener: Optional[QueueListener] = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._autostart = autostart
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # The parent's writer thread doesn't exist here; the next record starts a new one
+        self._start_lock = threading.Lock()
+        self._listener = None
+        self._pid = None
+
+    def _ensure_listener(self) -> bool:
+        if self._pid == os.getpid():
+            return True
+        if not self._autostart:
+            return False
+        with self._start_lock:
+            if self._pid != os.getpid():
+                self.queue = queue.Queue(self.max_queue)
+                self._listener = QueueListener(self.queue, self.target, respect_handler_level=True)
+                self._listener.start()
+                self._pid = os.getpid()
+        return True
+
+    def start(self):
+        """Start the writer thread in this process, e.g. in a worker after fork"""
+        self._autostart = True
+        self._ensure_listener()
+
+    def stop(self):
+        """Write out queued records and stop the writer thread"""
+        with self._start_lock:
+            listener, self._listener, self._pid = self._listener, None, None
+        if listener is not None:
+            try:
+                listener.stop()
+            except queue.Full:
+                # No room for the stop sentinel; the daemon thread dies with the process
+                pass
+
+    def emit(self, record: logging.LogRecord):
+        if not self._ensure_listener():
+            self.target.handle(record)
+            return
+        super().emit(record)
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging(level: str = 'INFO', max_queue: int = DEFAULT_MAX_QUEUE,
+                      autostart: bool = True) -> BackgroundLogHandler:
+    """
+    Send all logging through a BackgroundLogHandler writing to stderr at
+    the given level, replacing any handlers on the root logger.
+    """
+    target = logging.StreamHandler(sys.stderr)
+    target.setFormatter(logging.Formatter(FORMAT))
+    handler = BackgroundLogHandler(target, max_queue=max_queue, autostart=autostart)
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+    atexit.register(handler.stop)
+    return handler
@@ -0,0 +1,182 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Latency buckets in seconds, from quick cache hits to long video jobs
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+
+def format_labels(labels: Dict[str, str]) -> str:
+    """Render labels in exposition format, sorted so equal label sets give equal strings"""
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+    return ','.join(f'{name}="{escape(value)}"' for name, value in sorted(labels.items()))
+
+
+_LE_RE = re.compile(r'(?:^|,)le="([^"]*)"')
+
+
+def _series_order(sample: Tuple[str, str, float]):
+    # Keep each label set's buckets together and in increasing order, then _sum and _count
+    name, labels, _ = sample
+    match = _LE_RE.search(labels)
+    le = float('inf') if match is None or match.group(1) == '+Inf' else float(match.group(1))
+    suffix = 0 if name.endswith('_bucket') else (1 if name.endswith('_sum') else 2)
+    return _LE_RE.sub('', labels), suffix, le
+
+
+def _sample(name: str, labels: str, value: float) -> str:
+    value = int(value) if float(value).is_integer() else value
+    return f"{name}{{{labels}}} {value}" if labels else f"{name} {value}"
+
+
+class MetricsRegistry:
+    """
+    Counters, histograms and gauges shared by all worker processes.
+
+    Updates accumulate in memory and are written to a SQLite database by
+    flush() (run periodically and before every scrape), so recording a
+    sample never waits on disk. Counters and histogram buckets are summed
+    into one row per series; gauges are stored per process and summed over
+    processes that flushed recently, so exited workers drop out.
+    """
+
+    def __init__(self, path: str, gauge_max_age: float = 60):
+        self.path = path
+        self.gauge_max_age = gauge_max_age
+        self._meta: Dict[str, Tuple[str, str]] = {}
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+        self._pending: Dict[Tuple[str, str], float] = defaultdict(float)
+        self._gauges: Dict[Tuple[str, str], float] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS counters ('
+            ' name TEXT NOT NULL,'
+            ' labels TEXT NOT NULL,'
+            ' value REAL NOT NULL,'
+            ' PRIMARY KEY (name, labels))'
+        )
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS gauges ('
+            ' name TEXT NOT NULL,'
+            ' labels TEXT NOT NULL,'
+            ' pid INTEGER NOT NULL,'
+            ' value REAL NOT NULL,'
+            ' updated_at REAL NOT NULL,'
+            ' PRIMARY KEY (name, labels, pid))'
+        )
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def counter(self, name: str, help_text: str):
+        self._meta[name] = ('counter', help_text)
+
+    def gauge(self, name: str, help_text: str):
+        self._meta[name] = ('gauge', help_text)
+
+    def histogram(self, name: str, help_text: str, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self._meta[name] = ('histogram', help_text)
+        self._buckets[name] = tuple(sorted(buckets))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        with self._lock:
+            self._pending[(name, format_labels(labels))] += value
+
+    def observe(self, name: str, value: float, **labels):
+        """
+        Add a histogram observation. Buckets are stored cumulatively, and
+        every bucket gets a row (zero if the value is above it) so each
+        label set is exposed with its full bucket list.
+        """
+        with self._lock:
+            for bound in self._buckets[name]:
+                self._pending[(f'{name}_bucket', format_labels(dict(labels, le=bound)))] += 1 if value <= bound else 0
+            self._pending[(f'{name}_bucket', format_labels(dict(labels, le='+Inf')))] += 1
+            self._pending[(f'{name}_sum', format_labels(labels))] += value
+            self._pending[(f'{name}_count', format_labels(labels))] += 1
+
+    def set(self, name: str, value: float, **labels):
+        """Set this process's value of a gauge"""
+        with self._lock:
+            self._gauges[(name, format_labels(labels))] = value
+
+    def flush(self):
+        """Write pending updates from this process to the shared database"""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(float)
+            gauges = dict(self._gauges)
+        if not pending and not gauges:
+            return
+        conn = self._connect()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(
+                'INSERT INTO counters (name, labels, value) VALUES (?, ?, ?) '
+                'ON CONFLICT(name, labels) DO UPDATE SET value = value + excluded.value',
+                [(name, labels, value) for (name, labels), value in pending.items()]
+            )
+            conn.executemany(
+                'INSERT OR REPLACE INTO gauges (name, labels, pid, value, updated_at) VALUES (?, ?, ?, ?, ?)',
+                [(name, labels, os.getpid(), value, now) for (name, labels), value in gauges.items()]
+            )
+            conn.execute('DELETE FROM gauges WHERE updated_at < ?', (now - self.gauge_max_age,))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            with self._lock:
+                for key, value in pending.items():
+                    self._pending[key] += value
+            raise
+
+    def render(self, extra: Optional[List[Tuple[str, str, str, Dict[str, str], float]]] = None) -> str:
+        """
+        Prometheus text exposition of every series across all processes.
+        extra adds computed samples as (name, type, help, labels, value).
+        """
+        self.flush()
+        conn = self._connect()
+        series: Dict[str, List[Tuple[str, str, float]]] = defaultdict(list)
+        for name, labels, value in conn.execute('SELECT name, labels, value FROM counters ORDER BY name, labels'):
+            base = name
+            for suffix in ('_bucket', '_sum', '_count'):
+                if name.endswith(suffix) and name[:-len(suffix)] in self._buckets:
+                    base = name[:-len(suffix)]
+            series[base].append((name, labels, value))
+        cutoff = time.time() - self.gauge_max_age
+        for name, labels, value in conn.execute(
+                'SELECT name, labels, SUM(value) FROM gauges WHERE updated_at >= ? GROUP BY name, labels '
+                'ORDER BY name, labels', (cutoff,)):
+            series[name].append((name, labels, value))
+
+        meta = dict(self._meta)
+        for name, kind, help_text, labels, value in extra or []:
+            meta.setdefault(name, (kind, help_text))
+            series[name].append((name, format_labels(labels), value))
+
+        lines = []
+        for base in sorted(series):
+            kind, help_text = meta.get(base, ('untyped', ''))
+            lines.append(f'# HELP {base} {help_text}')
+            lines.append(f'# TYPE {base} {kind}')
+            samples = series[base]
+            if kind == 'histogram':
+                samples = sorted(samples, key=_series_order)
+            lines.extend(_sample(name, labels, value) for name, labels, value in samples)
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,230 @@
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def cache_key(*parts: Any) -> str:
+    """Join key parts, e.g. ('youtube', video_id, 'mp3', 'mp3', '192'), into an index key"""
+    return '|'.join(str(p) for p in parts)
+
+
+class ResultCache:
+    """
+    Disk-budgeted cache of finished conversions.
+
+    Files live in a single directory (normally static/downloads) and are
+    tracked in a SQLite index that survives restarts and is shared by all
+    worker processes. When the total size exceeds max_bytes, entries are
+    evicted least-recently-used first ('lru') or least-frequently-used
+    first ('lfu').
+    """
+
+    POLICIES = {
+        'lru': 'last_access ASC',
+        'lfu': 'hits ASC, last_access ASC',
+    }
+
+    def __init__(self, root: str, index_path: str, max_bytes: int, policy: str = 'lru'):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown cache eviction policy: {policy}")
+        self.root = root
+        self.index_path = index_path
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self._local = threading.local()
+        os.makedirs(root, exist_ok=True)
+        os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+        self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.index_path, timeout=10, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            ' key TEXT PRIMARY KEY,'
+            ' filename TEXT NOT NULL UNIQUE,'
+            ' download_name TEXT,'
+            ' size INTEGER NOT NULL,'
+            ' created_at REAL NOT NULL,'
+            ' last_access REAL NOT NULL,'
+            ' hits INTEGER NOT NULL DEFAULT 0)'
+        )
+        conn.execute('CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _count(self, conn: sqlite3.Connection, name: str):
+        conn.execute(
+            'INSERT INTO counters (name, value) VALUES (?, 1) '
+            'ON CONFLICT(name) DO UPDATE SET value = value + 1',
+            (name,)
+        )
+
+    def _entry(self, row: Tuple) -> Dict[str, Any]:
+        return {
+            'key': row[0],
+            'path': os.path.join(self.root, row[1]),
+            'filename': row[1],
+            'download_name': row[2],
+            'size': row[3],
+            'created_at': row[4],
+            'last_access': row[5],
+            'hits': row[6],
+        }
+
+    def get(self, key: str, count: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached result and mark it as used.
+
+        Returns the entry (with 'path' and 'download_name') or None on a
+        miss. Pass count=False to refresh recency without touching the
+        hit/miss counters, e.g. when serving a file found earlier.
+        """
+        conn = self._connect()
+        row = conn.execute(
+            'SELECT key, filename, download_name, size, created_at, last_access, hits FROM entries WHERE key = ?',
+            (key,)
+        ).fetchone()
+        entry = self._entry(row) if row else None
+
+        if entry and not os.path.exists(entry['path']):
+            # File was removed behind our back - drop the stale index row
+            logger.warning(f"Cached file missing for {key}, dropping index entry")
+            conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+            entry = None
+
+        if entry:
+            conn.execute(
+                'UPDATE entries SET last_access = ?, hits = hits + ? WHERE key = ?',
+                (time.time(), 1 if count else 0, key)
+            )
+        if count:
+            self._count(conn, 'hits' if entry else 'misses')
+        return entry
+
+    def indexed(self, keys: Iterable[str]) -> Dict[str, int]:
+        """
+        {key: size} for the keys that have an index entry. Unlike get() this
+        neither checks the files nor refreshes recency, so status answers
+        stay free of filesystem calls; serving a file still goes through get().
+        """
+        keys = tuple(keys)
+        if not keys:
+            return {}
+        placeholders = ','.join('?' * len(keys))
+        rows = self._connect().execute(f'SELECT key, size FROM entries WHERE key IN ({placeholders})', keys).fetchall()
+        return dict(rows)
+
+    def put(self, key: str, src_path: str, filename: str, download_name: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Move a finished file into the cache under the given filename and
+        record it in the index, evicting older entries to stay in budget.
+        """
+        dst = os.path.join(self.root, filename)
+        if os.path.abspath(src_path) != os.path.abspath(dst):
+            shutil.move(src_path, dst)
+        size = os.path.getsize(dst)
+        now = time.time()
+
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM entries WHERE filename = ? AND key != ?', (filename, key))
+            conn.execute(
+                'INSERT INTO entries (key, filename, download_name, size, created_at, last_access, hits) '
+                'VALUES (?, ?, ?, ?, ?, ?, 0) '
+                'ON CONFLICT(key) DO UPDATE SET filename = excluded.filename, '
+                'download_name = excluded.download_name, size = excluded.size, created_at = excluded.created_at, '
+                'last_access = excluded.last_access',
+                (key, filename, download_name, size, now, now)
+            )
+            evicted = self._evict(conn, keep=key)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+        for path in evicted:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        logger.debug(f"Cached {key} as {filename} ({size} bytes), evicted {len(evicted)} entries")
+        return self.get(key, count=False)
+
+    def _evict(self, conn: sqlite3.Connection, keep: str):
+        """Remove index rows until the cache fits the budget; return file paths to delete"""
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total <= self.max_bytes:
+            return []
+
+        evicted = []
+        rows = conn.execute(
+            f'SELECT key, filename, size FROM entries WHERE key != ? ORDER BY {self.POLICIES[self.policy]}',
+            (keep,)
+        ).fetchall()
+        for key, filename, size in rows:
+            if total <= self.max_bytes:
+                break
+            conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+            self._count(conn, 'evictions')
+            evicted.append(os.path.join(self.root, filename))
+            total -= size
+        return evicted
+
+    def discard(self, key: str):
+        """Remove an entry and its file"""
+        conn = self._connect()
+        row = conn.execute('SELECT filename FROM entries WHERE key = ?', (key,)).fetchone()
+        if row:
+            conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+            try:
+                os.remove(os.path.join(self.root, row[0]))
+            except FileNotFoundError:
+                pass
+
+    def expire_idle(self, max_idle: float) -> int:
+        """Remove entries not accessed for max_idle seconds, return how many"""
+        conn = self._connect()
+        cutoff = time.time() - max_idle
+        rows = conn.execute('SELECT key, filename FROM entries WHERE last_access < ?', (cutoff,)).fetchall()
+        for key, filename in rows:
+            conn.execute('DELETE FROM entries WHERE key = ? AND last_access < ?', (key, cutoff))
+            try:
+                os.remove(os.path.join(self.root, filename))
+            except FileNotFoundError:
+                pass
+        return len(rows)
+
+    def filenames(self) -> Set[str]:
+        """Names of all files owned by the cache"""
+        return {row[0] for row in self._connect().execute('SELECT filename FROM entries')}
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and current usage"""
+        conn = self._connect()
+        counters = dict(conn.execute('SELECT name, value FROM counters').fetchall())
+        entries, used = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+        hits = counters.get('hits', 0)
+        misses = counters.get('misses', 0)
+        return {
+            'entries': entries,
+            'bytes': used,
+            'max_bytes': self.max_bytes,
+            'policy': self.policy,
+            'hits': hits,
+            'misses': misses,
+            'evictions': counters.get('evictions', 0),
+            'hit_ratio': hits / (hits + misses) if hits + misses else 0.0,
+        }
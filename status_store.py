@@ -0,0 +1,368 @@
+import json
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+# Default lifetime of a status entry in seconds. Every write refreshes it.
+DEFAULT_TTL = 3600
+
+
+def _deadline(timeout: float) -> float:
+    # A NaN deadline never passes, so the wait would never end
+    if not math.isfinite(timeout):
+        raise ValueError(f"Wait timeout must be a finite number of seconds, not {timeout}")
+    return time.time() + timeout
+
+
+class MemoryStatusStore:
+    """
+    Process-local status store.
+
+    Only suitable for a single worker process (e.g. the Flask dev server);
+    use SQLiteStatusStore when running several gunicorn workers.
+    """
+
+    def __init__(self, ttl: int = DEFAULT_TTL):
+        self.ttl = ttl
+        self._data: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+    def _live(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry['expires_at'] <= now:
+            del self._data[key]
+            return None
+        return entry
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._live(key, time.time())
+            return dict(entry['value']) if entry else default
+
+    def get_versioned(self, key: str) -> Tuple[int, Optional[Dict[str, Any]]]:
+        """Return (version, value); version is 0 when the entry does not exist"""
+        with self._lock:
+            entry = self._live(key, time.time())
+            return (entry['version'], dict(entry['value'])) if entry else (0, None)
+
+    def wait_for_change(self, key: str, version: int, timeout: float) -> Tuple[int, Optional[Dict[str, Any]]]:
+        """
+        Block until the entry's version differs from the given one or the
+        timeout passes, then return the current (version, value).
+        """
+        deadline = _deadline(timeout)
+        with self._lock:
+            while True:
+                entry = self._live(key, time.time())
+                current = entry['version'] if entry else 0
+                remaining = deadline - time.time()
+                if current != version or remaining <= 0:
+                    return (current, dict(entry['value'])) if entry else (0, None)
+                self._changed.wait(remaining)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Tuple[int, Optional[Dict[str, Any]]]]:
+        """Return {key: (version, value)} for all keys at once; missing entries are (0, None)"""
+        with self._lock:
+            return self._snapshot(keys, time.time())
+
+    def _snapshot(self, keys: Iterable[str], now: float) -> Dict[str, Tuple[int, Optional[Dict[str, Any]]]]:
+        result = {}
+        for key in keys:
+            entry = self._live(key, now)
+            result[key] = (entry['version'], dict(entry['value'])) if entry else (0, None)
+        return result
+
+    def wait_for_any(self, versions: Dict[str, int], timeout: float) -> Dict[str, Tuple[int, Optional[Dict[str, Any]]]]:
+        """
+        Block until any of the entries' versions differs from the given
+        {key: version} or the timeout passes, then return get_many() of the keys.
+        """
+        deadline = _deadline(timeout)
+        with self._lock:
+            while True:
+                current = self._snapshot(versions, time.time())
+                remaining = deadline - time.time()
+                if remaining <= 0 or any(current[key][0] != version for key, version in versions.items()):
+                    return current
+                self._changed.wait(remaining)
+
+    def set(self, key: str, value: Dict[str, Any], ttl: Optional[int] = None):
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            version = entry['version'] + 1 if entry else 1
+            self._data[key] = {
+                'value': dict(value),
+                'version': version,
+                'updated_at': now,
+                'expires_at': now + (ttl or self.ttl)
+            }
+            self._changed.notify_all()
+
+    def update(self, key: str, fields: Dict[str, Any], ttl: Optional[int] = None) -> Dict[str, Any]:
+        """Atomically merge fields into an entry and return the new value"""
+        now = time.time()
+        with self._lock:
+            entry = self._live(key, now)
+            value = dict(entry['value']) if entry else {}
+            value.update(fields)
+            self._data[key] = {
+                'value': value,
+                'version': entry['version'] + 1 if entry else 1,
+                'updated_at': now,
+                'expires_at': now + (ttl or self.ttl)
+            }
+            self._changed.notify_all()
+            return dict(value)
+
+    def claim(self, key: str, value: Dict[str, Any], stale_after: int = 600, ttl: Optional[int] = None) -> bool:
+        """
+        Atomically create an entry unless an unfinished one already exists.
+
+        An existing entry counts as finished when it is marked complete or
+        has not been updated for stale_after seconds (its owner died).
+        Returns True if the caller now owns the entry.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._live(key, now)
+            if entry and not entry['value'].get('complete') and now - entry['updated_at'] < stale_after:
+                return False
+            self._data[key] = {
+                'value': dict(value),
+                'version': entry['version'] + 1 if entry else 1,
+                'updated_at': now,
+                'expires_at': now + (ttl or self.ttl)
+            }
+            self._changed.notify_all()
+            return True
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+            self._changed.notify_all()
+
+    def purge_expired(self) -> int:
+        """Drop expired entries, return how many were removed"""
+        now = time.time()
+        with self._lock:
+            expired = [k for k, e in self._data.items() if e['expires_at'] <= now]
+            for k in expired:
+                del self._data[k]
+            return len(expired)
+
+    def __getitem__(self, key: str) -> Dict[str, Any]:
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: Dict[str, Any]):
+        self.set(key, value)
+
+    def __delitem__(self, key: str):
+        self.delete(key)
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+
+class SQLiteStatusStore(MemoryStatusStore):
+    """
+    Status store shared by all worker processes through a SQLite database
+    in WAL mode. Reads are a single primary key lookup; writes run in an
+    IMMEDIATE transaction so read-modify-write updates are atomic across
+    processes.
+    """
+
+    # Purge expired rows on roughly one write in this many
+    PURGE_EVERY = 200
+    # Seconds between version checks while waiting for a change made by
+    # another process
+    POLL_INTERVAL = 0.25
+
+    def __init__(self, path: str, ttl: int = DEFAULT_TTL):
+        self.ttl = ttl
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread and per process; connections must not
+        # cross a fork.
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS status ('
+            ' key TEXT PRIMARY KEY,'
+            ' value TEXT NOT NULL,'
+            ' version INTEGER NOT NULL,'
+            ' updated_at REAL NOT NULL,'
+            ' expires_at REAL NOT NULL)'
+        )
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _row(self, conn: sqlite3.Connection, key: str, now: float):
+        return conn.execute(
+            'SELECT value, version, updated_at FROM status WHERE key = ? AND expires_at > ?',
+            (key, now)
+        ).fetchone()
+
+    def _write(self, conn: sqlite3.Connection, key: str, value: Dict[str, Any], version: int,
+               now: float, ttl: Optional[int]):
+        conn.execute(
+            'INSERT OR REPLACE INTO status (key, value, version, updated_at, expires_at) VALUES (?, ?, ?, ?, ?)',
+            (key, json.dumps(value), version, now, now + (ttl or self.ttl))
+        )
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            conn.execute('DELETE FROM status WHERE expires_at <= ?', (now,))
+
+    def get(self, key: str, default: Any = None) -> Any:
+        row = self._row(self._connect(), key, time.time())
+        return json.loads(row[0]) if row else default
+
+    def get_versioned(self, key: str) -> Tuple[int, Optional[Dict[str, Any]]]:
+        """Return (version, value); version is 0 when the entry does not exist"""
+        row = self._row(self._connect(), key, time.time())
+        return (row[1], json.loads(row[0])) if row else (0, None)
+
+    def wait_for_change(self, key: str, version: int, timeout: float) -> Tuple[int, Optional[Dict[str, Any]]]:
+        """
+        Block until the entry's version differs from the given one or the
+        timeout passes, then return the current (version, value).
+        """
+        conn = self._connect()
+        deadline = _deadline(timeout)
+        while True:
+            row = conn.execute(
+                'SELECT version FROM status WHERE key = ? AND expires_at > ?', (key, time.time())
+            ).fetchone()
+            current = row[0] if row else 0
+            remaining = deadline - time.time()
+            if current != version or remaining <= 0:
+                return self.get_versioned(key)
+            time.sleep(min(self.POLL_INTERVAL, remaining))
+
+    def _versions(self, conn: sqlite3.Connection, keys: Tuple[str, ...]) -> Dict[str, int]:
+        placeholders = ','.join('?' * len(keys))
+        rows = conn.execute(
+            f'SELECT key, version FROM status WHERE key IN ({placeholders}) AND expires_at > ?',
+            keys + (time.time(),)
+        ).fetchall()
+        return dict(rows)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Tuple[int, Optional[Dict[str, Any]]]]:
+        """Return {key: (version, value)} for all keys in one query; missing entries are (0, None)"""
+        keys = tuple(keys)
+        result = {key: (0, None) for key in keys}
+        if not keys:
+            return result
+        placeholders = ','.join('?' * len(keys))
+        rows = self._connect().execute(
+            f'SELECT key, value, version FROM status WHERE key IN ({placeholders}) AND expires_at > ?',
+            keys + (time.time(),)
+        ).fetchall()
+        for key, value, version in rows:
+            result[key] = (version, json.loads(value))
+        return result
+
+    def wait_for_any(self, versions: Dict[str, int], timeout: float) -> Dict[str, Tuple[int, Optional[Dict[str, Any]]]]:
+        """
+        Block until any of the entries' versions differs from the given
+        {key: version} or the timeout passes, then return get_many() of the keys.
+        Only versions are read while waiting; values are loaded once at the end.
+        """
+        conn = self._connect()
+        keys = tuple(versions)
+        deadline = _deadline(timeout)
+        while keys:
+            current = self._versions(conn, keys)
+            remaining = deadline - time.time()
+            if remaining <= 0 or any(current.get(key, 0) != version for key, version in versions.items()):
+                break
+            time.sleep(min(self.POLL_INTERVAL, remaining))
+        return self.get_many(keys)
+
+    def set(self, key: str, value: Dict[str, Any], ttl: Optional[int] = None):
+        self.update(key, value, ttl, replace=True)
+
+    def update(self, key: str, fields: Dict[str, Any], ttl: Optional[int] = None,
+               replace: bool = False) -> Dict[str, Any]:
+        """Atomically merge fields into an entry and return the new value"""
+        conn = self._connect()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT value, version, expires_at FROM status WHERE key = ?', (key,)).fetchone()
+            live = row is not None and row[2] > now
+            value = json.loads(row[0]) if live and not replace else {}
+            value.update(fields)
+            self._write(conn, key, value, row[1] + 1 if row else 1, now, ttl)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return value
+
+    def claim(self, key: str, value: Dict[str, Any], stale_after: int = 600, ttl: Optional[int] = None) -> bool:
+        """
+        Atomically create an entry unless an unfinished one already exists.
+
+        An existing entry counts as finished when it is marked complete or
+        has not been updated for stale_after seconds (its owner died).
+        Returns True if the caller now owns the entry.
+        """
+        conn = self._connect()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT value, version, updated_at, expires_at FROM status WHERE key = ?',
+                               (key,)).fetchone()
+            if row and row[3] > now and now - row[2] < stale_after and not json.loads(row[0]).get('complete'):
+                conn.execute('COMMIT')
+                return False
+            self._write(conn, key, dict(value), row[1] + 1 if row else 1, now, ttl)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return True
+
+    def delete(self, key: str):
+        self._connect().execute('DELETE FROM status WHERE key = ?', (key,))
+
+    def purge_expired(self) -> int:
+        """Drop expired entries, return how many were removed"""
+        cur = self._connect().execute('DELETE FROM status WHERE expires_at <= ?', (time.time(),))
+        return cur.rowcount
+
+
+def create_status_store(spec: Optional[str] = None, ttl: int = DEFAULT_TTL) -> MemoryStatusStore:
+    """
+    Build a status store from a spec string:
+      - 'memory'             process-local dictionary
+      - 'sqlite:///path.db'  shared SQLite database (default, in the temp dir)
+    """
+    if not spec:
+        spec = 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'webconverters-status.db')
+    if spec == 'memory':
+        return MemoryStatusStore(ttl=ttl)
+    if spec.startswith('sqlite:///'):
+        return SQLiteStatusStore(spec[len('sqlite:///'):], ttl=ttl)
+    raise ValueError(f"Unknown status store: {spec}")
@@ -0,0 +1,83 @@
+import io
+import os
+import re
+import shutil
+import subprocess
+import zipfile
+
+import pytest
+
+from benchmarks.cases import app_environment
+from convertors.remux import probe_audio
+
+pytestmark = pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='ffmpeg is not installed')
+
+
+@pytest.fixture(scope='module')
+def webapp(tmp_path_factory):
+    os.environ.update(app_environment(str(tmp_path_factory.mktemp('app'))))
+    import app as webapp
+
+    folders = [os.path.join(webapp.app.static_folder, name) for name in ('downloads', 'uploads')]
+    before = {folder: set(os.listdir(folder)) if os.path.isdir(folder) else set() for folder in folders}
+    yield webapp
+    for folder in folders:
+        if os.path.isdir(folder):
+            for name in set(os.listdir(folder)) - before[folder]:
+                path = os.path.join(folder, name)
+                if os.path.isfile(path):
+                    os.remove(path)
+
+
+@pytest.fixture(scope='module')
+def hires_mp3(tmp_path_factory):
+    """A 48 kHz MP3, so keeping the source's rate would be visible in the output"""
+    path = str(tmp_path_factory.mktemp('fixtures') / 'tone.mp3')
+    subprocess.run(['ffmpeg', '-hide_banner', '-loglevel', 'error', '-y', '-f', 'lavfi',
+                    '-i', 'sine=frequency=440:duration=1:sample_rate=48000', '-ac', '2', path], check=True)
+    return path
+
+
+def default_fields(html, prefix):
+    """The value each of a form's selects submits when left untouched (its first option)"""
+    fields = {}
+    for name, options in re.findall(r'<select id="%s(\w+)" name="\1">(.*?)</select>' % prefix, html, re.S):
+        fields[name] = re.search(r'<option value="([^"]*)"', options).group(1)
+    return fields
+
+
+def probe(tmp_path, data, name='out.wav'):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return probe_audio(str(path))
+
+
+def test_single_file_defaults_to_16bit_44k_wav(webapp, hires_mp3, tmp_path):
+    client = webapp.app.test_client()
+    fields = default_fields(client.get('/convert/to_wav').get_data(as_text=True), '')
+    assert set(fields) == {'format', 'sample_rate', 'channels', 'bit_depth', 'bitrate'}
+
+    with open(hires_mp3, 'rb') as f:
+        data = dict(fields, audio_file=(io.BytesIO(f.read()), 'tone.mp3'))
+    response = client.post('/convert/to_wav', data=data, content_type='multipart/form-data')
+    assert response.status_code == 200
+
+    info = probe(tmp_path, response.get_data())
+    assert info['codec'] == 'pcm_s16le'
+    assert info['sample_rate'] == 44100
+
+
+def test_batch_defaults_to_16bit_44k_wav(webapp, hires_mp3, tmp_path):
+    client = webapp.app.test_client()
+    fields = default_fields(client.get('/convert/to_wav').get_data(as_text=True), 'batch_')
+
+    with open(hires_mp3, 'rb') as f:
+        data = dict(fields, audio_files=[(io.BytesIO(f.read()), 'tone.mp3')])
+    response = client.post('/convert/to_wav/batch', data=data, content_type='multipart/form-data')
+    assert response.status_code == 200
+
+    with zipfile.ZipFile(io.BytesIO(response.get_data())) as archive:
+        assert archive.namelist() == ['tone.wav']
+        info = probe(tmp_path, archive.read('tone.wav'))
+    assert info['codec'] == 'pcm_s16le'
+    assert info['sample_rate'] == 44100
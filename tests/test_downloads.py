@@ -0,0 +1,125 @@
+import os
+import re
+from urllib.parse import unquote
+
+import pytest
+
+from benchmarks.cases import app_environment
+
+VIDEO_ID = 'dQw4w9WgXcQ'
+DOWNLOAD_PATH = f'/youtube/mp4/download/{VIDEO_ID}'
+CONTENT = bytes(range(256)) * 64
+
+
+@pytest.fixture(scope='module')
+def webapp(tmp_path_factory):
+    os.environ.update(app_environment(str(tmp_path_factory.mktemp('app'))))
+    import app as webapp
+    return webapp
+
+
+@pytest.fixture
+def entry(webapp, tmp_path):
+    """A cached MP4 served by the download endpoint"""
+    key = webapp.youtube_cache_key(VIDEO_ID, 'mp4', 'h264', 'best')
+    source = tmp_path / 'video.mp4'
+    source.write_bytes(CONTENT)
+    entry = webapp.result_cache.put(key, str(source), f'test_downloads_{VIDEO_ID}.mp4', 'video.mp4')
+    yield entry
+    if os.path.exists(entry['path']):
+        os.remove(entry['path'])
+
+
+@pytest.fixture
+def sendfile_mode(webapp, monkeypatch):
+    def set_mode(mode):
+        monkeypatch.setitem(webapp.app.config, 'SENDFILE_MODE', mode)
+    return set_mode
+
+
+def proxy(webapp, response, headers=None):
+    """
+    Stand-in for nginx's internal location (alias SENDFILE_PREFIX to the
+    static folder): answer an X-Accel-Redirect from disk, honouring Range.
+    Returns (status, body).
+    """
+    prefix = webapp.app.config['SENDFILE_PREFIX']
+    location = unquote(response.headers['X-Accel-Redirect'])
+    assert location.startswith(prefix)
+    with open(os.path.join(webapp.app.static_folder, location[len(prefix):]), 'rb') as f:
+        data = f.read()
+    match = re.fullmatch(r'bytes=(\d+)-(\d+)', (headers or {}).get('Range', ''))
+    if match:
+        return 206, data[int(match.group(1)):int(match.group(2)) + 1]
+    return 200, data
+
+
+def test_full_download_has_strong_etag(webapp, entry):
+    response = webapp.app.test_client().get(DOWNLOAD_PATH)
+    assert response.status_code == 200
+    assert response.get_data() == CONTENT
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert response.headers['ETag'] == f'"{webapp.cache_etag(entry)}"'
+    assert response.headers['Content-Disposition'].startswith('attachment;')
+
+
+def test_range_resumes_download(webapp, entry):
+    response = webapp.app.test_client().get(DOWNLOAD_PATH, headers={'Range': 'bytes=100-199'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes 100-199/{len(CONTENT)}'
+    assert response.get_data() == CONTENT[100:200]
+
+
+def test_if_range_with_current_etag_resumes(webapp, entry):
+    etag = f'"{webapp.cache_etag(entry)}"'
+    response = webapp.app.test_client().get(DOWNLOAD_PATH, headers={'Range': 'bytes=0-9', 'If-Range': etag})
+    assert response.status_code == 206
+    assert response.get_data() == CONTENT[:10]
+
+
+def test_if_range_with_stale_etag_sends_whole_file(webapp, entry):
+    response = webapp.app.test_client().get(DOWNLOAD_PATH, headers={'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+    assert response.status_code == 200
+    assert response.get_data() == CONTENT
+
+
+def test_if_none_match_revalidates(webapp, entry):
+    etag = f'"{webapp.cache_etag(entry)}"'
+    response = webapp.app.test_client().get(DOWNLOAD_PATH, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.get_data() == b''
+
+
+def test_etag_changes_when_file_is_replaced(webapp, entry, tmp_path):
+    replacement = tmp_path / 'replacement.mp4'
+    replacement.write_bytes(CONTENT[::-1])
+    updated = webapp.result_cache.put(entry['key'], str(replacement), os.path.basename(entry['path']), 'video.mp4')
+    assert webapp.cache_etag(updated) != webapp.cache_etag(entry)
+
+
+def test_x_accel_redirect_offloads_to_proxy(webapp, entry, sendfile_mode):
+    sendfile_mode('x-accel')
+    response = webapp.app.test_client().get(DOWNLOAD_PATH)
+    assert response.status_code == 200
+    assert response.headers['Content-Length'] == '0'
+    assert response.get_data() == b''
+    assert response.headers['ETag'] == f'"{webapp.cache_etag(entry)}"'
+
+    assert proxy(webapp, response) == (200, CONTENT)
+    assert proxy(webapp, response, {'Range': 'bytes=5-14'}) == (206, CONTENT[5:15])
+
+
+def test_x_accel_redirect_revalidates_without_proxy(webapp, entry, sendfile_mode):
+    sendfile_mode('x-accel')
+    etag = f'"{webapp.cache_etag(entry)}"'
+    response = webapp.app.test_client().get(DOWNLOAD_PATH, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+
+def test_x_sendfile_names_the_file(webapp, entry, sendfile_mode):
+    sendfile_mode('x-sendfile')
+    response = webapp.app.test_client().get(DOWNLOAD_PATH)
+    assert response.status_code == 200
+    assert response.headers['Content-Length'] == '0'
+    assert response.get_data() == b''
+    assert response.headers['X-Sendfile'] == os.path.abspath(entry['path'])
@@ -0,0 +1,31 @@
+import math
+import os
+
+import pytest
+
+from benchmarks.cases import app_environment
+
+
+@pytest.fixture(scope='module')
+def webapp(tmp_path_factory):
+    os.environ.update(app_environment(str(tmp_path_factory.mktemp('app'))))
+    import app as webapp
+    return webapp
+
+
+@pytest.mark.parametrize('wait', ['nan', 'NaN', 'inf', '-inf', 'x'])
+def test_rejects_non_finite_wait(webapp, wait):
+    response = webapp.app.test_client().get(f'/api/jobs/status?ids=yt_abc&wait={wait}')
+    assert response.status_code == 400
+
+
+def test_finite_wait_is_capped(webapp, monkeypatch):
+    monkeypatch.setitem(webapp.app.config, 'STATUS_MAX_WAIT', 0.2)
+    response = webapp.app.test_client().get('/api/jobs/status?ids=yt_abc&wait=1e9')
+    assert response.status_code == 200
+    assert response.json['changed'] == []
+
+
+def test_store_refuses_non_finite_timeout(webapp):
+    with pytest.raises(ValueError):
+        webapp.conversion_status.wait_for_any({'yt_abc': 0}, math.nan)
@@ -0,0 +1,74 @@
+import glob
+import os
+
+import pytest
+
+from werkzeug.test import EnvironBuilder
+
+from benchmarks.cases import app_environment
+from benchmarks.standin import StandInServer
+
+MEDIA = os.urandom(1024 * 1024)
+
+
+@pytest.fixture(scope='module')
+def webapp(tmp_path_factory):
+    os.environ.update(app_environment(str(tmp_path_factory.mktemp('app'))))
+    import app as webapp
+    return webapp
+
+
+@pytest.fixture(scope='module')
+def server(tmp_path_factory):
+    media_dir = tmp_path_factory.mktemp('media')
+    (media_dir / 'sound.mp3').write_bytes(MEDIA)
+    with StandInServer(str(media_dir), 'sound.mp3') as server:
+        yield server
+
+
+@pytest.fixture
+def partial_files(webapp):
+    """Partial TikTok downloads in static/downloads, checked to be gone after the test"""
+    pattern = os.path.join(webapp.app.static_folder, 'downloads', 'tiktok_*.part')
+    yield lambda: glob.glob(pattern)
+    for path in glob.glob(pattern):
+        os.remove(path)
+
+
+@pytest.fixture
+def url(webapp, server, request):
+    # A new page per test, so no result is cached from an earlier one
+    url = server.tiktok_url(request.node.name)
+    yield url
+    entry = webapp.result_cache.get(webapp.tiktok_cache_key(url), count=False)
+    if entry is not None:
+        os.remove(entry['path'])
+
+
+def test_complete_stream_is_cached(webapp, url, partial_files):
+    response = webapp.app.test_client().post('/tiktok/mp3', data={'url': url})
+    assert response.status_code == 200
+    assert response.get_data() == MEDIA
+    response.close()
+    assert webapp.result_cache.get(webapp.tiktok_cache_key(url), count=False) is not None
+    assert partial_files() == []
+
+
+def test_closing_before_reading_removes_partial_file(webapp, url, partial_files):
+    # The test client always reads the first chunk, so drive the WSGI app directly
+    environ = EnvironBuilder(path='/tiktok/mp3', method='POST', data={'url': url}).get_environ()
+    statuses = []
+    body = webapp.app(environ, lambda status, headers, exc_info=None: statuses.append(status))
+    assert statuses == ['200 OK']
+    assert len(partial_files()) == 1
+    body.close()
+    assert partial_files() == []
+    assert webapp.result_cache.get(webapp.tiktok_cache_key(url), count=False) is None
+
+
+def test_closing_mid_stream_removes_partial_file(webapp, url, partial_files):
+    response = webapp.app.test_client().post('/tiktok/mp3', data={'url': url}, buffered=False)
+    next(iter(response.response))
+    response.close()
+    assert partial_files() == []
+    assert webapp.result_cache.get(webapp.tiktok_cache_key(url), count=False) is None
@@ -0,0 +1,59 @@
+import os
+
+import pytest
+
+from benchmarks.cases import app_environment
+
+VIDEO_ID = 'dQw4w9WgXcQ'
+URL = f'https://www.youtube.com/watch?v={VIDEO_ID}'
+
+
+@pytest.fixture(scope='module')
+def webapp(tmp_path_factory):
+    os.environ.update(app_environment(str(tmp_path_factory.mktemp('app'))))
+    import app as webapp
+    return webapp
+
+
+@pytest.fixture
+def offline(webapp, monkeypatch):
+    """Fail the test if a request tries to probe YouTube, reserve disk or queue a job"""
+    def unexpected(*args, **kwargs):
+        raise AssertionError('cache hits must not probe, admit or queue')
+    monkeypatch.setattr(webapp, 'youtube_projected_bytes', unexpected)
+    monkeypatch.setattr(webapp, 'video_length_error', unexpected)
+    monkeypatch.setattr(webapp.admission, 'admit', unexpected)
+    monkeypatch.setattr(webapp.scheduler, 'submit', unexpected)
+
+
+@pytest.fixture
+def cached(webapp, tmp_path):
+    """Put a file in the result cache under key, removing it afterwards"""
+    keys = []
+
+    def put(key, filename):
+        source = tmp_path / filename
+        source.write_bytes(b'\0' * 16)
+        webapp.result_cache.put(key, str(source), filename, filename)
+        keys.append(key)
+    yield put
+    for key in keys:
+        entry = webapp.result_cache.get(key, count=False)
+        if entry is not None and os.path.exists(entry['path']):
+            os.remove(entry['path'])
+
+
+@pytest.mark.parametrize('audio_format', ['mp3', 'm4a'])
+def test_cached_audio_skips_admission(webapp, offline, cached, audio_format):
+    cached(webapp.audio_cache_key(VIDEO_ID, audio_format), f'test_cache_hit_{VIDEO_ID}.{audio_format}')
+    response = webapp.app.test_client().post('/youtube/mp3', data={'url': URL, 'format': audio_format})
+    assert response.status_code == 302
+    status = webapp.conversion_status.get(webapp.audio_status_key(VIDEO_ID, audio_format))
+    assert status['complete'] is True
+
+
+def test_cached_mp4_skips_admission(webapp, offline, cached):
+    cached(webapp.youtube_cache_key(VIDEO_ID, 'mp4', 'h264', 'best'), f'test_cache_hit_{VIDEO_ID}.mp4')
+    response = webapp.app.test_client().post('/youtube/mp4', data={'url': URL})
+    assert response.status_code == 302
+    assert webapp.conversion_status.get(webapp.mp4_status_key(VIDEO_ID))['complete'] is True
@@ -0,0 +1,34 @@
+from convertors.ytdl import summarize_info
+
+
+def video_format(format_id, vcodec, filesize):
+    return {'format_id': format_id, 'ext': 'mp4', 'vcodec': vcodec, 'acodec': 'none',
+            'url': f'https://media.example/{format_id}', 'protocol': 'https', 'filesize': filesize}
+
+
+def info(*formats):
+    return {
+        'id': 'dQw4w9WgXcQ', 'title': 'Video', 'duration': 60, 'extractor': 'youtube',
+        'extractor_key': 'Youtube', 'webpage_url': 'https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+        'formats': list(formats),
+    }
+
+
+AUDIO = {'format_id': '140', 'ext': 'm4a', 'vcodec': 'none', 'acodec': 'mp4a.40.2',
+         'url': 'https://media.example/140', 'protocol': 'https', 'filesize': 1_000}
+
+
+def test_mp4_estimate_follows_h264_preference():
+    # yt-dlp sorts formats worst to best, so the AV1 stream ranks above H.264
+    summary = summarize_info(info(AUDIO, video_format('137', 'avc1.640028', 20_000),
+                                  video_format('399', 'av01.0.08M.08', 50_000)))
+    assert summary['estimated_bytes']['mp4'] == 21_000
+
+
+def test_mp4_estimate_without_h264():
+    summary = summarize_info(info(AUDIO, video_format('399', 'av01.0.08M.08', 50_000)))
+    assert summary['estimated_bytes']['mp4'] == 51_000
+
+
+def test_mp4_estimate_without_formats():
+    assert summarize_info(info())['estimated_bytes']['mp4'] is None